@@ -0,0 +1,175 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A writer for audit log entities (UserActionLog and ApiActionLog).
+
+During a request, entries added with add() are kept in a per-request buffer
+and written together with one db.put_async() when the request ends, so the
+request doesn't wait on a datastore write for each entry.  If the request is
+too close to its deadline to write them, or the write fails, the entries are
+handed to the write_action_logs task instead.  Entries added outside of a
+request (e.g. from tools or tests) are written right away.
+"""
+
+import base64
+import logging
+import threading
+import time
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import db
+import simplejson
+
+# The number of seconds a request has before its deadline.
+REQUEST_DEADLINE_SECONDS = 60
+TASK_DEADLINE_SECONDS = 600
+
+# If less than this many seconds are left when the request ends, the entries
+# are sent to the task queue rather than written by the request.
+FLUSH_MARGIN_SECONDS = 5
+
+WRITE_TASK_URL = '/global/tasks/write_action_logs'
+WRITE_TASK_QUEUE_NAME = 'action-log'
+
+# The most entries, and the most payload bytes, to send in one task.  Entries
+# copy all the properties of a person or note, so the byte limit keeps each
+# payload under the 100 KB limit on the size of a task.
+ENTRIES_PER_TASK = 20
+MAX_TASK_PAYLOAD_BYTES = 90 * 1024
+
+# The only kinds that the write_action_logs task will write.
+WRITABLE_KINDS = ['UserActionLog', 'ApiActionLog']
+
+_request = threading.local()
+
+
+def begin_request(deadline_seconds=REQUEST_DEADLINE_SECONDS):
+    """Starts buffering entries for the current request."""
+    _request.entries = []
+    _request.deadline = time.time() + deadline_seconds
+
+
+def add(entry):
+    """Adds an entry to be written when the current request ends, or writes
+    it right away if there is no current request."""
+    entries = getattr(_request, 'entries', None)
+    if entries is None:
+        entry.put()
+    else:
+        entries.append(entry)
+
+
+def end_request():
+    """Writes the entries of the current request and stops buffering."""
+    entries = getattr(_request, 'entries', None)
+    _request.entries = None
+    if not entries:
+        return
+    if _request.deadline - time.time() < FLUSH_MARGIN_SECONDS:
+        write_in_task(entries)
+        return
+    try:
+        db.put_async(entries).get_result()
+    except Exception as e:
+        logging.warning('Failed to write %d action logs: %s' % (
+            len(entries), e))
+        write_in_task(entries)
+
+
+def encode(entry):
+    return base64.b64encode(db.model_to_protobuf(entry).Encode())
+
+
+def serialize(entries):
+    return simplejson.dumps([encode(entry) for entry in entries])
+
+
+def deserialize(payload):
+    """Decodes a payload made by serialize().  Raises ValueError if it holds
+    any entity of a kind other than WRITABLE_KINDS."""
+    entries = [db.model_from_protobuf(base64.b64decode(encoded))
+               for encoded in simplejson.loads(payload)]
+    for entry in entries:
+        if entry.kind() not in WRITABLE_KINDS:
+            raise ValueError('Not an action log kind: %s' % entry.kind())
+    return entries
+
+
+def describe(entries):
+    """Describes the entries for the logs by what they were about, without
+    any of the copied property values, which can hold personal data."""
+    return ', '.join(
+        '%s %s %s %s' % (entry.kind(), entry.repo, entry.action,
+                         getattr(entry, 'entity_key_name', ''))
+        for entry in entries)
+
+
+def make_payloads(entries):
+    """Splits the entries into task payloads of at most ENTRIES_PER_TASK
+    entries and MAX_TASK_PAYLOAD_BYTES bytes.  Returns the payloads, the
+    entries in them, and the entries too big to fit in any payload."""
+    payloads, sent, too_big = [], [], []
+    batch, batch_bytes = [], 0
+    for entry in entries:
+        encoded = encode(entry)
+        # Each entry adds its quotes and separator to the JSON list.
+        size = len(encoded) + 4
+        if size + 2 > MAX_TASK_PAYLOAD_BYTES:
+            too_big.append(entry)
+            continue
+        if batch and (len(batch) == ENTRIES_PER_TASK or
+                      batch_bytes + size + 2 > MAX_TASK_PAYLOAD_BYTES):
+            payloads.append(simplejson.dumps(batch))
+            batch, batch_bytes = [], 0
+        batch.append(encoded)
+        batch_bytes += size
+        sent.append(entry)
+    if batch:
+        payloads.append(simplejson.dumps(batch))
+    return payloads, sent, too_big
+
+
+def write_in_task(entries):
+    """Adds tasks that write the entries.  Entries that can't be sent are
+    logged by their keys, so they are never lost without a trace."""
+    payloads, sent, too_big = make_payloads(entries)
+    if too_big:
+        logging.error('Dropped %d action logs too big for a task: %s' % (
+            len(too_big), describe(too_big)))
+    if not payloads:
+        return
+    try:
+        taskqueue.Queue(WRITE_TASK_QUEUE_NAME).add(
+            [taskqueue.Task(url=WRITE_TASK_URL, payload=payload)
+             for payload in payloads])
+    except Exception as e:
+        logging.error('Failed to write %d action logs: %s: %s' % (
+            len(sent), e, describe(sent)))
+
+
+class ActionLogMiddleware(object):
+    """Django middleware that buffers the entries of each request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.META.get('HTTP_X_APPENGINE_TASKNAME'):
+            begin_request(TASK_DEADLINE_SECONDS)
+        else:
+            begin_request()
+        try:
+            return self.get_response(request)
+        finally:
+            end_request()
@@ -35,7 +35,6 @@ import django.utils.html
 from django.utils import translation
 from django.utils.translation import ugettext as _
 from google.appengine import runtime
-from google.appengine.ext import db
 from google.appengine.api import images
 from unidecode import unidecode
 
@@ -536,7 +535,8 @@ class Search(BaseApiHandler):
                 results = [person]
         elif query_string:
             searcher = Searcher(
-                self.repo, config.get('enable_fulltext_search'), max_results)
+                self.repo, config.get('enable_fulltext_search'), max_results,
+                use_cache=True)
             results = searcher.search(query_string)
         else:
             self.info(
@@ -548,9 +548,10 @@ class Search(BaseApiHandler):
         utils.optionally_filter_sensitive_fields(records, self.auth)
 
         # Define the function to retrieve notes for a person.
+        notes_by_person = model.Note.get_by_person_record_ids(
+            self.repo, [result.record_id for result in results])
         def get_notes_for_person(person):
-            notes = model.Note.get_by_person_record_id(
-                self.repo, person['person_record_id'])
+            notes = notes_by_person.get(person['person_record_id'], [])
             notes = [note for note in notes if not note.hidden]
             records = map(pfif_version.note_to_dict, notes)
             utils.optionally_filter_sensitive_fields(records, self.auth)
@@ -775,11 +776,10 @@ class HandleSMS(BaseApiHandler):
                 author_made_contact=True,
                 status='is_note_author',
                 text=message_text)
-            db.put(note)
-            model.UserActionLog.put_new('add', note, copy_properties=False)
+            # The new Person is counted with its Note when it's stored.
+            note.put_new()
             person.update_from_note(note)
-            db.put(person)
-            model.UserActionLog.put_new('add', person, copy_properties=False)
+            person.put_new(notes=[note])
             # Translators: An SMS message sent to a user when the user
             # successfully added a record for the given person.
             responses.append(_('Added a record for: %(person_name)s')
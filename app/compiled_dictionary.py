@@ -0,0 +1,232 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Dictionaries compiled from the tab-separated text dictionary files.
+
+The text files (e.g. japanese_name_location_dict.txt) are the source of
+truth.  tools/compile_dictionaries compiles each of them into a file with the
+same name plus COMPILED_SUFFIX, holding the entries sorted by their UTF-8 key
+so that a word can be found by binary search.  The compiled file is memory
+mapped and nothing is parsed until a word is looked up, so loading it costs
+next to nothing at instance start.  The compiled files are checked in next
+to the text files, so they are deployed with the app; tests/
+test_compiled_dictionary.py fails if one is out of date.
+
+Compiled file format (integers are little-endian uint32):
+  MAGIC
+  SHA-1 digest of the text file it was compiled from (20 bytes)
+  number of entries
+  offset of each entry, relative to the start of the entries
+  entries, each: key '\\t' value ['\\t' value ...] '\\n', in UTF-8
+"""
+
+import bisect
+import collections
+import hashlib
+import logging
+import os
+import struct
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+COMPILED_SUFFIX = '.compiled'
+MAGIC = b'PFDICT02'
+_UINT32 = struct.Struct('<I')
+_HEADER = struct.Struct('<20sI')
+
+
+def read_entries(file_name):
+    """Reads a text dictionary file.
+
+    Args:
+        file_name: file name.  format: key '\\t' value, one entry per line;
+                   blank lines and lines starting with '#' are skipped.
+    Returns:
+        An OrderedDict of each key to the list of its distinct values, in the
+        order they appear in the file.
+    """
+    entries = collections.OrderedDict()
+    with open(file_name, 'rb') as f:
+        for line in f:
+            if not line.strip() or line.strip()[:1] == b'#':
+                continue
+            key, value = line.rstrip(b'\n').split(b'\t')
+            values = entries.setdefault(key.decode('utf-8'), [])
+            value = value.decode('utf-8')
+            if value not in values:
+                values.append(value)
+    return entries
+
+
+def get_digest(file_name):
+    """Returns the SHA-1 digest of the content of a file."""
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def compile_file(file_name):
+    """Compiles a text dictionary file into file_name + COMPILED_SUFFIX."""
+    entries = sorted((key.encode('utf-8'), values)
+                     for key, values in read_entries(file_name).items())
+    offsets = []
+    records = []
+    offset = 0
+    for key, values in entries:
+        record = b'\t'.join([key] + [value.encode('utf-8')
+                                     for value in values]) + b'\n'
+        offsets.append(offset)
+        records.append(record)
+        offset += len(record)
+    with open(file_name + COMPILED_SUFFIX, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER.pack(get_digest(file_name), len(entries)))
+        f.write(b''.join(_UINT32.pack(offset) for offset in offsets))
+        f.write(b''.join(records))
+
+
+class _Keys(object):
+    """A read-only sequence of the keys of a compiled dictionary, in the
+    form bisect can search."""
+
+    def __init__(self, dictionary):
+        self._dictionary = dictionary
+
+    def __len__(self):
+        return self._dictionary.count
+
+    def __getitem__(self, index):
+        start = self._dictionary.get_record_start(index)
+        return self._dictionary.data[
+            start:self._dictionary.data.find(b'\t', start)]
+
+
+class CompiledDictionary(object):
+    """A read-only dictionary from unicode keys to sets of unicode values,
+    read from a compiled dictionary file."""
+
+    def __init__(self, data):
+        """Args:
+          data: the content of a compiled dictionary file, as a string or a
+              memory-mapped file.
+        """
+        self.data = data
+        self.count = _HEADER.unpack_from(data, len(MAGIC))[1]
+        self._offsets_start = len(MAGIC) + _HEADER.size
+        self._records_start = self._offsets_start + self.count * _UINT32.size
+        self._keys = _Keys(self)
+
+    def get_record_start(self, index):
+        return self._records_start + _UINT32.unpack_from(
+            self.data, self._offsets_start + index * _UINT32.size)[0]
+
+    def _find(self, key):
+        """Returns the values of the key as a list of UTF-8 strings, or None
+        if the key isn't in the dictionary."""
+        key = key.encode('utf-8')
+        index = bisect.bisect_left(self._keys, key)
+        if index == self.count or self._keys[index] != key:
+            return None
+        start = self.get_record_start(index)
+        record = self.data[start:self.data.find(b'\n', start)]
+        return record.split(b'\t')[1:]
+
+    def get(self, key, default=None):
+        values = self._find(key)
+        if values is None:
+            return default
+        return set(value.decode('utf-8') for value in values)
+
+    def __getitem__(self, key):
+        values = self.get(key)
+        if values is None:
+            raise KeyError(key)
+        return values
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self.count
+
+
+def open_compiled(file_name):
+    """Opens the compiled form of a text dictionary file.
+
+    Returns:
+        A CompiledDictionary, or None if the compiled file is missing or was
+        not compiled from the current text file.
+    """
+    compiled_file_name = file_name + COMPILED_SUFFIX
+    if not os.path.exists(compiled_file_name):
+        logging.warning('%s is missing; run tools/compile_dictionaries' %
+                        compiled_file_name)
+        return None
+    with open(compiled_file_name, 'rb') as f:
+        if mmap:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        logging.warning('%s is not a compiled dictionary' % compiled_file_name)
+        return None
+    # The size or modification time of the text file could stay the same
+    # after an edit, or change without one, so its content is compared.
+    source_digest = _HEADER.unpack_from(data, len(MAGIC))[0]
+    if (os.path.exists(file_name) and
+            get_digest(file_name) != source_digest):
+        logging.warning('%s is out of date; run tools/compile_dictionaries' %
+                        compiled_file_name)
+        return None
+    return CompiledDictionary(data)
+
+
+class LazyDictionary(object):
+    """A read-only dictionary that loads a dictionary file the first time it's
+    used: the compiled form if it's available and up to date, or else the
+    text file, through the given read function."""
+
+    def __init__(self, file_name, read_text_file):
+        """Args:
+          file_name: the name of the text dictionary file.
+          read_text_file: a function that reads the text file into a
+              dictionary of sets, or returns None if it can't be read.
+        """
+        self._file_name = file_name
+        self._read_text_file = read_text_file
+        self._dictionary = None
+
+    def load(self):
+        """Loads the dictionary if it isn't loaded yet, and returns it."""
+        if self._dictionary is None:
+            self._dictionary = (open_compiled(self._file_name) or
+                                self._read_text_file(self._file_name) or {})
+        return self._dictionary
+
+    def get(self, key, default=None):
+        return self.load().get(key, default)
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __contains__(self, key):
+        return key in self.load()
+
+    def __len__(self):
+        return len(self.load())
@@ -19,102 +19,125 @@ See here for usage examples:
 https://github.com/google/personfinder/wiki/DeveloperFaq
 """
 
+import time
+
+from google.appengine.api import memcache
 from google.appengine.ext import db
 import UserDict, model, random, simplejson
-import logging
-import datetime
-import utils
-from datetime import timedelta
+import lru_cache
+import repo_directory
+
+
+# The memcache namespace of the version stamps of each repository's settings.
+VERSION_NAMESPACE = 'config.version'
+
+# The number of repositories whose settings are kept on each instance.
+CACHE_SIZE = 200
+
+# How long a repository's settings are kept on an instance even if its
+# version stamp doesn't change.  The settings are loaded with an eventually
+# consistent query, which may miss a write made just before it, and this
+# limits how long such stale settings can be used.
+CACHE_SECONDS = 60
 
 
 class ConfigurationCache:
-    """This class implements an in-memory cache used to store the config
-    entries. Cache entries have a default lifetime of 600 seconds. When
-    fetching a config entry, the cache is first searched. If the entry is
-    not available in cache it is retrieved from database, added to cache and
-    returned. Cache is enabled by setting a config entry *:config_cache_enable.
-    Config entries are stored with the key repo:entry_name in database.
-    This cache uses the repo as the key and stores all configs for a
-    repository in one cache element. The global configs have repo='*'."""
-    storage = {}
-    expiry_time = 600
-    miss_count = 0
-    hit_count = 0
-    evict_count = 0
-    items_count = 0
-    max_items = 0
+    """A per-instance cache of the decoded settings of each repository, with
+    the global settings under the repo '*'.
+
+    Each repository has a version stamp in memcache, shared by all instances,
+    which set() bumps after every write.  A cached repository is used only
+    while its stamp is unchanged, so a write on any instance is seen by all
+    the others on their next request, and a steady-state request costs one
+    memcache get instead of datastore queries.  If a stamp is evicted from
+    memcache, it restarts from a new random value, which no cached repository
+    can have.  Settings are also reloaded every CACHE_SECONDS, in case the
+    query that loaded them didn't yet see the latest write."""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.repos = lru_cache.LruCache(max_size)
+        self.hit_count = 0
+        self.miss_count = 0
+        # The misses for which the repository was cached, but with an
+        # outdated version stamp.
+        self.stale_count = 0
 
     def flush(self):
-        self.storage.clear()
-        self.items_count=0
-
-    def delete(self,key):
-        """Deletes the entry with given key from config_cache."""
-        if key in self.storage:
-            self.storage.pop(key)
-            self.items_count -= 1
-
-    def add(self, key, value, time_to_live_in_seconds):
-        """Adds the key/value pair to cache and updates the expiry time.
-           If key already exists, its value and expiry are updated."""
-        expiry = utils.get_utcnow() + timedelta(seconds=time_to_live_in_seconds)
-        self.storage[key] = (value, expiry)
-        self.items_count += 1
-        self.max_items += 1
-
-    def read(self, key, default=None):
-        """Gets the value corresponding to the key from cache. If cache entry
-           has expired, it is deleted from the cache and None is returned."""
-        value, expiry = self.storage.get(key, (None, 0))
-        if value is None :
+        """Drops all the repositories cached on this instance."""
+        self.repos.clear()
+
+    def delete(self, repo):
+        """Drops a repository cached on this instance."""
+        self.repos.delete(repo)
+
+    def get_versions(self, repos):
+        """Gets the current version stamps of some repositories as a
+        dictionary, which omits the repositories whose stamps can't be read
+        from memcache."""
+        versions = memcache.get_multi(repos, namespace=VERSION_NAMESPACE)
+        missing = [repo for repo in repos if repo not in versions]
+        if missing:
+            memcache.add_multi(
+                dict((repo, random.getrandbits(62)) for repo in missing),
+                namespace=VERSION_NAMESPACE)
+            versions.update(
+                memcache.get_multi(missing, namespace=VERSION_NAMESPACE))
+        return versions
+
+    def invalidate(self, repo):
+        """Bumps the version stamp of a repository, so that every instance
+        reloads its settings.  Call this after writing its ConfigEntry
+        entities."""
+        self.delete(repo)
+        if memcache.incr(repo, namespace=VERSION_NAMESPACE) is None:
+            self.get_versions([repo])
+
+    def get_entries_multi(self, repos):
+        """Gets the settings of some repositories.
+
+        Returns:
+            A dictionary of each repository to a dictionary of its settings,
+            which must not be modified.
+        """
+        versions = self.get_versions(repos)
+        now = time.time()
+        result = {}
+        for repo in repos:
+            version = versions.get(repo)
+            cached = self.repos.get(repo)
+            if cached and cached[2] > now:
+                if version is not None and cached[0] == version:
+                    result[repo] = cached[1]
+                    self.hit_count += 1
+                    continue
+                self.stale_count += 1
             self.miss_count += 1
-            return default
+            entries = model.filter_by_prefix(ConfigEntry.all(), repo + ':')
+            result[repo] = dict(
+                (entry.key().name().split(':', 1)[1],
+                 simplejson.loads(entry.value)) for entry in entries)
+            # The version was read before the query, so if a write happens in
+            # between, these entries are simply never used.
+            if version is not None:
+                self.repos.put(
+                    repo, (version, result[repo], now + CACHE_SECONDS))
+        return result
+
+    def get_entries(self, repo):
+        """Gets the settings of a repository as a dictionary, which must not
+        be modified."""
+        return self.get_entries_multi([repo])[repo]
 
-        now = utils.get_utcnow()
-        if (expiry > now) :
-            self.hit_count += 1
-            return value
-        else:
-            # Stale cache entry. Evicting from cache
-            self.delete(key)
-            self.evict_count += 1
-            self.miss_count += 1
-            return default
+    def get_config(self, repo, name, default=None):
+        return self.get_entries(repo).get(name, default)
 
     def stats(self):
-        logging.info("Hit Count - %r" % self.hit_count)
-        logging.info("Miss Count - %r" % self.miss_count)
-        logging.info("Items Count - %r" % self.items_count)
-        logging.info("Eviction Count - %r" % self.evict_count)
-        logging.info("Max Items - %r" % self.max_items)
-
-    def get_config(self, repo, name, default=None):
-        """Looks for data in cache. If not present, retrieves from
-           database, stores it in cache and returns the required value."""
-        config_dict = self.read(repo, None)
-        if config_dict is None:
-            # Cache miss
-            entries = model.filter_by_prefix(ConfigEntry.all(), repo + ':')
-            if entries is None:
-                return default
-            logging.debug("Adding repository %r to config_cache" % repo)
-            config_dict = dict([(e.key().name().split(':', 1)[1],
-                         simplejson.loads(e.value)) for e in entries])
-            self.add(repo, config_dict, self.expiry_time)
-
-        if name in config_dict:
-            return config_dict[name]
-        return default
-
-    def enable(self, value):
-        """Enable/disable caching of config."""
-        logging.info('Setting config_cache_enable to %s' % value)
-        db.put(ConfigEntry(key_name="*:config_cache_enable",
-                           value=simplejson.dumps(bool(value))))
-        self.delete('*')
-
-    def is_enabled(self):
-        return self.get_config('*', 'config_cache_enable', None)
+        """Returns a dictionary of the size and the hit, miss, stale and
+        eviction counts of this instance's cache."""
+        stats = self.repos.stats()
+        stats.update(hits=self.hit_count, misses=self.miss_count,
+                     stale=self.stale_count)
+        return stats
 
 cache = ConfigurationCache()
 
@@ -129,14 +152,8 @@ class ConfigEntry(db.Model):
 # config entries when they're initialized, so they don't need to make an
 # additional Datastore query.
 def get(name, default=None, repo='*'):
-    """Gets a configuration setting from cache if it is enabled,
-       otherwise from the database."""
-    if cache.is_enabled():
-        return cache.get_config(repo, name, default)
-    entry = ConfigEntry.get_by_key_name(repo + ':' + name)
-    if entry:
-        return simplejson.loads(entry.value)
-    return default
+    """Gets a configuration setting, through the cache."""
+    return cache.get_config(repo, name, default)
 
 def set(repo='*', **kwargs):
     """Sets configuration settings."""
@@ -146,7 +163,8 @@ def set(repo='*', **kwargs):
             'config "launched" instead.')
     db.put(ConfigEntry(key_name=repo + ':' + name,
            value=simplejson.dumps(value)) for name, value in kwargs.items())
-    cache.delete(repo)
+    cache.invalidate(repo)
+    repo_directory.invalidate()
 
 # If calling from code where a Configuration object is available (e.g., from
 # within a handler), prefer Configuration.get. Configuration objects get all
@@ -168,20 +186,22 @@ def set_for_repo(repo, **kwargs):
 
 
 class Configuration(UserDict.DictMixin):
-    def __init__(self, repo, include_global=True):
+    def __init__(self, repo, include_global=True, entries=None):
         self.repo = repo
-        # We fetch all the config entries at once here, so that we don't have to
-        # make many Datastore queries for each individual entry later.
-        db_entries = model.filter_by_prefix(
-            ConfigEntry.all(), self.repo + ':')
-        self.entries = {
-            entry.key().name().split(':', 1)[1]: simplejson.loads(entry.value)
-            for entry in db_entries
-        }
-        if include_global:
-            self.global_config = None if repo == '*' else Configuration('*')
-        else:
-            self.global_config = None
+        self.global_config = None
+        if entries is not None:
+            self.entries = entries
+            return
+        # We get all the config entries at once here (along with the global
+        # ones, in one cache lookup), so that we don't have to look up each
+        # individual entry later.
+        repos = [repo]
+        if include_global and repo != '*':
+            repos.append('*')
+        repo_entries = cache.get_entries_multi(repos)
+        self.entries = repo_entries[repo]
+        if '*' in repos[1:]:
+            self.global_config = Configuration('*', entries=repo_entries['*'])
 
     def __nonzero__(self):
         return True
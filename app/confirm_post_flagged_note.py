@@ -133,6 +133,11 @@ class Handler(utils.BaseHandler):
             model.UserActionLog.put_new(
                     'mark_alive', note_confirmed, person.primary_full_name)
 
+        # The confirmed copy is counted like a new Note, against the Person
+        # as it was before being updated from it.
+        count_changes = note_confirmed.get_live_count_changes(
+            person, person and person.get_notes())
+
         # Update the Person based on the Note.
         if person:
             person.update_from_note(note_confirmed)
@@ -143,3 +148,5 @@ class Handler(utils.BaseHandler):
 
         # Write one or both entities to the store.
         db.put(entities_to_put)
+        model.DirtyPerson.mark(self.repo, [note_confirmed.person_record_id])
+        model.LiveCounter.add_changes_multi(self.repo, count_changes)
@@ -17,6 +17,7 @@ import photo
 from utils import *
 from detect_spam import SpamDetector
 from recaptcha.client import captcha
+from search import result_cache
 import subscribe
 import simplejson
 
@@ -247,6 +248,7 @@ def create_person(
                 validate_data=False)
         except FlaggedNoteException as e:
             db.put(person)
+            result_cache.invalidate(repo)
             UserActionLog.put_new('add', person, copy_properties=False)
             # When the note is detected as spam, we do not update person
             # record with this note or log action. We ask the note author
@@ -262,7 +264,7 @@ def create_person(
                 user_ip_address)
 
     # Write the person record to datastore
-    person.put_new()
+    person.put_new(notes=add_note and [note] or [])
 
     # TODO(ryok): we could do this earlier so we don't neet to db.put twice.
     if not person.source_url and not clone:
@@ -367,7 +369,11 @@ def create_note(
         text=text,
         photo=note_photo,
         photo_url=note_photo_url)
-    note.put_new()
+    # A Person that isn't stored yet is counted with its Notes when it is.
+    if person.is_saved():
+        note.put_new(person=person, notes=person.get_notes())
+    else:
+        note.put_new()
     # Specially log notes that make a person dead or switch to an alive status.
     if status == 'believed_dead':
         UserActionLog.put_new(
@@ -0,0 +1,130 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A per-request identity map for datastore gets by key.
+
+A single request often gets the same entities several times (e.g. the Repo
+entity is loaded by main.setup_env, by utils.BaseHandler and again by the
+view).  During a request, get() remembers every entity it fetched, including
+the ones that don't exist, and returns the same entity when it's asked for the
+same key again instead of going back to the datastore.  Any datastore put or
+delete made during the request clears the map, so a get never returns an
+entity older than the request's own writes.  Outside of a request, and inside
+transactions, get() is just db.get().
+
+The number of keys asked for and of datastore gets saved are counted for each
+request and logged when the request ends.
+"""
+
+import logging
+import threading
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.ext import db
+
+# Calls to the datastore service that modify entities.
+WRITE_CALLS = frozenset(['Put', 'Delete', 'Commit'])
+
+# Long-running tasks can get many entities; past this many, the map stops
+# growing so that the memory it uses stays bounded.
+MAX_ENTITIES = 1000
+
+_request = threading.local()
+
+# The API proxy on which the invalidation hook has been installed.
+_hooked_apiproxy = None
+
+
+def _invalidate_on_write(service, call, request, response):
+    if call in WRITE_CALLS:
+        entities = getattr(_request, 'entities', None)
+        if entities:
+            entities.clear()
+
+
+def _install_hook():
+    """Installs the hook that clears the map on datastore writes, once per
+    API proxy (tests replace the API proxy when they activate a testbed)."""
+    global _hooked_apiproxy
+    apiproxy = apiproxy_stub_map.apiproxy
+    if apiproxy is not _hooked_apiproxy:
+        apiproxy.GetPreCallHooks().Append(
+            'entity_cache', _invalidate_on_write, 'datastore_v3')
+        _hooked_apiproxy = apiproxy
+
+
+def begin_request():
+    """Starts an empty identity map for the current request."""
+    _install_hook()
+    _request.entities = {}
+    _request.stats = {'gets': 0, 'saved': 0}
+
+
+def end_request():
+    """Logs the counts of the current request and drops its map."""
+    stats = get_stats()
+    _request.entities = None
+    if stats and stats['saved']:
+        logging.info('Entity cache: %(saved)d of %(gets)d gets saved' % stats)
+
+
+def get_stats():
+    """Returns a dictionary with the number of keys asked for ('gets') and of
+    datastore gets saved ('saved') in the current request, or None if there
+    is no current request."""
+    if getattr(_request, 'entities', None) is None:
+        return None
+    return dict(_request.stats)
+
+
+def get(keys):
+    """Gets entities by key, like db.get(), through the current request's
+    identity map.
+
+    Args:
+        keys: a db.Key or a list of db.Keys.
+    Returns:
+        The entity (or None) for a single key, or a list of them for a list.
+    """
+    entities = getattr(_request, 'entities', None)
+    if entities is None or db.is_in_transaction():
+        return db.get(keys)
+    multiple = isinstance(keys, (list, tuple))
+    if not multiple:
+        keys = [keys]
+    missing = [key for key in keys if key not in entities]
+    _request.stats['gets'] += len(keys)
+    _request.stats['saved'] += len(keys) - len(missing)
+    fetched = dict(zip(missing, db.get(missing))) if missing else {}
+    if len(entities) + len(fetched) <= MAX_ENTITIES:
+        entities.update(fetched)
+    results = [fetched[key] if key in fetched else entities[key]
+               for key in keys]
+    if multiple:
+        return results
+    return results[0]
+
+
+class EntityCacheMiddleware(object):
+    """Django middleware that gives each request its own identity map."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        begin_request()
+        try:
+            return self.get_response(request)
+        finally:
+            end_request()
@@ -67,9 +67,10 @@ class Person(BaseFeedsHandler):
 
         # We use a member because a var can't be modified inside the closure.
         self.num_notes = 0
+        # The notes of all the persons are fetched at once, below.
+        notes_by_person = {}
         def get_notes_for_person(person):
-            notes = model.Note.get_by_person_record_id(
-                self.repo, person['person_record_id'])
+            notes = notes_by_person.get(person['person_record_id'], [])
             # Show hidden notes as blank in the Person feed (melwitt)
             # https://web.archive.org/web/20111228161607/http://code.google.com/p/googlepersonfinder/issues/detail?id=58
             make_hidden_notes_blank(notes)
@@ -96,6 +97,9 @@ class Person(BaseFeedsHandler):
         records = [pfif_version.person_to_dict(person, person.is_expired)
                    for person in persons]
         utils.optionally_filter_sensitive_fields(records, self.auth)
+        if not self.params.omit_notes:
+            notes_by_person.update(model.Note.get_by_person_record_ids(
+                self.repo, [person.record_id for person in persons]))
         atom_version.write_person_feed(
             self.response.out, records, get_notes_for_person,
             self.request.url, self.env.netloc, PERSON_SUBTITLE_BASE +
@@ -65,6 +65,8 @@ class Handler(utils.BaseHandler):
             person = model.Person.get(self.repo, note.person_record_id)
             if person:
                 person.update_latest_status(note)
+                # Check again once the notes query reflects the change.
+                model.DirtyPerson.mark(self.repo, [person.record_id])
 
             self.redirect(self.get_url('/view', id=note.person_record_id,
                                        signature=self.params.signature))
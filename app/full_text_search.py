@@ -18,6 +18,7 @@ import re
 
 from google.appengine.api import search as appengine_search
 
+import config
 import model
 import script_variant
 
@@ -25,6 +26,11 @@ import script_variant
 # This index contains person name and location.
 PERSON_LOCATION_FULL_TEXT_INDEX_NAME = 'person_location_information'
 
+# The name of the index of a repository that has its own index.
+# Repositories are moved to their own index by the
+# migrate_full_text_index task; until then they use the shared index above.
+PER_REPO_INDEX_NAME_FORMAT = PERSON_LOCATION_FULL_TEXT_INDEX_NAME + '.%s'
+
 ROMANIZE_METHODS = [script_variant.romanize_word_by_unidecode,
                     script_variant.romanize_japanese_word,
                     script_variant.romanize_chinese_name]
@@ -32,6 +38,92 @@ ROMANIZE_METHODS = [script_variant.romanize_word_by_unidecode,
 # This is for ranking (person name match higher than location)
 REPEAT_COUNT_FOR_RANK = 5
 
+# Formats of the documents in the index.
+#
+# The legacy format has a field per romanized value, and repeats each
+# romanized name in REPEAT_COUNT_FOR_RANK fields so that MatchScorer ranks
+# name matches higher than location matches.
+DOCUMENT_FORMAT_LEGACY = 1
+# The compact format has one field with all the variants of the names and one
+# with all the variants of the location.  Queries restrict name terms to the
+# names field and location terms to the locations field, so a location can
+# never match a name query, and results are sorted by their MatchScorer score.
+DOCUMENT_FORMAT_COMPACT = 2
+
+DOCUMENT_FORMAT_FIELD_NAME = 'document_format'
+NAMES_FIELD_NAME = 'names'
+LOCATIONS_FIELD_NAME = 'locations'
+
+# Fields of the person used for names and locations.
+NAME_PROPERTIES = ['given_name', 'family_name', 'full_name', 'alternate_names']
+LOCATION_PROPERTIES = ['home_city', 'home_state', 'home_postal_code',
+                       'home_neighborhood', 'home_country']
+
+
+def get_document_format():
+    """
+    Returns the format of the documents to write.  The index is shared by all
+    repositories, so this is a global setting; the migrate_full_text_documents
+    task switches it to DOCUMENT_FORMAT_COMPACT.
+    """
+    return config.get('full_text_document_format') or DOCUMENT_FORMAT_LEGACY
+
+
+def get_query_format(repo):
+    """
+    Returns the document format that queries in the repository should expect.
+    This is switched to DOCUMENT_FORMAT_COMPACT once all the documents of the
+    repository have been rewritten.
+    """
+    return (config.get_for_repo(repo, 'full_text_query_format') or
+            DOCUMENT_FORMAT_LEGACY)
+
+
+def get_per_repo_index_name(repo):
+    """
+    Returns the name of the index of its own for the repository.
+    """
+    return PER_REPO_INDEX_NAME_FORMAT % repo
+
+
+def get_index_name(repo):
+    """
+    Returns the name of the index that searches in the repository read from.
+    This is the per-repo config full_text_index_name, which a single config
+    write switches from the shared index to another one.
+    """
+    return (config.get_for_repo(repo, 'full_text_index_name') or
+            PERSON_LOCATION_FULL_TEXT_INDEX_NAME)
+
+
+def get_write_index_names(repo):
+    """
+    Returns the names of the indexes that documents of the repository are
+    written to: the index reads come from, and the index the repository is
+    being migrated to, if any, so that the new index doesn't miss writes made
+    during the migration.
+    """
+    index_names = [get_index_name(repo)]
+    migrating_index_name = config.get_for_repo(
+        repo, 'full_text_migrating_index_name')
+    if migrating_index_name and migrating_index_name not in index_names:
+        index_names.append(migrating_index_name)
+    return index_names
+
+
+def get_delete_index_names(repo):
+    """
+    Returns the names of the indexes that documents of the repository are
+    deleted from: the indexes they are written to, and the shared index if the
+    repository's documents are still left there after a migration to its own
+    index, so that deleted persons don't linger in the shared index.
+    """
+    index_names = get_write_index_names(repo)
+    if (config.get_for_repo(repo, 'full_text_shared_index_cleanup_pending')
+            and PERSON_LOCATION_FULL_TEXT_INDEX_NAME not in index_names):
+        index_names.append(PERSON_LOCATION_FULL_TEXT_INDEX_NAME)
+    return index_names
+
 
 def create_sort_expressions():
     """
@@ -69,62 +161,93 @@ def enclose_in_double_quotes(query_txt):
     return '"' + query_txt + '"'
 
 
-def create_non_romanized_query(query_txt):
+def restrict_to_field(query_txt, field_name):
+    """
+    Restricts query_txt to a field if field_name is given.
+    Returns:
+        'field_name:(query_txt)', or query_txt if field_name is None
+    """
+    if not field_name:
+        return query_txt
+    return '%s:(%s)' % (field_name, query_txt)
+
+
+def create_non_romanized_query(query_txt, field_name=None):
     """
     Creates non romanized query txt.
     Args:
         query_txt: Search query
+        field_name: If given, each word must match this field.
     Returns:
         '"query_word1" "query_word2" ...'
     """
     query_words = query_txt.split(' ')
-    return ' '.join(enclose_in_double_quotes(word) for word in query_words)
+    return ' '.join(
+        restrict_to_field(enclose_in_double_quotes(word), field_name)
+        for word in query_words)
 
 
-def create_romanized_query_txt(query_txt):
+def create_romanized_query_txt(query_txt, field_name=None):
     """
     Applies romanization to each word in query_txt.
     Args:
         query_txt: Search query
+        field_name: If given, each word must match this field.
     Returns:
         script varianted query_txt
     """
     query_words = query_txt.split(' ')
     query_list = []
     for word in query_words:
-        romanized_word_list = script_variant.romanize_search_query(word)
+        romanized_word_list = script_variant.romanize(
+            script_variant.romanize_search_query, word)
         romanized_word = ' OR '.join(enclose_in_double_quotes(word)
                                      for word in romanized_word_list)
-        query_list.append(romanized_word)
+        query_list.append(restrict_to_field(romanized_word, field_name))
     romanized_query = ','.join([word for word in query_list])
     return enclose_in_parenthesis(romanized_query)
 
 
-def is_query_match(query_txt, romanized_values):
-    """
-    Checks if a query matches a record
-    It should be called in get_person_ids_from_results method.
-    Args:
-        query_txt: Search query
-        romanized_values: field values
-    Returns:
-        Boolean
-    """
-    # empty matches everything
-    if not query_txt:
-        return True
-
-    romanized_query_list = (script_variant.romanize_search_query(query_txt))
-
-    # A query matches a record if all search_terms appear in the record
-    for search_terms in romanized_query_list:
-        words = search_terms.split(" ")
-        for word_index, word in enumerate(words):
-            if not re.search(word, " ".join(romanized_values), re.I):
-                break
-            if word_index == len(words) - 1:
+class QueryMatcher(object):
+    """
+    Checks if a query matches records.
+    The query is romanized and its words are compiled once, so the matcher
+    should be built once per search and used for all the returned documents.
+    """
+
+    def __init__(self, query_txt):
+        """
+        Args:
+            query_txt: Search query
+        """
+        # A list of compiled word patterns for each romanization of the query.
+        # The words are matched literally, whatever characters they contain.
+        self.patterns_list = []
+        if query_txt:
+            for search_terms in script_variant.romanize(
+                    script_variant.romanize_search_query, query_txt):
+                self.patterns_list.append(
+                    [re.compile(re.escape(word), re.I)
+                     for word in search_terms.split(' ')])
+        self.match_all = not query_txt
+
+    def matches(self, romanized_values):
+        """
+        Checks if the query matches a record.
+        Args:
+            romanized_values: field values
+        Returns:
+            Boolean
+        """
+        # empty matches everything
+        if self.match_all:
+            return True
+        # A query matches a record if all search_terms appear in the record
+        text = ' '.join(romanized_values)
+        for patterns in self.patterns_list:
+            if all(pattern.search(text) for pattern in patterns):
                 return True
-    return False
+        return False
 
 
 def get_person_ids_from_results(
@@ -133,7 +256,7 @@ def get_person_ids_from_results(
     Returns person record_id of persons
     whose name contain in romanized_name_query and
     location contain in romanized_location_query.
-    We use is_query_match to check if romanized_querys match
+    We use QueryMatcher to check if romanized_querys match
     at least a part of person name and location.
     To protect users' privacy, we should not return records
     which match location only.
@@ -141,8 +264,8 @@ def get_person_ids_from_results(
     (i.e., If results_list contains multiple results with the same index_results,
     it returns just one of them)
     """
-    name_query_txt = query_dict.get('name', '')
-    location_query_txt = query_dict.get('location', '')
+    name_matcher = QueryMatcher(query_dict.get('name', ''))
+    location_matcher = QueryMatcher(query_dict.get('location', ''))
 
     index_results = []
     added_results = set()
@@ -163,8 +286,8 @@ def get_person_ids_from_results(
             romanized_locations = [value for name, value in fields.items()
                                         if name in romanized_location_fields]
 
-            if (is_query_match(name_query_txt, romanized_names) and
-                is_query_match(location_query_txt, romanized_locations)):
+            if (name_matcher.matches(romanized_names) and
+                location_matcher.matches(romanized_locations)):
                 index_results.append(record_id)
                 added_results.add(record_id)
     return index_results
@@ -200,25 +323,37 @@ def search(repo, query_dict, max_results):
     for index, query in enumerate(query_list_cleaned):
         query_list_cleaned[index] = re.sub('"', '', query)
 
-    romanized_query_list = [create_romanized_query_txt(query)
-                            for query in query_list_cleaned]
-    non_romanized_query_list = [create_non_romanized_query(query)
-                                for query in query_list_cleaned]
+    # Compact documents rank names above locations by matching each part of
+    # the query only against its own field.
+    if get_query_format(repo) == DOCUMENT_FORMAT_COMPACT:
+        query_fields = [NAMES_FIELD_NAME, LOCATIONS_FIELD_NAME]
+    else:
+        query_fields = [None, None]
+
+    romanized_query_list = [create_romanized_query_txt(query, field_name)
+                            for query, field_name
+                            in zip(query_list_cleaned, query_fields)]
+    non_romanized_query_list = [create_non_romanized_query(query, field_name)
+                                for query, field_name
+                                in zip(query_list_cleaned, query_fields)]
 
     # search and sort options
-    person_location_index = appengine_search.Index(
-        name=PERSON_LOCATION_FULL_TEXT_INDEX_NAME)
+    person_location_index = appengine_search.Index(name=get_index_name(repo))
     expressions = create_sort_expressions()
     sort_opt = appengine_search.SortOptions(
         expressions=expressions, match_scorer=appengine_search.MatchScorer())
 
 
-    # Define the fields need to be returned per romanzie method
+    # Define the fields need to be returned per romanzie method.  Both the
+    # legacy and the compact fields are requested, because the index has
+    # documents of both formats while it is being migrated.
     returned_name_fields = [u'names_romanized_by_' + method.__name__
                             for method in ROMANIZE_METHODS]
+    returned_name_fields.append(NAMES_FIELD_NAME)
 
     returned_location_fields = [u'full_location_romanized_by_' + method.__name__
                             for method in ROMANIZE_METHODS]
+    returned_location_fields.append(LOCATIONS_FIELD_NAME)
 
     returned_fields = (returned_name_fields +
                        returned_location_fields + ['record_id'])
@@ -233,30 +368,23 @@ def search(repo, query_dict, max_results):
     # (e.g., "repo: repository_name", "test: test", "test AND test").
     and_query = ' AND '.join(
         romanized_query_list) + ' AND (repo: ' + repo + ')'
-    person_location_index_results = person_location_index.search(
-        appengine_search.Query(
-            query_string=and_query, options=options))
 
     # To rank exact matches higher than
     # non-exact matches with the same romanization.
     non_romanized_and_query = (' AND '.join(non_romanized_query_list)
                                 + ' AND (repo: ' + repo + ')')
-    non_romanized_person_location_index_results = (
-        person_location_index.search(appengine_search.Query(
-            query_string=non_romanized_and_query, options=options)))
 
-    results_list = [non_romanized_person_location_index_results,
-                    person_location_index_results]
+    # Both queries are sent before waiting for either of them.
+    futures = [
+        person_location_index.search_async(appengine_search.Query(
+            query_string=query_string, options=options))
+        for query_string in [non_romanized_and_query, and_query]]
+    results_list = [future.get_result() for future in futures]
 
     index_results = get_person_ids_from_results(query_dict,
         results_list, returned_name_fields, returned_location_fields)
 
-    results = []
-    for record_id in index_results:
-        result = model.Person.get(repo, record_id, filter_expired=True)
-        if result:
-            results.append(result)
-    return results
+    return model.Person.get_all(repo, index_results, filter_expired=True)
 
 
 def create_fields_for_rank(field_name, values):
@@ -309,8 +437,9 @@ def create_full_name_without_space_fields(romanize_method, given_name,
     """
     fields = []
     romanized_name_list = []
-    romanized_given_names = romanize_method(given_name)
-    romanized_family_names = romanize_method(family_name)
+    romanized_given_names = script_variant.romanize(romanize_method, given_name)
+    romanized_family_names = script_variant.romanize(
+        romanize_method, family_name)
     romanize_method_name = romanize_method.__name__
     full_names = create_full_name_list_without_space(
         romanized_given_names, romanized_family_names)
@@ -333,7 +462,7 @@ def create_romanized_name_fields(romanize_method, **kwargs):
     romanize_method_name = romanize_method.__name__
 
     for field_name, field_value in kwargs.iteritems():
-        romanized_names = romanize_method(field_value)
+        romanized_names = script_variant.romanize(romanize_method, field_value)
         for index, romanized_name in enumerate(romanized_names):
             fields.extend(create_fields_for_rank('%s_romanized_by_%s_%d' %
                                                  (field_name,
@@ -365,7 +494,8 @@ def create_romanized_location_fields(romanize_method, **kwargs):
     fields = []
     romanize_method_name = romanize_method.__name__
     for field in kwargs:
-        romanized_locations = romanize_method(kwargs[field])
+        romanized_locations = script_variant.romanize(
+            romanize_method, kwargs[field])
         for index, romanized_location in enumerate(romanized_locations):
             fields.append(
                 appengine_search.TextField(
@@ -396,10 +526,75 @@ def create_non_romanized_fields(**kwargs):
     return fields
 
 
-def create_document(person):
+def create_document(person, document_format=None):
     """
     Creates document for full text search.
     It should be called in add_record_to_index method.
+    Args:
+        person: Person to create the document for
+        document_format: DOCUMENT_FORMAT_LEGACY or DOCUMENT_FORMAT_COMPACT.
+                         Defaults to get_document_format().
+    """
+    if (document_format or get_document_format()) == DOCUMENT_FORMAT_COMPACT:
+        return create_compact_document(person)
+    return create_legacy_document(person)
+
+
+def join_unique(values):
+    """
+    Joins the non-empty values, without duplicates, in their original order,
+    with spaces, so that the tokenizer splits them apart.
+    """
+    seen = set()
+    unique_values = []
+    for value in values:
+        if value and value not in seen:
+            seen.add(value)
+            unique_values.append(value)
+    return ' '.join(unique_values)
+
+
+def create_compact_document(person):
+    """
+    Creates a document in DOCUMENT_FORMAT_COMPACT.  Every variant of the names
+    and of the location is stored once, in the names and locations fields.
+    """
+    names = []
+    locations = []
+    name_values = [getattr(person, name) for name in NAME_PROPERTIES]
+    location_values = [getattr(person, name) for name in LOCATION_PROPERTIES]
+    # The values as written rank exact matches higher than non-exact matches
+    # with the same romanization.
+    names.extend(name_values)
+    locations.extend(location_values)
+    for romanize_method in ROMANIZE_METHODS:
+        for value in name_values:
+            names.extend(script_variant.romanize(romanize_method, value))
+        names.extend(create_full_name_list_without_space(
+            script_variant.romanize(romanize_method, person.given_name),
+            script_variant.romanize(romanize_method, person.family_name)))
+        for value in location_values:
+            locations.extend(script_variant.romanize(romanize_method, value))
+
+    repo = person.repo
+    record_id = person.record_id
+    return appengine_search.Document(
+        doc_id=repo + ':' + record_id,
+        fields=[
+            appengine_search.TextField(name='repo', value=repo),
+            appengine_search.TextField(name='record_id', value=record_id),
+            appengine_search.NumberField(name=DOCUMENT_FORMAT_FIELD_NAME,
+                                         value=DOCUMENT_FORMAT_COMPACT),
+            appengine_search.TextField(name=NAMES_FIELD_NAME,
+                                       value=join_unique(names)),
+            appengine_search.TextField(name=LOCATIONS_FIELD_NAME,
+                                       value=join_unique(locations)),
+        ])
+
+
+def create_legacy_document(person):
+    """
+    Creates a document in DOCUMENT_FORMAT_LEGACY.
     """
     fields = []
 
@@ -450,9 +645,64 @@ def add_record_to_index(person):
         search.Error: An error occurred when the document could not be indexed
                       or the query has a syntax error.
     """
-    person_location_index = appengine_search.Index(
-        name=PERSON_LOCATION_FULL_TEXT_INDEX_NAME)
-    person_location_index.put(create_document(person))
+    document = create_document(person)
+    for index_name in get_write_index_names(person.repo):
+        appengine_search.Index(name=index_name).put(document)
+
+
+def add_records_to_index(persons, document_format=None, index_name=None):
+    """
+    Adds person records to index, putting the documents in batches as large
+    as the Search API allows.  A document that can't be created or indexed
+    doesn't prevent the others in its batch from being indexed.
+    Args:
+        persons: Persons to add
+        document_format: The format of the documents, as in create_document
+        index_name: The index to add the documents to.  Defaults to the
+                    indexes given by get_write_index_names.
+    Returns:
+        A list of (person, error_message) pairs for the records that could
+        not be indexed.
+    """
+    failures = []
+    documents_by_index_name = {}
+    index_names_by_repo = {}
+    for person in persons:
+        try:
+            document = create_document(person, document_format)
+        except ValueError as e:
+            failures.append((person, str(e)))
+            continue
+        if index_name:
+            index_names = [index_name]
+        else:
+            if person.repo not in index_names_by_repo:
+                index_names_by_repo[person.repo] = get_write_index_names(
+                    person.repo)
+            index_names = index_names_by_repo[person.repo]
+        for name in index_names:
+            documents_by_index_name.setdefault(name, []).append(
+                (person, document))
+
+    batch_size = appengine_search.MAXIMUM_DOCUMENTS_PER_PUT_REQUEST
+    for name, documents in sorted(documents_by_index_name.items()):
+        person_location_index = appengine_search.Index(name=name)
+        for start in xrange(0, len(documents), batch_size):
+            batch = documents[start:start + batch_size]
+            try:
+                person_location_index.put([document for _, document in batch])
+            except appengine_search.PutError as e:
+                # The documents with an OK result were indexed.
+                for (person, _), result in zip(batch, e.results):
+                    if result.code != appengine_search.OperationResult.OK:
+                        failures.append((person, result.message))
+            except appengine_search.Error as e:
+                failures.extend((person, str(e)) for person, _ in batch)
+
+    for person, message in failures:
+        logging.warning('Failed to index %s: %s' % (
+            person.repo + ':' + person.record_id, message))
+    return failures
 
 
 def delete_record_from_index(person):
@@ -465,6 +715,54 @@ def delete_record_from_index(person):
                       or the query has a syntax error.
     """
     doc_id = person.repo + ':' + person.record_id
-    person_location_index = appengine_search.Index(
+    for index_name in get_delete_index_names(person.repo):
+        appengine_search.Index(name=index_name).delete(doc_id)
+
+
+def delete_from_shared_index(repo):
+    """
+    Deletes all the documents of the repository from the shared index, which
+    is left holding them after the repository moves to its own index.
+    Raises:
+        search.Error: An error occurred when deleting the documents.
+    """
+    prefix = repo + ':'
+    shared_index = appengine_search.Index(
         name=PERSON_LOCATION_FULL_TEXT_INDEX_NAME)
-    person_location_index.delete(doc_id)
+    while True:
+        # Document IDs start with the repository ID, so the repository's
+        # documents are a contiguous range of the index.
+        documents = shared_index.get_range(
+            start_id=prefix, ids_only=True,
+            limit=appengine_search.MAXIMUM_DOCUMENTS_PER_PUT_REQUEST)
+        doc_ids = [document.doc_id for document in documents
+                   if document.doc_id.startswith(prefix)]
+        if not doc_ids:
+            break
+        shared_index.delete(doc_ids)
+
+
+def delete_index(repo):
+    """
+    Deletes all the documents in the repository's own index, and its schema.
+    This is much cheaper than deleting the repository's documents one by one,
+    and does nothing for repositories that use the shared index.
+    Returns:
+        True if the repository has its own index and it was deleted.
+    Raises:
+        search.Error: An error occurred when deleting the documents.
+    """
+    index_name = get_index_name(repo)
+    if index_name == PERSON_LOCATION_FULL_TEXT_INDEX_NAME:
+        return False
+    person_location_index = appengine_search.Index(name=index_name)
+    while True:
+        documents = person_location_index.get_range(
+            ids_only=True,
+            limit=appengine_search.MAXIMUM_DOCUMENTS_PER_PUT_REQUEST)
+        doc_ids = [document.doc_id for document in documents]
+        if not doc_ids:
+            break
+        person_location_index.delete(doc_ids)
+    person_location_index.delete_schema()
+    return True
@@ -26,6 +26,8 @@ import sys
 
 from google.appengine.api import datastore_errors
 
+from search import result_cache
+import full_text_search
 import subscribe
 from model import *
 from utils import validate_sex, validate_status, validate_approximate_date, \
@@ -134,9 +136,6 @@ def create_person(repo, fields):
             return Person.create_original_with_record_id(
                 repo, record_id, **person_fields)
     else:  # create a new original record
-        # TODO(liuhsinwen): fix performance problem by incrementing the counter
-        # by the number of upload records
-        # UsageCounter.increment_person_counter(repo)
         return Person.create_original(repo, **person_fields)
 
 def create_note(repo, fields):
@@ -163,8 +162,6 @@ def create_note(repo, fields):
         photo_url=fields.get('photo_url'),
         entry_date=get_utcnow(),
     )
-    # TODO(liuhsinwen): Separate existed and non-existed record id and
-    # increment note counter for new records
     record_id = strip(fields.get('note_record_id'))
     if record_id:  # create a record that might overwrite an existing one
         if is_clone(repo, record_id):
@@ -173,9 +170,6 @@ def create_note(repo, fields):
             return Note.create_original_with_record_id(
                 repo, record_id, **note_fields)
     else:  # create a new original record
-        # TODO(liuhsinwen): fix performance problem by incrementing the counter
-        # by the number of upload notes
-        # UsageCounter.increment_note_counter(repo)
         return Note.create_original(repo, **note_fields)
 
 def filter_new_notes(entities, repo):
@@ -189,6 +183,71 @@ def filter_new_notes(entities, repo):
     return notes
 
 
+def count_new_records(entities):
+    """Counts the entities that don't exist in the datastore yet, with one
+    batch get, by the UsageCounter names that Person.put_new and
+    Note.put_new increment.
+
+    Returns:
+        A dictionary of UsageCounter names to counts.
+    """
+    counts = {}
+    existing_entities = db.get([entity.key() for entity in entities])
+    for entity, existing_entity in zip(entities, existing_entities):
+        if existing_entity:
+            continue
+        if isinstance(entity, Person):
+            counter_names = ['person']
+        elif isinstance(entity, Note):
+            counter_names = ['note', entity.status or 'unspecified']
+        else:
+            continue
+        for counter_name in counter_names:
+            counts[counter_name] = counts.get(counter_name, 0) + 1
+    return counts
+
+
+def count_live_changes(repo, persons, notes):
+    """Gets the changes to the live counts (see LiveCounter) from writing the
+    given Persons and Notes over any existing records with the same keys.
+    This takes one batch get and one concurrent query per Person.
+
+    Args:
+        repo: The repository ID.
+        persons: A dictionary of person record IDs to the Persons to write,
+            including the Persons updated because they have new Notes.
+        notes: A dictionary of note record IDs to the Notes to write.
+
+    Returns:
+        A dictionary of the changes to the counts of each scan, keyed by scan
+        name, as dictionaries of count names to amounts.
+    """
+    entities = persons.values() + notes.values()
+    existing_entities = dict(
+        (entity.key(), entity)
+        for entity in db.get([entity.key() for entity in entities]) if entity)
+    old_notes_by_person = Note.get_by_person_record_ids(repo, persons.keys())
+    old_names = {'person': [], 'note': []}
+    new_names = {'person': [], 'note': []}
+    for note in notes.values():
+        existing_note = existing_entities.get(note.key())
+        if existing_note:
+            old_names['note'] += existing_note.get_count_names()
+        new_names['note'] += note.get_count_names()
+    for person_record_id, person in persons.items():
+        old_notes = old_notes_by_person[person_record_id]
+        new_notes = dict((note.record_id, note) for note in old_notes)
+        new_notes.update((note.record_id, note) for note in notes.values()
+                         if note.person_record_id == person_record_id)
+        existing_person = existing_entities.get(person.key())
+        if existing_person:
+            old_names['person'] += existing_person.get_count_names(old_notes)
+        new_names['person'] += person.get_count_names(new_notes.values())
+    return dict((scan_name, get_count_changes(
+                     old_names[scan_name], new_names[scan_name]))
+                for scan_name in old_names)
+
+
 def send_notifications(handler, persons, notes):
     """For each note, send a notification to subscriber.
 
@@ -262,7 +321,9 @@ def import_records(repo, domain, converter, records,
                 ('Not in authorized domain: %r' % entity.record_id, fields))
             continue
         if isinstance(entity, Person):
-            entity.update_index(['old', 'new'])
+            # The full-text index is updated in batches once the records
+            # have been written.
+            entity.update_index(['old', 'new'], index_full_text=False)
             persons[entity.record_id] = entity
         if isinstance(entity, Note):
             input_notes_with_fields.append((entity, fields))
@@ -334,7 +395,11 @@ def import_records(repo, domain, converter, records,
     # Now store the imported Persons and Notes, and count them.
     entities = persons.values() + notes.values()
     all_persons = dict(persons, **extra_persons)
+    live_count_changes = count_live_changes(repo, all_persons, notes)
     written = 0
+    written_persons = []
+    # The usage counts are incremented once for the whole import.
+    new_record_counts = {}
     while entities:
         # The presence of a handler indicates we should notify subscribers 
         # for any new notes being written. We do not notify on 
@@ -342,8 +407,16 @@ def import_records(repo, domain, converter, records,
         new_notes = []
         if handler:
             new_notes = filter_new_notes(entities[:MAX_PUT_BATCH], repo)
+        batch_counts = count_new_records(entities[:MAX_PUT_BATCH])
         written_batch = put_batch(entities[:MAX_PUT_BATCH])
         written += written_batch
+        if written_batch:
+            written_persons.extend(
+                entity for entity in entities[:MAX_PUT_BATCH]
+                if isinstance(entity, Person))
+            for counter_name, count in batch_counts.items():
+                new_record_counts[counter_name] = (
+                    new_record_counts.get(counter_name, 0) + count)
         # If we have new_notes and results did not fail then send notifications.
         if new_notes and written_batch:
             send_notifications(handler, all_persons, new_notes)
@@ -355,4 +428,24 @@ def import_records(repo, domain, converter, records,
         put_batch(entities[:MAX_PUT_BATCH])
         entities[:MAX_PUT_BATCH] = []
 
+    if written_persons and config.get('enable_fulltext_search'):
+        failures = full_text_search.add_records_to_index(written_persons)
+        if failures:
+            # The records were written, so they aren't reported as skipped,
+            # but they can't be found by full-text search until reindexed.
+            logging.error(
+                'Imported %d persons that could not be indexed: %s' % (
+                    len(failures), ', '.join(
+                        person.repo + ':' + person.record_id
+                        for person, _ in failures)))
+
+    if persons:
+        result_cache.invalidate(repo)
+
+    UsageCounter.increment_counters(repo, new_record_counts)
+    for scan_name, amounts in live_count_changes.items():
+        LiveCounter.increment_counters(repo, scan_name, amounts)
+    DirtyPerson.mark(
+        repo, [note.person_record_id for note in notes.values()])
+
     return written, skipped, total
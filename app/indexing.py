@@ -33,12 +33,89 @@ but will not be retrieved by:
 
 from text_query import TextQuery
 
+from google.appengine.api import memcache
 from google.appengine.ext import db
 import unicodedata
 import logging
 import model
 import re
 import jautils
+import request_timing
+import time
+
+# Memcache namespace for the per-repo token cardinality store.  Each entry
+# holds the approximate number of unexpired Person records in a repo whose
+# names_prefixes contain a given token.  The person scan (tasks.CountPerson)
+# rebuilds the counts under a new version, and the planner reads the version
+# of the last finished scan, so the counts never drift with writes.
+TOKEN_COUNT_NAMESPACE = 'indexing.token_count'
+
+# Memcache namespace for the versions of each repo's token counts: the key
+# <repo> holds the version the planner reads, and <repo>:building holds the
+# version that a running scan is filling in.
+TOKEN_COUNT_VERSION_NAMESPACE = 'indexing.token_count_version'
+
+# Memcache namespace for the number of names_prefixes filters known to be
+# servable by the datastore indexes of a repo.
+MAX_FILTERS_NAMESPACE = 'indexing.max_filters'
+
+# How long (in seconds) to trust a learned filter limit.  After this, the
+# planner probes with all the filters again in case new indexes were built.
+MAX_FILTERS_TTL_SECONDS = 3600
+
+
+def get_token_count_key_prefix(repo, version):
+    return '%s:%s:' % (repo, version)
+
+
+def get_token_counts(repo, tokens):
+    """Returns a dictionary mapping each token to the approximate number of
+    Person records in the repo indexed with it.  Tokens without a known count
+    (not seen by the last person scan, or evicted from memcache) are left
+    out."""
+    if not tokens:
+        return {}
+    version = memcache.get(repo, namespace=TOKEN_COUNT_VERSION_NAMESPACE)
+    if version is None:
+        return {}
+    return memcache.get_multi(
+        list(tokens), key_prefix=get_token_count_key_prefix(repo, version),
+        namespace=TOKEN_COUNT_NAMESPACE)
+
+
+def start_token_counts(repo):
+    """Starts building a new version of the token counts of a repo."""
+    memcache.set(repo + ':building', int(time.time() * 1000),
+                 namespace=TOKEN_COUNT_VERSION_NAMESPACE)
+
+
+def add_token_counts(repo, counts):
+    """Adds to the version of the token counts being built, given a
+    dictionary mapping tokens to numbers of records."""
+    if not counts:
+        return
+    # The counts are only used to order filters, so losing an update is
+    # harmless; never fail a scan because of them.
+    try:
+        version = memcache.get(
+            repo + ':building', namespace=TOKEN_COUNT_VERSION_NAMESPACE)
+        if version is not None:
+            memcache.offset_multi(
+                counts, key_prefix=get_token_count_key_prefix(repo, version),
+                namespace=TOKEN_COUNT_NAMESPACE, initial_value=0)
+    except Exception as e:
+        logging.warning('Failed to update token counts: %s' % e)
+
+
+def finish_token_counts(repo):
+    """Switches the planner to the version of the token counts just built.
+    The previous version is no longer read, and memcache evicts it."""
+    version = memcache.get(
+        repo + ':building', namespace=TOKEN_COUNT_VERSION_NAMESPACE)
+    if version is not None:
+        memcache.set(repo, version, namespace=TOKEN_COUNT_VERSION_NAMESPACE)
+        memcache.delete(
+            repo + ':building', namespace=TOKEN_COUNT_VERSION_NAMESPACE)
 
 
 def update_index_properties(entity):
@@ -78,30 +155,28 @@ def get_alternate_name_tokens(person):
     return tokens
 
 
-class CmpResults():
+# A single CJK ideograph, and a run of CJK ideographs.
+CJK_CHAR_RE = re.compile(ur'^[\u3400-\u9fff]$')
+CJK_CHARS_RE = re.compile(ur'^[\u3400-\u9fff]+$')
+
+
+class Ranker(object):
+    """Computes the sort key of search results for a query.  The key of each
+    person is computed only once, so sorting N results costs N rank
+    computations instead of one per pairwise comparison."""
+
     def __init__(self, query):
         self.query = query
         self.query_words_set = set(query.words)
+        # The normalized query words, in the order as entered.
+        self.ordered_words = query.normalized.split()
 
-    def __call__(self, p1, p2):
-        if ((p1.primary_full_name and
-             p1.primary_full_name == p2.primary_full_name) or
-            ((p1.given_name or p1.family_name) and
-             p1.given_name == p2.given_name and
-             p1.family_name == p2.family_name)):
-            return 0
-        self.set_ranking_attr(p1)
-        self.set_ranking_attr(p2)
-        r1 = self.rank(p1)
-        r2 = self.rank(p2)
-
-        if r1 == r2:
-            # if rank is the same sort by name so same names will be together
-            return cmp(p1._normalized_full_name.normalized,
-                       p2._normalized_full_name.normalized)
-        else:
-            return cmp(r2, r1)
-
+    def __call__(self, person):
+        """Returns the sort key for a person: higher ranks come first, and
+        persons with the same rank are sorted by name so same names will be
+        together."""
+        self.set_ranking_attr(person)
+        return (-self.rank(person), person._normalized_full_name.normalized)
 
     def set_ranking_attr(self, person):
         """Consider save these into to db"""
@@ -116,8 +191,7 @@ class CmpResults():
     # TODO(ryok): re-consider the ranking putting more weight on full_name (a
     # required field) instead of given name and family name pair (optional).
     def rank(self, person):
-        # The normalized query words, in the order as entered.
-        ordered_words = self.query.normalized.split()
+        ordered_words = self.ordered_words
 
         if (ordered_words ==
             person._normalized_given_name.words +
@@ -125,19 +199,13 @@ class CmpResults():
             # Matches a Latin name exactly (given name followed by surname).
             return 10
 
-        if (re.match(ur'^[\u3400-\u9fff]$', person.family_name) and
-            ordered_words in [
-                [person.family_name + person.given_name],
-                [person.family_name, person.given_name]
-            ]):
-            # Matches a CJK name exactly (surname followed by given name).
-            return 10
-
-        if (re.match(ur'^[\u3400-\u9fff]+$', person.family_name) and
-            ordered_words in [
+        if (ordered_words in [
                 [person.family_name + person.given_name],
                 [person.family_name, person.given_name]
-            ]):
+            ] and CJK_CHARS_RE.match(person.family_name)):
+            if CJK_CHAR_RE.match(person.family_name):
+                # Matches a CJK name exactly (surname followed by given name).
+                return 10
             # Matches a CJK name exactly (surname followed by given name).
             # A multi-character surname is uncommon, so it is ranked a bit lower.
             return 9.5
@@ -148,21 +216,16 @@ class CmpResults():
             # Matches a Latin name with given and family name switched.
             return 9
 
-        if (re.match(ur'^[\u3400-\u9fff]$', person.given_name) and
-            ordered_words in [
-                    [person.given_name + person.family_name],
-                    [person.given_name, person.family_name]
-            ]):
-            # Matches a CJK name with surname and given name switched.
-            return 9
-
-        if (re.match(ur'^[\u3400-\u9fff]+$', person.given_name) and
-            ordered_words in [
-                    [person.given_name + person.family_name],
-                    [person.given_name, person.family_name]
-            ]):
+        if (ordered_words in [
+                [person.given_name + person.family_name],
+                [person.given_name, person.family_name]
+            ] and CJK_CHARS_RE.match(person.given_name)):
+            if CJK_CHAR_RE.match(person.given_name):
+                # Matches a CJK name with surname and given name switched.
+                return 9
             # Matches a CJK name with surname and given name switched.
-            # A multi-character surname is uncommon, so it's ranked a bit lower.
+            # A multi-character surname is uncommon, so it's ranked a bit
+            # lower.
             return 8.5
 
         if person._name_words == self.query_words_set:
@@ -188,7 +251,8 @@ class CmpResults():
 
 
 def rank_and_order(results, query, max_results):
-    results.sort(CmpResults(query))
+    with request_timing.timer('rank'):
+        results.sort(key=Ranker(query))
     return results[:max_results]
 
 
@@ -208,20 +272,51 @@ def sort_query_words(query_words):
     return sorted(sorted_query_words, key=len, reverse=True)
 
 
+def plan_query_words(repo, query_words):
+    """Orders query words so that the most selective filters come first, and
+    returns the ordered list.
+
+    The heuristic order from sort_query_words() is used as the starting point
+    and as the tie-breaker.  Words are then ordered by the number of records
+    they match, from the token count store.  A word with an unknown count
+    wasn't seen by the last person scan or was evicted from memcache, which
+    usually means it is rare, so it counts as matching no records."""
+    query_words = sort_query_words(query_words)
+    counts = get_token_counts(repo, query_words)
+    if not counts:
+        return query_words
+    return sorted(query_words, key=lambda word: counts.get(word, 0))
+
+
+def get_max_filters(repo):
+    """Returns the largest number of names_prefixes filters known to be served
+    by the indexes of the repo, or None if it hasn't been learned yet."""
+    return memcache.get(repo, namespace=MAX_FILTERS_NAMESPACE)
+
+
+def set_max_filters(repo, max_filters):
+    """Remembers that queries on the repo can use up to max_filters filters."""
+    memcache.set(repo, max_filters, time=MAX_FILTERS_TTL_SECONDS,
+                 namespace=MAX_FILTERS_NAMESPACE)
+
+
 def search(repo, query_obj, max_results):
     # As there are limits on the number of filters that we can apply and the
     # number of entries we can fetch at once, the order of query words could
     # potentially matter.  In particular, this is the case for most Japanese
     # names, many of which consist of 4 to 6 Chinese characters, each
     # coresponding to an additional filter.
-    query_words = sort_query_words(query_obj.query_words)
+    query_words = plan_query_words(repo, query_obj.query_words)
     logging.debug('query_words: %r' % query_words)
 
-    # First try the query with all the filters, and then keep backing off
-    # if we get NeedIndexError.
+    # Start from the number of filters that the indexes are known to serve,
+    # and only back off further if we still get NeedIndexError.
     fetch_limit = 400
     fetched = []
+    max_filters = get_max_filters(repo)
     filters_to_try = len(query_words)
+    if max_filters:
+        filters_to_try = min(filters_to_try, max_filters)
     while filters_to_try:
         query = model.Person.all_in_repo(repo)
         for word in query_words[:filters_to_try]:
@@ -232,6 +327,8 @@ def search(repo, query_obj, max_results):
             break
         except db.NeedIndexError:
             filters_to_try -= 1
+            if filters_to_try:
+                set_max_filters(repo, filters_to_try)
             continue
     logging.debug('indexing.search fetched: %d' % len(fetched))
 
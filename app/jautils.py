@@ -357,6 +357,24 @@ KATAKANA_TO_HIRAGANA = {
 }
 
 
+# HIRAGANA_TO_ROMAJI compiled into a regular expression that matches the
+# longest hiragana sequence in the table, and the entries by hiragana.  When
+# the table has the same hiragana more than once, its first entry is used.
+_HIRAGANA_TO_ROMAJI_ENTRIES = {}
+for _entry in HIRAGANA_TO_ROMAJI:
+    _HIRAGANA_TO_ROMAJI_ENTRIES.setdefault(_entry[0], _entry)
+_HIRAGANA_TO_ROMAJI_RE = re.compile(u'|'.join(
+    re.escape(hira) for hira in
+    sorted(_HIRAGANA_TO_ROMAJI_ENTRIES, key=len, reverse=True)))
+
+_HIRAGANA_TO_ROMAJI_POST_PROCESS_RES = [
+    (re.compile(pat), rep) for (pat, rep) in HIRAGANA_TO_ROMAJI_POST_PROCESS]
+
+# KATAKANA_TO_HIRAGANA as a translate() table.
+_KATAKANA_TO_HIRAGANA_TABLE = dict(
+    (ord(kata), hira) for (kata, hira) in KATAKANA_TO_HIRAGANA.items())
+
+
 HIRAGANA_NORMALIZATION = {
     u'ぢ': u'じ', u'づ': u'ず', u'ゐ': u'い', u'ゑ': u'え',
 }
@@ -529,10 +547,9 @@ def katakana_to_hiragana(string):
     Returns:
         The replaced string.
     """
-    replaced = u''
-    for ch in string:
-        replaced += KATAKANA_TO_HIRAGANA.get(ch, ch)
-    return replaced
+    if isinstance(string, six.text_type):
+        return string.translate(_KATAKANA_TO_HIRAGANA_TABLE)
+    return u''.join(KATAKANA_TO_HIRAGANA.get(ch, ch) for ch in string)
 
 
 def hiragana_to_romaji(string):
@@ -544,23 +561,26 @@ def hiragana_to_romaji(string):
         The replaced string.
     """
     remaining = string
-    result = u''
-    while remaining:
-        longest = 0
-        longest_data = None
-        for (hira, rom, next) in HIRAGANA_TO_ROMAJI:
-            if remaining.startswith(hira) and len(hira) > longest:
-                longest_data = (hira, rom, next)
-                longest = len(hira)
-        if longest == 0:
+    pos = 0
+    result = []
+    while pos < len(remaining):
+        match = _HIRAGANA_TO_ROMAJI_RE.match(remaining, pos)
+        if not match:
             # erroneous info
-            result += remaining[0]
-            remaining = remaining[1:]
+            result.append(remaining[pos])
+            pos += 1
+            continue
+        hira, rom, next = _HIRAGANA_TO_ROMAJI_ENTRIES[match.group()]
+        result.append(rom)
+        if next:
+            # The entry puts some hiragana back to be converted next.
+            remaining = next + remaining[match.end():]
+            pos = 0
         else:
-            result += longest_data[1]
-            remaining = longest_data[2] + remaining[len(longest_data[0]):]
-    for (pat, rep) in HIRAGANA_TO_ROMAJI_POST_PROCESS:
-        result = re.sub(pat, rep, result)
+            pos = match.end()
+    result = u''.join(result)
+    for (pat, rep) in _HIRAGANA_TO_ROMAJI_POST_PROCESS_RES:
+        result = pat.sub(rep, result)
     return result
 
 
@@ -0,0 +1,64 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A bounded, per-instance least-recently-used cache."""
+
+import collections
+
+
+class LruCache(object):
+    """A dictionary-like cache holding at most max_size entries.  When it is
+    full, adding an entry evicts the least recently used one."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = collections.OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+        self.evict_count = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """Gets the value for the key and marks it as recently used."""
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.miss_count += 1
+            return default
+        self.entries[key] = value
+        self.hit_count += 1
+        return value
+
+    def put(self, key, value):
+        """Adds or replaces the value for the key."""
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evict_count += 1
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        """Returns a dictionary of the size and the hit, miss and eviction
+        counts of this cache."""
+        return {'size': len(self.entries), 'max_size': self.max_size,
+                'hits': self.hit_count, 'misses': self.miss_count,
+                'evictions': self.evict_count}
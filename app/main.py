@@ -27,17 +27,22 @@ from google.appengine.api import memcache
 from google.appengine.api import users
 from google.appengine.ext import webapp
 
+import action_log
+import entity_cache
 import config
 import const
 import django.utils.html
 import logging
 import model
 import pfif
+import repo_directory
+import request_timing
 import resources
 import simplejson
 import utils
 import user_agents
 import setup_pf
+import warmup
 
 
 # When no action or repo is specified, redirect to this action.
@@ -93,12 +98,21 @@ HANDLER_CLASSES['feeds/note'] = 'feeds.Note'
 HANDLER_CLASSES['feeds/person'] = 'feeds.Person'
 HANDLER_CLASSES['tasks/count/note'] = 'tasks.CountNote'
 HANDLER_CLASSES['tasks/count/person'] = 'tasks.CountPerson'
+HANDLER_CLASSES['tasks/count/migrate_full_text_documents'] = (
+    'tasks.MigrateFullTextDocuments')
+HANDLER_CLASSES['tasks/count/migrate_full_text_index'] = (
+    'tasks.MigrateFullTextIndex')
 HANDLER_CLASSES['tasks/count/reindex'] = 'tasks.Reindex'
-HANDLER_CLASSES['tasks/count/update_dead_status'] = 'tasks.UpdateDeadStatus'
 HANDLER_CLASSES['tasks/count/update_status'] = 'tasks.UpdateStatus'
+HANDLER_CLASSES['tasks/update_dirty_status'] = 'tasks.UpdateDirtyStatus'
 HANDLER_CLASSES['tasks/delete_expired'] = 'tasks.DeleteExpired'
 HANDLER_CLASSES['tasks/delete_old'] = 'tasks.DeleteOld'
 HANDLER_CLASSES['tasks/dump_csv'] = 'tasks.DumpCSV'
+HANDLER_CLASSES['tasks/drop_full_text_index'] = 'tasks.DropFullTextIndex'
+HANDLER_CLASSES['tasks/clean_shared_full_text_index'] = (
+    'tasks.CleanSharedFullTextIndex')
+HANDLER_CLASSES['tasks/migrate_usage_counters'] = 'tasks.MigrateUsageCounters'
+HANDLER_CLASSES['tasks/write_action_logs'] = 'tasks.WriteActionLogs'
 HANDLER_CLASSES['tasks/clean_up_in_test_mode'] = 'tasks.CleanUpInTestMode'
 HANDLER_CLASSES['tasks/notify_many_unreviewed_notes'] = 'tasks.NotifyManyUnreviewedNotes'
 HANDLER_CLASSES['tasks/thumbnail_preparer'] = 'tasks.ThumbnailPreparer'
@@ -182,16 +196,10 @@ def select_lang_from_header(request, default_lang):
 
 def get_repo_options(request, lang):
     """Returns a list of the names and titles of the launched repositories."""
-    options = []
-    for repo in model.Repo.list_launched():
-        titles = config.get_for_repo(repo, 'repo_titles', {})
-        default_title = (titles.values() or ['?'])[0]
-        title = titles.get(lang, titles.get('en', default_title))
-        url = utils.get_repo_url(request, repo)
-        test_mode = config.get_for_repo(repo, 'test_mode')
-        options.append(utils.Struct(repo=repo, title=title, url=url,
-                                    test_mode=test_mode))
-    return options
+    return [utils.Struct(repo=info.repo_id, title=info.get_title(lang),
+                         url=utils.get_repo_url(request, info.repo_id),
+                         test_mode=info.test_mode)
+            for info in repo_directory.get().list_launched()]
 
 def get_language_options(request, config, current_lang):
     """Returns a list of information needed to generate the language menu."""
@@ -452,6 +460,12 @@ class Main(webapp.RequestHandler):
     def initialize(self, request, response):
         webapp.RequestHandler.initialize(self, request, response)
 
+        # The request scope starts here rather than in serve_in_request_scope
+        # so that setup_env's datastore calls are timed and its entity gets
+        # are shared with the handler.
+        request_timing.begin_request()
+        entity_cache.begin_request()
+
         # If requested, set the clock before doing anything clock-related.
         # Only works on localhost for testing.  Specify ?utcnow=1293840000 to
         # set the clock to 2011-01-01, or ?utcnow=real to revert to real time.
@@ -550,16 +564,50 @@ class Main(webapp.RequestHandler):
             response.set_status(404)
             response.out.write('Not found')
 
+    def serve_in_request_scope(self):
+        # Action log entries are written once, at the end of the request, and
+        # entities are looked up through a map that lives as long as the
+        # request (started in initialize).
+        if is_task_queue_task(self.request):
+            action_log.begin_request(action_log.TASK_DEADLINE_SECONDS)
+        else:
+            action_log.begin_request()
+        try:
+            self.serve()
+        finally:
+            entity_cache.end_request()
+            action_log.end_request()
+            endpoint = self.env.action
+            if endpoint not in HANDLER_CLASSES:
+                endpoint = request_timing.OTHER_ENDPOINT
+            server_timing = request_timing.end_request(endpoint)
+            if server_timing:
+                self.response.headers['Server-Timing'] = server_timing
+
     def get(self):
-        self.serve()
+        self.serve_in_request_scope()
 
     def post(self):
-        self.serve()
+        self.serve_in_request_scope()
 
     def head(self):
         self.request.method = 'GET'
-        self.serve()
+        self.serve_in_request_scope()
         self.response.clear()
 
+
+class Warmup(webapp.RequestHandler):
+    """Handles /_ah/warmup, responding with the time each step took."""
+
+    def get(self):
+        timings = warmup.warm_up(
+            [name.split('.')[0] for name in HANDLER_CLASSES.values()])
+        self.response.headers['Content-Type'] = 'text/plain'
+        self.response.out.write(
+            ''.join('%s: %.3f s\n' % timing for timing in timings))
+
 if __name__ == '__main__':
-    webapp.util.run_wsgi_app(webapp.WSGIApplication([('.*', Main)]))
+    webapp.util.run_wsgi_app(webapp.WSGIApplication([
+        ('/_ah/warmup', Warmup),
+        ('.*', Main),
+    ]))
@@ -16,7 +16,10 @@
 
 __author__ = 'kpy@google.com (Ka-Ping Yee) and many other Googlers'
 
+import collections
 from datetime import timedelta
+import logging
+import random
 
 from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
@@ -24,11 +27,14 @@ from google.appengine.ext import db
 from six.moves.urllib import parse as urlparse
 import urllib
 
+import action_log
 import config
+import entity_cache
 import full_text_search
 import indexing
 import pfif
 import prefix
+from search import result_cache
 from const import HOME_DOMAIN, NOTE_STATUS_TEXT
 
 # default # of days for a record to expire.
@@ -134,7 +140,7 @@ class Repo(db.Model):
 
     @staticmethod
     def get(repo_id):
-        return Repo.get_by_key_name(repo_id)
+        return entity_cache.get(db.Key.from_path(Repo.kind(), repo_id))
 
     @classmethod
     def list(cls):
@@ -231,15 +237,18 @@ class Base(db.Model):
         return db.Key.from_path(cls.kind(), repo + ':' + record_id)
 
     @classmethod
-    def get_all(cls, repo, record_ids, limit=200):
-        """Gets the entities with the given record_ids in a given repository."""
+    def get_all(cls, repo, record_ids, limit=200, filter_expired=False):
+        """Gets the entities with the given record_ids in a given repository,
+        in the order of record_ids, with a single batch get."""
         keys = [cls.get_key(repo, id) for id in record_ids]
-        return [record for record in db.get(keys) if record is not None]
+        return [record for record in entity_cache.get(keys)
+                if record is not None and
+                not (filter_expired and record.is_expired)]
 
     @classmethod
     def get(cls, repo, record_id, filter_expired=True):
         """Gets the entity with the given record_id in a given repository."""
-        record = cls.get_by_key_name(repo + ':' + record_id)
+        record = entity_cache.get(cls.get_key(repo, record_id))
         if record:
             if not (filter_expired and record.is_expired):
                 return record
@@ -488,6 +497,18 @@ class Person(Base):
             email_addresses.add(self.author_email)
         return email_addresses
 
+    def get_count_names(self, notes):
+        """Gets the names of the counts of the person scan that this Person
+        adds to, given its Notes; expired records aren't counted."""
+        if self.is_expired:
+            return []
+        notes = [note for note in notes if not note.is_expired]
+        linked_person_ids = [note.linked_person_record_id for note in notes
+                             if note.linked_person_record_id]
+        return get_person_count_names(
+            self, len(notes),
+            len(Person.get_all(self.repo, linked_person_ids)))
+
     def get_effective_expiry_date(self):
         """Gets the expiry_date, or if no expiry_date is present, returns the
         source_date plus the configurable default_expiration_days interval.
@@ -517,6 +538,10 @@ class Person(Base):
         expired = self.get_effective_expiry_date() <= now
 
         if self.is_expired != expired:
+            notes = self.get_notes(filter_expired=False)
+            old_person_names = self.get_count_names(notes)
+            old_note_names = sum([note.get_count_names() for note in notes], [])
+
             # NOTE: This should be the ONLY code that modifies is_expired.
             self.is_expired = expired
 
@@ -533,12 +558,17 @@ class Person(Base):
             self.entry_date = now
 
             # All the Notes on the Person also expire or unexpire, to match.
-            notes = self.get_notes(filter_expired=False)
             for note in notes:
                 note.is_expired = expired
 
             # Store these changes in the datastore.
             db.put(notes + [self])
+            result_cache.invalidate(self.repo)
+            LiveCounter.add_changes(self.repo, 'person', old_person_names,
+                                    self.get_count_names(notes))
+            LiveCounter.add_changes(
+                self.repo, 'note', old_note_names,
+                sum([note.get_count_names() for note in notes], []))
             # TODO(lschumacher): photos don't have expiration currently.
 
     def wipe_contents(self):
@@ -590,29 +620,48 @@ class Person(Base):
             entities_to_delete.append(self)
             if config.get('enable_fulltext_search'):
                 full_text_search.delete_record_from_index(self)
+        old_person_names = delete_self and self.get_count_names(notes) or []
         db.delete(entities_to_delete)
-
-    def update_from_note(self, note):
-        """Updates any necessary fields on the Person to reflect a new Note."""
+        if delete_self:
+            result_cache.invalidate(self.repo)
+        LiveCounter.add_changes(self.repo, 'person', old_person_names, [])
+        LiveCounter.add_changes(
+            self.repo, 'note',
+            sum([note.get_count_names() for note in notes], []), [])
+
+    def get_updates_from_note(self, note):
+        """Gets the changes that a new Note makes to the fields of this
+        Person, as a dictionary of property names to new values."""
         # We want to transfer only the *non-empty, newer* values to the Person.
+        updates = {}
         if note.author_made_contact is not None:  # for boolean, None means
                                                   # unspecified
             # datetime stupidly refuses to compare to None, so check for None.
             if (self.latest_found_source_date is None or
                 note.source_date >= self.latest_found_source_date):
-                self.latest_found = note.author_made_contact
-                self.latest_found_source_date = note.source_date
+                updates['latest_found'] = note.author_made_contact
+                updates['latest_found_source_date'] = note.source_date
         if note.status:  # for string, '' means unspecified
             if (self.latest_status_source_date is None or
                 note.source_date >= self.latest_status_source_date):
-                self.latest_status = note.status
-                self.latest_status_source_date = note.source_date
+                updates['latest_status'] = note.status
+                updates['latest_status_source_date'] = note.source_date
+        return updates
 
-    def update_index(self, which_indexing):
+    def update_from_note(self, note):
+        """Updates any necessary fields on the Person to reflect a new Note."""
+        for name, value in self.get_updates_from_note(note).items():
+            setattr(self, name, value)
+
+    def update_index(self, which_indexing, index_full_text=True):
+        """Updates the search index properties of this Person.  Callers that
+        update many Persons at once should pass index_full_text=False and add
+        them to the full-text index together with
+        full_text_search.add_records_to_index()."""
         #setup new indexing
         if 'new' in which_indexing:
             indexing.update_index_properties(self)
-            if config.get('enable_fulltext_search'):
+            if index_full_text and config.get('enable_fulltext_search'):
                 full_text_search.add_record_to_index(self)
         # setup old indexing
         if 'old' in which_indexing:
@@ -620,25 +669,43 @@ class Person(Base):
 
     def update_latest_status(self, modified_note=None):
         """Scans all notes on this Person and fixes latest_status if needed."""
+        notes = self.get_notes()
+        if modified_note:
+            notes = [modified_note if note.record_id == modified_note.record_id
+                     else note for note in notes]
+        if self.set_latest_status(notes):
+            self.put()
+
+    def set_latest_status(self, notes):
+        """Sets latest_status from the given Notes on this Person, in
+        source_date order, without storing the Person.  Returns True if
+        latest_status changed."""
         status = None
         status_source_date = None
-        for note in self.get_notes():
-            if modified_note and modified_note.note_record_id == note.record_id:
-                note = modified_note
+        for note in notes:
             if note.status and not note.hidden:
                 status = note.status
                 status_source_date = note.source_date
-        if status != self.latest_status:
-            self.latest_status = status
-            self.latest_status_source_date = status_source_date
-            self.put()
-
-    def put_new(self):
+        if status == self.latest_status:
+            return False
+        if not self.is_expired:
+            LiveCounter.add_changes(
+                self.repo, 'person', ['status=' + (self.latest_status or '')],
+                ['status=' + (status or '')])
+        self.latest_status = status
+        self.latest_status_source_date = status_source_date
+        return True
+
+    def put_new(self, notes=()):
         """Write the new person record to datastore. Increments person_counter
         because a new record is created. Logs user actions is updated too.
-        We should never call this method against an existing record."""
+        We should never call this method against an existing record.  Pass in
+        any Notes already written for this record, so they're counted."""
         db.put(self)
+        result_cache.invalidate(self.repo)
         UsageCounter.increment_counter(self.repo, ['person'])
+        LiveCounter.add_changes(
+            self.repo, 'person', [], self.get_count_names(list(notes)))
         UserActionLog.put_new('add', self, copy_properties=False)
 
 # Old indexing
@@ -707,6 +774,38 @@ class Note(Base):
         return list(Note.generate_by_person_record_id(
             repo, person_record_id, filter_expired))
 
+    @staticmethod
+    def get_by_person_record_ids(
+        repo, person_record_ids, filter_expired=True):
+        """Gets the Notes on each of several Persons, as a dictionary of each
+        person record ID to the list of its Notes ordered by source_date.
+        The queries for all the Persons run concurrently."""
+        person_record_ids = list(collections.OrderedDict.fromkeys(
+            person_record_ids))
+        # Query.run() sends the query right away and returns an iterator that
+        # fetches its results in batches, so all the queries are started
+        # before we wait for any of them.
+        iterators = [
+            Note.all_in_repo(repo, filter_expired=filter_expired
+                ).filter('person_record_id =', person_record_id
+                ).order('source_date').run(batch_size=Note.FETCH_LIMIT)
+            for person_record_id in person_record_ids]
+        return dict((person_record_id, list(iterator))
+                    for person_record_id, iterator
+                    in zip(person_record_ids, iterators))
+
+    @staticmethod
+    def generate_by_person_record_id_range(
+        repo, first_person_record_id, last_person_record_id,
+        filter_expired=True):
+        """Generates all the Notes on the Persons whose record IDs are
+        between the given record IDs (inclusive), ordered by person_record_id.
+        This is a single query, whose results are fetched in batches."""
+        return Note.all_in_repo(repo, filter_expired=filter_expired
+            ).filter('person_record_id >=', first_person_record_id
+            ).filter('person_record_id <=', last_person_record_id
+            ).order('person_record_id').run(batch_size=Note.FETCH_LIMIT)
+
     @staticmethod
     def generate_by_person_record_id(
         repo, person_record_id, filter_expired=True):
@@ -728,14 +827,93 @@ class Note(Base):
             ).filter('reviewed =', False).filter('hidden =', False)
         return query.count()
 
-    def put_new(self):
+    def get_count_names(self):
+        """Gets the names of the counts of the note scan that this Note adds
+        to; expired Notes aren't counted."""
+        if self.is_expired:
+            return []
+        author_made_contact = ''
+        if self.author_made_contact is not None:
+            author_made_contact = self.author_made_contact and 'TRUE' or 'FALSE'
+        names = ['all',
+                 'status=' + (self.status or ''),
+                 'original_domain=' + (self.original_domain or ''),
+                 'author_made_contact=' + author_made_contact]
+        if self.last_known_location:  # last known location specified?
+            names.append('last_known_location')
+        if self.author_email:  # author e-mail address present?
+            names.append('author_email')
+        if self.author_phone:  # author phone number present?
+            names.append('author_phone')
+        if self.linked_person_record_id:  # linked to another person?
+            names.append('linked_person')
+        return names
+
+    def put_new(self, person=None, notes=None):
         """Write the new note to datastore. Increments note_counter because
         a new note is created. Also, logs user actions is updated. We should
-        never call this method against an existing record."""
-        db.put(self)
+        never call this method against an existing record.
+
+        To update the counts of the Person that the Note is on, pass in the
+        stored Person as it was before being updated from this Note.  If the
+        caller also has the Person's existing Notes, pass them in too, to
+        update the counts by number of Notes and linked Persons; otherwise,
+        those are left for the next person scan to correct."""
+        # Notes with bad words aren't counted until they're confirmed, when
+        # confirm_post_flagged_note counts the confirmed copy.
+        counted = self.kind() == Note.kind()
+        entities = [self]
+        if counted:
+            entities += DirtyPerson.create_marks(
+                self.repo, [self.person_record_id])
+        db.put(entities)
         UserActionLog.put_new('add', self, copy_properties=False)
         note_status = self.status if self.status else 'unspecified'
         UsageCounter.increment_counter(self.repo, ['note', note_status])
+        if counted:
+            LiveCounter.add_changes_multi(
+                self.repo, self.get_live_count_changes(person, notes))
+
+    def get_live_count_changes(self, person=None, notes=None):
+        """Gets the changes that this new Note makes to the live counts, for
+        LiveCounter.add_changes_multi.  The arguments are as for put_new.
+        Notes that are written without put_new (e.g. flagged Notes when they
+        are confirmed) use this to be counted."""
+        changes = {'note': ([], self.get_count_names())}
+        if person:
+            changes['person'] = self.get_person_count_changes(person, notes)
+        return changes
+
+    def get_person_count_changes(self, person, notes=None):
+        """Gets the names of the counts of the person scan that a Person adds
+        to before and after this new Note is added to it, given the Person
+        as it was before and, optionally, its existing Notes (see put_new).
+        Looks up the linked Persons, if any, with one batch get."""
+        if person.is_expired or self.is_expired:
+            return [], []
+        updates = person.get_updates_from_note(self)
+        if notes is None:
+            return (get_person_count_names(person),
+                    get_person_count_names(person, updates=updates))
+        notes = [note for note in notes if not note.is_expired]
+        linked_person_ids = [note.linked_person_record_id for note in notes
+                             if note.linked_person_record_id]
+        if self.linked_person_record_id:
+            linked_person_ids.append(self.linked_person_record_id)
+        # Like get_count_names, count each link to a Person that exists.
+        existing_ids = set()
+        if linked_person_ids:
+            existing_ids = set(p.record_id for p in
+                               Person.get_all(self.repo, linked_person_ids))
+        num_linked = len([record_id for record_id in linked_person_ids
+                          if record_id in existing_ids])
+        old_num_linked = num_linked
+        if (self.linked_person_record_id and
+                self.linked_person_record_id in existing_ids):
+            old_num_linked -= 1
+        return (get_person_count_names(person, len(notes), old_num_linked),
+                get_person_count_names(
+                    person, len(notes) + 1, num_linked, updates))
 
 class NoteWithBadWords(Note):
     # Spam score given by SpamDetector
@@ -865,7 +1043,7 @@ class Authorization(db.Model):
     @classmethod
     def get(cls, repo, key):
         """Gets the Authorization entity for a given repository and key."""
-        return cls.get_by_key_name(repo + ':' + key)
+        return entity_cache.get(db.Key.from_path(cls.kind(), repo + ':' + key))
 
     @classmethod
     def create(cls, repo, key, **kwargs):
@@ -908,6 +1086,49 @@ def encode_count_name(count_name):
             append('\\u%04x' % ch)
     return ''.join(encoded)
 
+
+def get_person_count_names(person, num_notes=None, num_linked_persons=None,
+                           updates=None):
+    """Gets the names of the counts of the person scan that a Person adds to,
+    given its number of unexpired Notes and of existing linked Persons.  If
+    either number is None, the counts by that number are left out.  updates
+    is an optional dictionary of property values to use in place of the
+    Person's (see Person.get_updates_from_note)."""
+    def get(name):
+        return (updates or {}).get(name, getattr(person, name))
+    found = ''
+    if get('latest_found') is not None:
+        found = get('latest_found') and 'TRUE' or 'FALSE'
+    names = ['all',
+             'original_domain=' + (person.original_domain or ''),
+             'sex=' + (person.sex or ''),
+             'home_country=' + (person.home_country or ''),
+             'photo=' + (person.photo_url and 'present' or '')]
+    if num_notes is not None:
+        names.append('num_notes=%d' % num_notes)
+    names += ['status=' + (get('latest_status') or ''),
+              'found=' + found]
+    if person.author_email:  # author e-mail address present?
+        names.append('author_email')
+    if person.author_phone:  # author phone number present?
+        names.append('author_phone')
+    if num_linked_persons is not None:
+        names.append('linked_persons=%d' % num_linked_persons)
+    return names
+
+
+def get_count_changes(old_names, new_names):
+    """Gets the changes to counts when a record that added to the counts in
+    old_names now adds to those in new_names, as a dictionary of count names
+    to amounts, leaving out the counts that don't change."""
+    amounts = {}
+    for name in old_names:
+        amounts[name] = amounts.get(name, 0) - 1
+    for name in new_names:
+        amounts[name] = amounts.get(name, 0) + 1
+    return dict((name, amount) for name, amount in amounts.items() if amount)
+
+
 class ApiActionLog(db.Model):
     """Log of api key usage."""
     # actions
@@ -940,7 +1161,7 @@ class ApiActionLog(db.Model):
                       timestamp=None):
         import utils
         try:
-            ApiActionLog(repo=repo,
+            action_log.add(ApiActionLog(repo=repo,
                          api_key=api_key,
                          action=action,
                          person_records=person_records,
@@ -951,10 +1172,10 @@ class ApiActionLog(db.Model):
                          ip_address=ip_address,
                          request_url=request_url,
                          version=version,
-                         timestamp=timestamp or utils.get_utcnow()).put()
-        except Exception:
+                         timestamp=timestamp or utils.get_utcnow()))
+        except Exception as e:
             # swallow anything to prevent the main action from failing.
-            pass
+            logging.exception('Failed to log API action: %s' % e)
 
 class Counter(db.Expando):
     """Counters hold partial and completed results for ongoing counting tasks.
@@ -984,7 +1205,7 @@ class Counter(db.Expando):
 
     @classmethod
     def get_count(cls, repo, name):
-        """Gets the latest finished count for the given repository and name.
+        """Gets the latest count for the given repository and name.
         'name' should be in the format scan_name + '.' + count_name."""
         scan_name, count_name = name.split('.')
         count_name = encode_count_name(count_name)
@@ -992,13 +1213,18 @@ class Counter(db.Expando):
 
     @classmethod
     def get_all_counts(cls, repo, scan_name):
-        """Gets a dictionary of all the counts for the last completed scan
-        for the given repository and scan name."""
+        """Gets a dictionary of all the counts for the given repository and
+        scan name: the live counts (see LiveCounter) if the scan keeps them,
+        otherwise those of the last completed scan."""
         counter_key = repo + ':' + scan_name
 
         # Get the counts from memcache, loading from datastore if necessary.
         counter_dict = memcache.get(counter_key)
-        if not counter_dict:
+        if not counter_dict and scan_name in LiveCounter.SCAN_NAMES:
+            counter_dict = LiveCounter.get_counts(repo, scan_name)
+            if counter_dict is not None:
+                memcache.set(counter_key, counter_dict, 60)
+        if counter_dict is None:
             try:
                 # Get the latest completed counter with this scan_name.
                 counter = cls.all().filter('repo =', repo
@@ -1041,6 +1267,34 @@ class Counter(db.Expando):
         return counter
 
 
+class CounterRange(Counter):
+    """The progress and partial counts of one key range of a scan that is
+    split into ranges and run in parallel (see scan_ranges.py).  The range
+    covers the keys after start_key up to and including end_key; an empty
+    start_key or end_key leaves that end open.  As with Counter, last_key is
+    the last key scanned so far.  All the ranges of a scan are in one entity
+    group, whose parent key is get_parent_key(scan_id), so that the last range
+    to finish can tell that it's the last one."""
+    scan_id = db.StringProperty()
+    index = db.IntegerProperty()
+    start_key = db.StringProperty(default='')
+    end_key = db.StringProperty(default='')
+    done = db.BooleanProperty(default=False)
+
+    @staticmethod
+    def get_parent_key(scan_id):
+        return db.Key.from_path('CounterScan', scan_id)
+
+    @classmethod
+    def get_range(cls, scan_id, index):
+        return cls.get_by_key_name(
+            str(index), parent=cls.get_parent_key(scan_id))
+
+    @classmethod
+    def get_ranges(cls, scan_id):
+        return cls.all().ancestor(cls.get_parent_key(scan_id)).fetch(1000)
+
+
 class Subscription(db.Model):
     """Subscription to notifications when a note is added to a person record"""
     repo = db.StringProperty(required=True)
@@ -1071,6 +1325,64 @@ class Subscription(db.Model):
         return query.fetch(limit)
 
 
+class DirtyPerson(db.Model):
+    """Marks a Person whose latest_status may be out of date because one of
+    its Notes was added, hidden or unhidden.  Key name: repo + ':' +
+    person_record_id, so a Person is marked at most once.  The
+    update_dirty_status task recomputes latest_status for the marked Persons
+    and removes the marks (see tasks.UpdateDirtyStatus)."""
+    repo = db.StringProperty(required=True)
+    person_record_id = db.StringProperty(required=True)
+    marked_time = db.DateTimeProperty(required=True)
+
+    @classmethod
+    def create_marks(cls, repo, person_record_ids):
+        """Creates the marks for the Persons with the given record IDs, for
+        the caller to store along with its own writes."""
+        import utils
+        now = utils.get_utcnow()
+        return [cls(key_name=repo + ':' + person_record_id, repo=repo,
+                    person_record_id=person_record_id, marked_time=now)
+                for person_record_id in set(person_record_ids)]
+
+    @classmethod
+    def mark(cls, repo, person_record_ids):
+        """Marks the Persons with the given record IDs."""
+        try:
+            db.put(cls.create_marks(repo, person_record_ids))
+        except Exception as e:
+            # The full update_status scan fixes any Person missed here.
+            logging.exception('Failed to mark persons: %s' % e)
+
+
+class DatacheckReport(db.Model):
+    """The findings of one run of the datachecks over the records of one kind
+    in a repository (see tasksmodule/datachecks.py).  Key name: repo + ':' +
+    kind_name + ':' + the start time in ISO 8601 format.  Only the first
+    MAX_FINDINGS findings are kept, to keep the entity small, but all of them
+    are counted in num_findings."""
+    MAX_FINDINGS = 1000
+
+    repo = db.StringProperty(required=True)
+    kind_name = db.StringProperty(required=True)
+    start_time = db.DateTimeProperty(required=True)
+    finish_time = db.DateTimeProperty()  # None while the run is going on
+    num_scanned = db.IntegerProperty(default=0)
+    num_findings = db.IntegerProperty(default=0)
+    findings = db.StringListProperty(indexed=False)
+
+    @classmethod
+    def create(cls, repo, kind_name, start_time):
+        key_name = '%s:%s:%s' % (repo, kind_name, start_time.isoformat())
+        return cls(key_name=key_name, repo=repo, kind_name=kind_name,
+                   start_time=start_time)
+
+    def add_findings(self, findings):
+        self.num_findings += len(findings)
+        self.findings.extend(
+            findings[:max(0, self.MAX_FINDINGS - len(self.findings))])
+
+
 class UserActionLog(db.Expando):
     """Logs user actions."""
     time = db.DateTimeProperty(required=True)
@@ -1102,7 +1414,7 @@ class UserActionLog(db.Expando):
                 if isinstance(value, db.Model):
                     value = value.key()
                 setattr(entry, kind + '_' + name, value)
-        entry.put()
+        action_log.add(entry)
 
 
 class UniqueId(db.Model):
@@ -1120,31 +1432,262 @@ class UsageCounter(db.Expando):
     To see how this is used, check out admin_statistics.py.
     Unlike the Counter class, UsageCounter object increments when
     a new record or a new note is created, which means, the UsageCounter
-    will not decrement when a record/note is expired/deleted."""
+    will not decrement when a record/note is expired/deleted.
+
+    The counts of a repository are split among NUM_SHARDS shard entities,
+    with key names "<repo>:<shard>", so that concurrent increments rarely
+    contend on the same entity group.  Each increment updates one shard
+    chosen at random, and the counts are the sums over all the shards.
+    Counters written before sharding have the key name "<repo>"; they are
+    counted as one more shard until migrate() folds them into shard 0."""
 
     # repo stored as a seperate property so it can be indexed and queried.
     repo = db.StringProperty(required=True)
 
+    NUM_SHARDS = 20
+
+    # get_counts() caches the counts in memcache for this many seconds.
+    COUNTS_NAMESPACE = 'usage_counter.counts'
+    COUNTS_TTL_SECONDS = 60
+
     @classmethod
     def create(cls, repo):
-        """Create a new counter"""
+        """Create a new unsharded counter"""
         return UsageCounter(key_name=repo, repo=repo)
 
+    @classmethod
+    def get_shard_key_name(cls, repo, shard):
+        return '%s:%d' % (repo, shard)
+
+    @classmethod
+    def get_all_shards(cls, repo):
+        """Gets the existing shard entities of a repository, including the
+        unsharded counter if it hasn't been migrated yet."""
+        key_names = [repo] + [cls.get_shard_key_name(repo, shard)
+                              for shard in xrange(cls.NUM_SHARDS)]
+        return [shard for shard in cls.get_by_key_name(key_names) if shard]
+
     @classmethod
     def get(cls, repo):
-        """Gets the entity with a given repository."""
-        return UsageCounter.get_by_key_name(repo)
+        """Gets the counts of a repository, summed over all the shards, as an
+        unsaved UsageCounter entity (which must not be put), or None if
+        nothing has been counted in the repository."""
+        shards = cls.get_all_shards(repo)
+        if not shards:
+            return None
+        total = cls(key_name=repo, repo=repo)
+        for shard in shards:
+            for counter_name in shard.dynamic_properties():
+                setattr(total, counter_name, getattr(total, counter_name, 0) +
+                        getattr(shard, counter_name))
+        return total
+
+    @classmethod
+    def get_counts(cls, repo):
+        """Gets the counts of a repository as a dictionary of counter names to
+        values.  The result may be up to COUNTS_TTL_SECONDS old."""
+        counts = memcache.get(repo, namespace=cls.COUNTS_NAMESPACE)
+        if counts is None:
+            total = cls.get(repo)
+            counts = dict(
+                (counter_name, getattr(total, counter_name))
+                for counter_name in (total and total.dynamic_properties() or []))
+            memcache.set(repo, counts, time=cls.COUNTS_TTL_SECONDS,
+                         namespace=cls.COUNTS_NAMESPACE)
+        return counts
 
     @classmethod
-    @db.transactional
     def increment_counter(cls, repo, counter_list, amount=1):
         """Increase the counter for the counter value
         based on the given amount. Each Counter has a dynamic property
         and is named based on a given counter_name."""
-        counter = cls.get(repo)
-        if not counter:
-            counter = cls.create(repo)
-        for counter_name in counter_list:
-            counter_value = getattr(counter, counter_name, 0)
-            setattr(counter, counter_name, counter_value + amount)
-        counter.put()
+        cls.increment_counters(
+            repo, dict((counter_name, amount) for counter_name in counter_list))
+
+    @classmethod
+    def increment_counters(cls, repo, amounts):
+        """Increases several counters at once, in a randomly chosen shard.
+        Args:
+            repo: The repository ID.
+            amounts: A dictionary of counter names to the amounts to add.
+        """
+        amounts = dict((name, amount) for name, amount in amounts.items()
+                       if amount)
+        if not amounts:
+            return
+        key_name = cls.get_shard_key_name(
+            repo, random.randrange(cls.NUM_SHARDS))
+        def increment_shard():
+            shard = (cls.get_by_key_name(key_name) or
+                     cls(key_name=key_name, repo=repo))
+            for counter_name, amount in amounts.items():
+                setattr(shard, counter_name,
+                        getattr(shard, counter_name, 0) + amount)
+            shard.put()
+        db.run_in_transaction(increment_shard)
+
+    @classmethod
+    def migrate(cls, repo):
+        """Folds the counts of the unsharded counter of a repository, if any,
+        into shard 0, and deletes the unsharded counter.  Returns True if
+        there was an unsharded counter."""
+        def fold_into_shard():
+            counter = cls.get_by_key_name(repo)
+            if not counter:
+                return False
+            key_name = cls.get_shard_key_name(repo, 0)
+            shard = (cls.get_by_key_name(key_name) or
+                     cls(key_name=key_name, repo=repo))
+            for counter_name in counter.dynamic_properties():
+                setattr(shard, counter_name, getattr(shard, counter_name, 0) +
+                        getattr(counter, counter_name))
+            shard.put()
+            counter.delete()
+            return True
+        return db.run_in_transaction_options(
+            db.create_transaction_options(xg=True), fold_into_shard)
+
+
+class LiveCounter(db.Expando):
+    """Counts with the same names as those of the person and note scans (see
+    Counter), kept up to date by the code that writes Persons and Notes, so
+    that the counts can be served without rescanning the repository.
+
+    Like UsageCounter, the counts of a repository and scan are split among
+    NUM_SHARDS shard entities, with key names "<repo>:<scan_name>:<shard>",
+    and each change updates one shard chosen at random.  The scans still run
+    now and then to fix any drift (e.g. from writes that don't go through
+    the counting code, or that fail halfway): when a scan finishes,
+    reconcile() stores the difference between its counts and the sum of the
+    shards in one more entity, "<repo>:<scan_name>:base".  Until the base
+    entity exists, there are no counts to serve, and get_counts() returns
+    None."""
+
+    repo = db.StringProperty(required=True)
+    scan_name = db.StringProperty(required=True)
+
+    NUM_SHARDS = 20
+
+    # The scans that are counted.
+    SCAN_NAMES = ['person', 'note']
+
+    @classmethod
+    def get_shard_key_name(cls, repo, scan_name, shard):
+        return '%s:%s:%s' % (repo, scan_name, shard)
+
+    @classmethod
+    def get_counts_by_shard(cls, repo, scan_name):
+        """Gets the base entity, or None if it doesn't exist, and a list of
+        the existing shard entities."""
+        key_names = [cls.get_shard_key_name(repo, scan_name, 'base')] + [
+            cls.get_shard_key_name(repo, scan_name, shard)
+            for shard in xrange(cls.NUM_SHARDS)]
+        entities = cls.get_by_key_name(key_names)
+        return entities[0], filter(None, entities[1:])
+
+    @staticmethod
+    def sum_counts(entities):
+        """Sums the counts of several entities, as a dictionary of encoded
+        count names (like Counter.get_all_counts) to counts."""
+        counts = {}
+        for entity in entities:
+            for name in entity.dynamic_properties():
+                if name.startswith('count_'):
+                    counts[name[6:]] = (
+                        counts.get(name[6:], 0) + getattr(entity, name))
+        return counts
+
+    @classmethod
+    def get_counts(cls, repo, scan_name):
+        """Gets the current counts of a repository and scan, as a dictionary
+        of encoded count names to nonzero counts, or None if the scan hasn't
+        been reconciled yet."""
+        base, shards = cls.get_counts_by_shard(repo, scan_name)
+        if not base:
+            return None
+        return dict((name, count) for name, count in
+                    cls.sum_counts([base] + shards).items() if count)
+
+    @classmethod
+    def increment_counters(cls, repo, scan_name, amounts):
+        """Adds to several counts at once, in a randomly chosen shard.
+        Args:
+            repo: The repository ID.
+            scan_name: The scan name, 'person' or 'note'.
+            amounts: A dictionary of count names to the amounts to add.
+        """
+        cls.increment_counters_multi(repo, {scan_name: amounts})
+
+    @classmethod
+    def increment_counters_multi(cls, repo, amounts_by_scan):
+        """Adds to the counts of several scans in one transaction, in a
+        randomly chosen shard of each.
+        Args:
+            repo: The repository ID.
+            amounts_by_scan: A dictionary of scan names to dictionaries of
+                count names to the amounts to add.
+        """
+        amounts_by_key_name = {}
+        for scan_name, amounts in amounts_by_scan.items():
+            amounts = dict((name, amount) for name, amount in amounts.items()
+                           if amount)
+            if amounts:
+                key_name = cls.get_shard_key_name(
+                    repo, scan_name, random.randrange(cls.NUM_SHARDS))
+                amounts_by_key_name[key_name] = (scan_name, amounts)
+        if not amounts_by_key_name:
+            return
+        def increment_shards():
+            key_names = amounts_by_key_name.keys()
+            shards = []
+            for key_name, shard in zip(key_names,
+                                       cls.get_by_key_name(key_names)):
+                scan_name, amounts = amounts_by_key_name[key_name]
+                shard = shard or cls(
+                    key_name=key_name, repo=repo, scan_name=scan_name)
+                for count_name, amount in amounts.items():
+                    prop_name = 'count_' + encode_count_name(count_name)
+                    setattr(shard, prop_name,
+                            getattr(shard, prop_name, 0) + amount)
+                shards.append(shard)
+            db.put(shards)
+        try:
+            # The shards of different scans are in different entity groups.
+            db.run_in_transaction_options(
+                db.create_transaction_options(
+                    xg=len(amounts_by_key_name) > 1),
+                increment_shards)
+        except Exception as e:
+            # The counts are only statistics, and the next reconciliation
+            # fixes them, so don't fail the write that's being counted.
+            logging.exception('Failed to update live counts: %s' % e)
+
+    @classmethod
+    def add_changes(cls, repo, scan_name, old_names, new_names):
+        """Updates the counts when a record that added to the counts in
+        old_names now adds to those in new_names."""
+        cls.add_changes_multi(repo, {scan_name: (old_names, new_names)})
+
+    @classmethod
+    def add_changes_multi(cls, repo, changes):
+        """Like add_changes, for several scans in one transaction, given a
+        dictionary of scan names to (old_names, new_names) pairs."""
+        cls.increment_counters_multi(repo, dict(
+            (scan_name, get_count_changes(old_names, new_names))
+            for scan_name, (old_names, new_names) in changes.items()))
+
+    @classmethod
+    def reconcile(cls, repo, scan_name, counter):
+        """Makes the counts match those of a finished scan, given its Counter.
+        Writes made while the scan was running may be counted twice or not at
+        all; the next scan fixes that."""
+        scan_counts = cls.sum_counts([counter])
+        base, shards = cls.get_counts_by_shard(repo, scan_name)
+        shard_counts = cls.sum_counts(shards)
+        base = cls(key_name=cls.get_shard_key_name(repo, scan_name, 'base'),
+                   repo=repo, scan_name=scan_name)
+        for name in set(scan_counts) | set(shard_counts):
+            setattr(base, 'count_' + name,
+                    scan_counts.get(name, 0) - shard_counts.get(name, 0))
+        base.put()
+        memcache.delete(repo + ':' + scan_name)
@@ -0,0 +1,167 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A snapshot of what the repository menus, the sitemap and the repository
+feeds show about each repository.
+
+Building the snapshot takes a query for the Repo entities, the settings of
+every repository and a count per repository that isn't deactivated.  Each
+instance keeps the last snapshot it built, and reuses it while it is younger
+than MAX_AGE_SECONDS and a version stamp in memcache hasn't changed.
+config.set() calls invalidate(), which bumps the stamp so that every instance
+rebuilds its snapshot on its next request; the admin pages always write
+settings along with Repo entities, so their Repo writes are covered too.
+"""
+
+import random
+import time
+
+from google.appengine.api import memcache
+
+import config
+import model
+
+NAMESPACE = 'repo_directory'
+VERSION_KEY = 'version'
+
+# How long a snapshot is used before it's rebuilt, so that the person counts
+# and any settings written outside of the admin pages are picked up.
+MAX_AGE_SECONDS = 600
+
+
+class RepoInfo(object):
+    """What the snapshot knows about one repository."""
+
+    def __init__(self, repo, entries, global_entries, person_count):
+        """Args:
+          repo: the Repo entity.
+          entries: the settings specific to the repository.
+          global_entries: the global settings.
+          person_count: the number of persons, rounded (see round_count).
+        """
+        self.repo_id = repo.key().name()
+        self.activation_status = repo.activation_status
+        self.test_mode = repo.test_mode
+        # These two fall back to the global settings, like config.get_for_repo.
+        self.titles = entries.get(
+            'repo_titles', global_entries.get('repo_titles')) or {}
+        self.language_menu_options = entries.get(
+            'language_menu_options',
+            global_entries.get('language_menu_options')) or []
+        # The repository feeds show these settings only for the repository.
+        self.feed_titles = entries.get('repo_titles') or {}
+        self.feed_language_menu_options = (
+            entries.get('language_menu_options') or [])
+        self.updated_date = entries.get('updated_date')
+        self.read_auth_key_required = entries.get('read_auth_key_required')
+        self.search_auth_key_required = entries.get('search_auth_key_required')
+        self.map_default_center = entries.get('map_default_center')
+        self.person_count = person_count
+
+    def is_launched(self):
+        return self.activation_status == model.Repo.ActivationStatus.ACTIVE
+
+    def get_title(self, lang):
+        """Gets the title in the given language, falling back to English and
+        then to any title."""
+        default_title = (self.titles.values() or ['?'])[0]
+        return self.titles.get(lang, self.titles.get('en', default_title))
+
+
+def round_count(count):
+    """Rounds a count to the hundreds; counts under 100 are shown as 0."""
+    if count < 100:
+        return 0
+    return int(round(count, -2))
+
+
+class RepoDirectory(object):
+    """A snapshot of all the repositories, in the order of their IDs."""
+
+    def __init__(self, repo_infos, version):
+        self.repo_infos = repo_infos
+        self.version = version
+        self.built_time = time.time()
+        self._by_id = dict((info.repo_id, info) for info in repo_infos)
+
+    def get(self, repo_id):
+        """Gets the RepoInfo of a repository, or None if it doesn't exist."""
+        return self._by_id.get(repo_id)
+
+    def list_launched(self):
+        """Returns the RepoInfos of the launched repositories."""
+        return [info for info in self.repo_infos if info.is_launched()]
+
+    def list_not_staging(self):
+        """Returns the RepoInfos of the launched and deactivated
+        repositories."""
+        return [info for info in self.repo_infos if info.activation_status !=
+                model.Repo.ActivationStatus.STAGING]
+
+
+def build(version=None):
+    """Builds a snapshot from the datastore."""
+    repos = list(model.Repo.all())
+    repo_ids = [repo.key().name() for repo in repos]
+    entries = config.cache.get_entries_multi(repo_ids + ['*'])
+    repo_infos = []
+    for repo in repos:
+        repo_id = repo.key().name()
+        person_count = 0
+        if not repo.is_deactivated():
+            person_count = round_count(
+                model.Counter.get_count(repo_id, 'person.all'))
+        repo_infos.append(RepoInfo(
+            repo, entries[repo_id], entries['*'], person_count))
+    return RepoDirectory(repo_infos, version)
+
+
+def get_version():
+    """Gets the current version stamp, or None if memcache is unavailable."""
+    version = memcache.get(VERSION_KEY, namespace=NAMESPACE)
+    if version is None:
+        # Restart from a random value rather than zero so that a snapshot
+        # built before the stamp was evicted can't match it again.
+        memcache.add(VERSION_KEY, random.getrandbits(62), namespace=NAMESPACE)
+        version = memcache.get(VERSION_KEY, namespace=NAMESPACE)
+    return version
+
+
+def invalidate():
+    """Makes every instance rebuild its snapshot.  Call this after writing
+    Repo entities or settings shown in the snapshot."""
+    global _directory
+    _directory = None
+    if memcache.incr(VERSION_KEY, namespace=NAMESPACE) is None:
+        get_version()
+
+
+# The snapshot last built on this instance.
+_directory = None
+
+
+def get():
+    """Gets an up-to-date snapshot, building it if necessary."""
+    global _directory
+    version = get_version()
+    directory = _directory
+    if (directory is None or version is None or
+            directory.version != version or
+            time.time() - directory.built_time > MAX_AGE_SECONDS):
+        directory = build(version)
+        # The version was read before building, so if a write happens in the
+        # meantime this snapshot is rebuilt on the next request.
+        if version is not None:
+            _directory = directory
+    return directory
@@ -0,0 +1,271 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures where requests spend their time.
+
+When the global setting enable_request_timing is true, each request records
+the count and total latency of its datastore and Search API calls (through
+API proxy hooks) and the time spent in sections of code wrapped in timer()
+(template rendering and search ranking).  When the request ends, the times
+are sent back in a Server-Timing response header, which browsers show in
+their developer tools, and added to per-endpoint histograms in memcache,
+which the admin request timing page summarizes as percentiles.
+
+When the setting is off, which is only checked once every
+ENABLED_CHECK_SECONDS, timer() returns a shared no-op context manager and the
+API proxy hooks return right away.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+import config
+
+NAMESPACE = 'request_timing'
+ENDPOINTS_KEY = 'endpoints'
+
+# The endpoint under which requests that match no route are recorded, so that
+# requests for arbitrary URLs can't add endpoints.
+OTHER_ENDPOINT = 'other'
+
+# How often each instance checks whether timing is enabled.
+ENABLED_CHECK_SECONDS = 60
+
+# The metrics recorded for each request.  RPC metrics are named after their
+# API service.
+METRICS = ['total', 'datastore', 'search', 'render', 'rank']
+RPC_METRICS = {'datastore_v3': 'datastore', 'search': 'search'}
+
+# The upper bounds of the histogram buckets, in milliseconds.  The last
+# bucket, past the last bound, holds everything slower.
+BUCKET_BOUNDS_MS = [5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+                    30000, 60000]
+
+_request = threading.local()
+
+_enabled = False
+_enabled_check_time = 0
+
+# The API proxy on which the hooks have been installed.
+_hooked_apiproxy = None
+
+# The endpoints this instance has added to the list of endpoints in memcache.
+_registered_endpoints = set()
+
+
+class RequestTiming(object):
+    """The times recorded during one request."""
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.seconds = {}
+        self.counts = {}
+        self.rpc_start_times = {}
+
+    def add(self, metric, seconds):
+        self.seconds[metric] = self.seconds.get(metric, 0) + seconds
+        self.counts[metric] = self.counts.get(metric, 0) + 1
+
+    def get_server_timing(self):
+        """Formats the times as the value of a Server-Timing header."""
+        entries = []
+        for metric in METRICS:
+            if metric in self.seconds:
+                entry = '%s;dur=%.1f' % (metric, self.seconds[metric] * 1000)
+                if metric in RPC_METRICS.values():
+                    entry += ';desc="%d calls"' % self.counts[metric]
+                entries.append(entry)
+        return ', '.join(entries)
+
+
+class _Timer(object):
+    def __init__(self, timing, metric):
+        self.timing = timing
+        self.metric = metric
+
+    def __enter__(self):
+        self.start_time = time.time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timing.add(self.metric, time.time() - self.start_time)
+
+
+class _NullTimer(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(metric):
+    """Returns a context manager that adds the time spent in it to the given
+    metric of the current request."""
+    timing = getattr(_request, 'timing', None)
+    if timing is None:
+        return _NULL_TIMER
+    return _Timer(timing, metric)
+
+
+def _before_rpc(service, call, request, response, rpc):
+    timing = getattr(_request, 'timing', None)
+    if timing is not None:
+        timing.rpc_start_times[id(rpc)] = time.time()
+
+
+def _after_rpc(service, call, request, response, rpc):
+    timing = getattr(_request, 'timing', None)
+    if timing is not None:
+        start_time = timing.rpc_start_times.pop(id(rpc), None)
+        if start_time is not None:
+            timing.add(RPC_METRICS[service], time.time() - start_time)
+
+
+def _install_hooks():
+    global _hooked_apiproxy
+    apiproxy = apiproxy_stub_map.apiproxy
+    if apiproxy is not _hooked_apiproxy:
+        for service in RPC_METRICS:
+            apiproxy.GetPreCallHooks().Append(
+                'request_timing', _before_rpc, service)
+            apiproxy.GetPostCallHooks().Append(
+                'request_timing', _after_rpc, service)
+        _hooked_apiproxy = apiproxy
+
+
+def is_enabled():
+    """Returns the enable_request_timing setting, as of at most
+    ENABLED_CHECK_SECONDS ago."""
+    global _enabled, _enabled_check_time
+    now = time.time()
+    if now - _enabled_check_time > ENABLED_CHECK_SECONDS:
+        _enabled = bool(config.get('enable_request_timing'))
+        _enabled_check_time = now
+    return _enabled
+
+
+def begin_request():
+    """Starts timing the current request, if timing is enabled."""
+    _request.timing = None
+    if is_enabled():
+        _install_hooks()
+        _request.timing = RequestTiming()
+
+
+def end_request(endpoint):
+    """Stops timing the current request and records its times under the
+    given endpoint name, which must be the name of a route or OTHER_ENDPOINT.
+
+    Returns:
+        The value for the Server-Timing header, or None if timing is off.
+    """
+    timing = getattr(_request, 'timing', None)
+    _request.timing = None
+    if timing is None:
+        return None
+    timing.add('total', time.time() - timing.start_time)
+    try:
+        record(endpoint, timing)
+    except Exception as e:
+        logging.warning('Failed to record request timing: %s' % e)
+    return timing.get_server_timing()
+
+
+def get_bucket(seconds):
+    return bisect.bisect_left(BUCKET_BOUNDS_MS, seconds * 1000)
+
+
+def get_histogram_key(endpoint, metric, bucket):
+    return '%s:%s:%d' % (endpoint, metric, bucket)
+
+
+def record(endpoint, timing):
+    """Adds the times of a request to the histograms of its endpoint."""
+    memcache.offset_multi(
+        dict((get_histogram_key(endpoint, metric, get_bucket(seconds)), 1)
+             for metric, seconds in timing.seconds.items()),
+        namespace=NAMESPACE, initial_value=0)
+    if endpoint not in _registered_endpoints:
+        register_endpoint(endpoint)
+        _registered_endpoints.add(endpoint)
+
+
+def register_endpoint(endpoint):
+    """Adds an endpoint to the list of endpoints in memcache."""
+    client = memcache.Client()
+    for attempt in range(3):
+        endpoints = client.gets(ENDPOINTS_KEY, namespace=NAMESPACE)
+        if endpoints is None:
+            if client.add(ENDPOINTS_KEY, [endpoint], namespace=NAMESPACE):
+                return
+        elif endpoint in endpoints or client.cas(
+                ENDPOINTS_KEY, endpoints + [endpoint], namespace=NAMESPACE):
+            return
+
+
+def get_endpoints():
+    return sorted(memcache.get(ENDPOINTS_KEY, namespace=NAMESPACE) or [])
+
+
+def get_histograms(endpoint):
+    """Gets the histograms of an endpoint, as a dictionary of each metric to
+    the list of its counts in each bucket."""
+    buckets = range(len(BUCKET_BOUNDS_MS) + 1)
+    counts = memcache.get_multi(
+        [get_histogram_key(endpoint, metric, bucket)
+         for metric in METRICS for bucket in buckets], namespace=NAMESPACE)
+    return dict(
+        (metric, [counts.get(get_histogram_key(endpoint, metric, bucket), 0)
+                  for bucket in buckets])
+        for metric in METRICS)
+
+
+def get_percentile(histogram, percent):
+    """Estimates a percentile from a histogram, as the upper bound in
+    milliseconds of the bucket that contains it, or None if it's past the
+    last bound."""
+    threshold = sum(histogram) * percent / 100.0
+    total = 0
+    for bound, count in zip(BUCKET_BOUNDS_MS, histogram):
+        total += count
+        if total >= threshold:
+            return bound
+    return None
+
+
+class RequestTimingMiddleware(object):
+    """Django middleware that times each request and adds the Server-Timing
+    header to its response."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            match = getattr(request, 'resolver_match', None)
+            server_timing = end_request(
+                match and match.url_name or OTHER_ENDPOINT)
+        if server_timing:
+            response['Server-Timing'] = server_timing
+        return response
@@ -24,13 +24,15 @@ Similar to App Engine's app versions, there is a concept of an "active bundle"
 from which resources are obtained.  Previewing or releasing a new set of
 resources is a matter of setting the active bundle."""
 
-import datetime
+import collections
+import hashlib
 import logging
 import os
 import utils
 
 import django.template
 import django.template.base
+import django.template.loader
 
 from google.appengine.ext import db
 from google.appengine.ext import webapp
@@ -119,23 +121,94 @@ from google.appengine.ext import webapp
 #     > self.response.out.write(rendered_string)
 
 
+# The approximate memory used by a cache entry beyond the size of its value.
+ENTRY_OVERHEAD_BYTES = 200
+
+# The default capacity of a RamCache.
+DEFAULT_MAX_BYTES = 16 << 20
+
+# How often a RamCache scans for expired entries that haven't been read.
+SWEEP_INTERVAL_SECONDS = 60
+
+
+def get_size(value):
+    """Estimates the memory used by a cached value, in bytes."""
+    if isinstance(value, Resource):
+        return len(value.content or '') + ENTRY_OVERHEAD_BYTES
+    if isinstance(value, django.template.Template):
+        # A compiled template takes a few times the size of its source.
+        return 4 * len(value.source or '') + ENTRY_OVERHEAD_BYTES
+    if isinstance(value, basestring):
+        return len(value) + ENTRY_OVERHEAD_BYTES
+    return ENTRY_OVERHEAD_BYTES
+
+
 class RamCache:
-    def __init__(self):
-        self.cache = {}
+    """A least-recently-used cache whose entries expire after a time to live,
+    holding at most max_bytes (as estimated by get_size).  Expired entries
+    are dropped when they are read, and by a sweep at most once every
+    SWEEP_INTERVAL_SECONDS when entries are added."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.cache = collections.OrderedDict()  # key -> (value, expiry, size)
+        self.size = 0
+        self.next_sweep = 0
+        self.hit_count = 0
+        self.miss_count = 0
+        self.evict_count = 0
+        self.expire_count = 0
 
     def clear(self):
         self.cache.clear()
+        self.size = 0
+
+    def _delete(self, key):
+        value, expiry, size = self.cache.pop(key)
+        self.size -= size
 
     def put(self, key, value, ttl_seconds):
-        if ttl_seconds > 0:
-            expiry = utils.get_utcnow() + datetime.timedelta(0, ttl_seconds)
-            self.cache[key] = (value, expiry)
+        if ttl_seconds <= 0:
+            return
+        now = utils.get_utcnow_timestamp()
+        if now >= self.next_sweep:
+            self.sweep(now)
+        if key in self.cache:
+            self._delete(key)
+        size = get_size(value)
+        self.cache[key] = (value, now + ttl_seconds, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._delete(next(iter(self.cache)))
+            self.evict_count += 1
 
     def get(self, key):
-        if key in self.cache:
-            value, expiry = self.cache[key]
-            if utils.get_utcnow() < expiry:
+        entry = self.cache.pop(key, None)
+        if entry:
+            value, expiry, size = entry
+            if utils.get_utcnow_timestamp() < expiry:
+                self.cache[key] = entry  # move to the most recently used end
+                self.hit_count += 1
                 return value
+            self.size -= size
+            self.expire_count += 1
+        self.miss_count += 1
+
+    def sweep(self, now):
+        """Drops the expired entries."""
+        for key, (value, expiry, size) in self.cache.items():
+            if now >= expiry:
+                self._delete(key)
+                self.expire_count += 1
+        self.next_sweep = now + SWEEP_INTERVAL_SECONDS
+
+    def stats(self):
+        """Returns a dictionary of the size and the hit, miss, eviction and
+        expiry counts of this cache."""
+        return {'entries': len(self.cache), 'bytes': self.size,
+                'max_bytes': self.max_bytes, 'hits': self.hit_count,
+                'misses': self.miss_count, 'evictions': self.evict_count,
+                'expirations': self.expire_count}
 
 
 class ResourceBundle(db.Model):
@@ -189,31 +262,59 @@ class Resource(db.Model):
                 Resource.load_from_file(name))
 
     def get_template(self):
-        """Compiles the content of this resource into a Template object."""
+        """Compiles the content of this resource into a Template object.  The
+        compiled template is cached beyond the lifetime of this Resource, for
+        as long as the resource isn't modified."""
         if not hasattr(self, 'template'):
-            try:
-                self.template = django.template.Template(
-                    self.content.decode('utf-8'),
-                    origin=django.template.base.Origin('Resource'),
-                    name=self.key().name())
-            except:
-                # Exception here is silently ignored otherwise.
-                logging.error(
-                    'Error loading template %s.' % self.key().name(),
-                    exc_info=True)
-                self.template = django.template.Template(
-                    'Internal Server Error',
-                    origin=django.template.base.Origin('Resource'),
-                    name=self.key().name())
+            if self.is_saved():
+                cache_key = (self.key(), self.last_modified)
+            else:
+                # Resources loaded from files are created afresh each time,
+                # with a new last_modified, so they're keyed on their content.
+                cache_key = (self.key().name(),
+                             hashlib.sha1(self.content).hexdigest())
+            self.template = TEMPLATE_CACHE.get(cache_key)
+            if self.template is None:
+                self.template = self.compile_template()
+                TEMPLATE_CACHE.put(
+                    cache_key, self.template, TEMPLATE_CACHE_SECONDS)
         return self.template
 
+    def compile_template(self):
+        try:
+            return django.template.Template(
+                self.content.decode('utf-8'),
+                origin=django.template.base.Origin('Resource'),
+                name=self.key().name())
+        except:
+            # Exception here is silently ignored otherwise.
+            logging.error(
+                'Error loading template %s.' % self.key().name(),
+                exc_info=True)
+            return django.template.Template(
+                'Internal Server Error',
+                origin=django.template.base.Origin('Resource'),
+                name=self.key().name())
+
+
+# How long compiled templates are kept.  They are keyed on the resource and
+# its modification time, or the content of a file, so they never go stale.
+TEMPLATE_CACHE_SECONDS = 3600
 
 LOCALIZED_CACHE = RamCache()  # contains Resource objects
 RENDERED_CACHE = RamCache()  # contains strings of rendered content
+TEMPLATE_CACHE = RamCache()  # contains compiled Template objects
 
 def clear_caches():
     LOCALIZED_CACHE.clear()
     RENDERED_CACHE.clear()
+    TEMPLATE_CACHE.clear()
+
+def get_cache_stats():
+    """Returns the stats of each cache, by cache name."""
+    return {'localized': LOCALIZED_CACHE.stats(),
+            'rendered': RENDERED_CACHE.stats(),
+            'template': TEMPLATE_CACHE.stats()}
 
 active_bundle_name = '1'
 
@@ -272,3 +373,39 @@ def render_in_lang(template, lang, vars):
         return template.render(django.template.Context(vars))
     finally:
         django.utils.translation.activate(original_lang)
+
+def warm_up(langs, bundle_name=None):
+    """Compiles the templates of a bundle (by default, the active bundle),
+    including their variants localized in the given languages, and loads the
+    templates of the Django views into the engine's cached loader, so that
+    the first request in each language doesn't pay for their compilation.
+    Returns the number of bundle and file templates compiled."""
+    bundle_name = bundle_name or active_bundle_name
+    bundle = ResourceBundle.get_by_key_name(bundle_name)
+    resources = []
+    if bundle:
+        resources += Resource.get_by_key_name(
+            [name for name in bundle.list_resources()
+             if is_template_for(name, langs)], parent=bundle)
+    file_names = Resource.list_files()
+    resources += [Resource.load_from_file(name) for name in file_names
+                  if is_template_for(name, langs)]
+    count = 0
+    for resource in resources:
+        if resource:
+            resource.get_template()
+            count += 1
+    for name in file_names:
+        if name.endswith('.template') and ':' not in name:
+            try:
+                django.template.loader.get_template(name)
+            except Exception:
+                # This is reported again when the template is used.
+                logging.exception('Error loading template %s.' % name)
+    return count
+
+def is_template_for(name, langs):
+    """Returns True if a resource name is a template that is generic or
+    localized in one of the given languages."""
+    base_name, _, lang = name.partition(':')
+    return base_name.endswith('.template') and (not lang or lang in langs)
@@ -82,7 +82,8 @@ class Handler(BaseHandler):
         """
 
         searcher = Searcher(
-            self.repo, config.get('enable_fulltext_search'), MAX_RESULTS)
+            self.repo, config.get('enable_fulltext_search'), MAX_RESULTS,
+            use_cache=True)
         results = searcher.search(
             query_dict['name'],
             query_dict.get('location'))
@@ -0,0 +1,143 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Splits a scan of a repository's records into key ranges that can be
+scanned in parallel.
+
+The records of a repository have key names that start with the repository ID
+and a colon, so they are contiguous in key order.  The split keys are chosen
+from the keys that the datastore returns in __scatter__ order, which are a
+small random sample of the kind; when there are too few of them in the
+repository (as there are for small repositories, or on the development
+server), they are chosen from the repository's first keys instead.
+
+Each range's progress and partial counts are kept in a model.CounterRange,
+and when the last range is done, finish_range() adds up the counts of all
+the ranges into one Counter, like that of a scan that wasn't split.
+"""
+
+import datetime
+import time
+
+from google.appengine.api import datastore
+from google.appengine.ext import db
+
+import model
+import utils
+
+# How many __scatter__ keys to sample for each range.
+SCATTER_SAMPLES_PER_RANGE = 32
+
+# When sampling a repository's first keys instead, the most keys to fetch.
+MAX_KEY_SAMPLES = 10000
+
+# A scan whose ranges have made no progress in this long is abandoned, so
+# that a new one can start.
+STALE_SCAN_AGE = datetime.timedelta(days=1)
+
+
+def pick_split_keys(keys, num_ranges):
+    """Picks up to num_ranges - 1 keys from a sorted list of keys that split
+    it into parts of about the same size."""
+    split_keys = []
+    for i in range(1, num_ranges):
+        key = keys[len(keys) * i // num_ranges] if keys else None
+        if key and key not in split_keys:
+            split_keys.append(key)
+    return split_keys
+
+
+def get_split_keys(query, repo, num_ranges):
+    """Gets up to num_ranges - 1 keys that split the records that a query
+    finds in a repository into ranges of about the same size.
+
+    Args:
+        query: A db.Query for records of the repository.
+        repo: The repository ID.
+        num_ranges: The number of ranges wanted.
+
+    Returns:
+        A sorted list of keys, as strings.
+    """
+    kind = query._model_class.kind()
+    prefix = repo + ':'
+    scatter_query = datastore.Query(kind, keys_only=True)
+    scatter_query.Order('__scatter__')
+    keys = sorted(
+        key for key in scatter_query.Get(num_ranges * SCATTER_SAMPLES_PER_RANGE)
+        if (key.name() or '').startswith(prefix))
+    if len(keys) < num_ranges * 2:
+        # Sample the repository's first keys instead; if there are more
+        # than MAX_KEY_SAMPLES of them, the last range gets the rest.
+        keys = db.Query(query._model_class, keys_only=True).filter(
+            'repo =', repo).order('__key__').fetch(MAX_KEY_SAMPLES)
+    return [str(key) for key in pick_split_keys(keys, num_ranges)]
+
+
+def get_running_scan_id(repo, scan_name):
+    """Gets the ID of the split scan of a repository that is in progress, or
+    None if there isn't one."""
+    cutoff = utils.get_utcnow() - STALE_SCAN_AGE
+    for counter_range in model.CounterRange.all().filter(
+            'repo =', repo).filter('scan_name =', scan_name).filter(
+            'done =', False).fetch(10):
+        if counter_range.timestamp > cutoff:
+            return counter_range.scan_id
+
+
+def create_ranges(repo, scan_name, split_keys):
+    """Stores the ranges of a new split scan and returns them."""
+    scan_id = '%s-%s-%d' % (repo, scan_name, int(time.time()*1000))
+    bounds = [''] + split_keys + ['']
+    ranges = [
+        model.CounterRange(
+            key_name=str(index),
+            parent=model.CounterRange.get_parent_key(scan_id),
+            repo=repo, scan_name=scan_name, scan_id=scan_id, index=index,
+            start_key=bounds[index], end_key=bounds[index + 1],
+            last_key=bounds[index])
+        for index in range(len(bounds) - 1)]
+    db.put(ranges)
+    return ranges
+
+
+def finish_range(counter_range):
+    """Marks a range as done.  If it was the last range of its scan to be
+    done, returns an unsaved Counter with the sums of the counts of all the
+    ranges and deletes the ranges; otherwise returns None."""
+    def mark_done():
+        stored_range = model.CounterRange.get_range(
+            counter_range.scan_id, counter_range.index)
+        if not stored_range or stored_range.done:
+            return False
+        # This range is still counted here, as it isn't marked done yet.
+        remaining = model.CounterRange.all().ancestor(
+            model.CounterRange.get_parent_key(counter_range.scan_id)).filter(
+            'done =', False).count()
+        counter_range.done = True
+        counter_range.put()
+        return remaining == 1
+    if not db.run_in_transaction(mark_done):
+        return None
+
+    ranges = model.CounterRange.get_ranges(counter_range.scan_id)
+    counter = model.Counter(
+        repo=counter_range.repo, scan_name=counter_range.scan_name)
+    for done_range in ranges:
+        for name in done_range.dynamic_properties():
+            if name.startswith('count_'):
+                setattr(counter, name,
+                        getattr(counter, name, 0) + getattr(done_range, name))
+    db.delete(ranges)
+    return counter
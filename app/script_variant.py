@@ -14,7 +14,9 @@
 # limitations under the License.
 
 
+import compiled_dictionary
 import jautils
+import lru_cache
 
 from unidecode import unidecode
 
@@ -50,8 +52,17 @@ def read_dictionary(file_name):
         return None
     return dictionary
 
-JAPANESE_NAME_LOCATION_DICTIONARY = read_dictionary('japanese_name_location_dict.txt')
-CHINESE_FAMILY_NAME_DICTIONARY = read_dictionary('chinese_family_name_dict.txt')
+# The dictionaries are loaded when they're first used, from their compiled
+# form if tools/compile_dictionaries has been run (see compiled_dictionary.py).
+JAPANESE_NAME_LOCATION_DICTIONARY = compiled_dictionary.LazyDictionary(
+    'japanese_name_location_dict.txt', read_dictionary)
+CHINESE_FAMILY_NAME_DICTIONARY = compiled_dictionary.LazyDictionary(
+    'chinese_family_name_dict.txt', read_dictionary)
+
+# The maximum number of romanizations remembered by romanize().
+ROMANIZATION_CACHE_SIZE = 20000
+
+ROMANIZATION_CACHE = lru_cache.LruCache(ROMANIZATION_CACHE_SIZE)
 
 def has_kanji(word):
     """
@@ -113,10 +124,10 @@ def romanize_japanese_word(word, for_index=True):
         # it can still return romanization "yamadataro".
         first_part = word[:index]
         last_part = word[index:]
-        romanized_first_parts = romanize_single_japanese_word(
-            first_part)
-        romanized_last_parts = romanize_single_japanese_word(
-            last_part)
+        romanized_first_parts = romanize(
+            romanize_single_japanese_word, first_part)
+        romanized_last_parts = romanize(
+            romanize_single_japanese_word, last_part)
         for romanized_first_part in romanized_first_parts:
             for romanized_last_part in romanized_last_parts:
                 if (romanized_first_part != first_part and
@@ -219,7 +230,8 @@ def romanize_search_query(word):
 
     romanized_words = []
     if has_kanji(word):
-        romanized_words = romanize_japanese_word(word, for_index=False)
+        romanized_words = romanize(
+            romanize_japanese_word, word, for_index=False)
 
     if jautils.should_normalize(word):
         hiragana_word = jautils.normalize(word)
@@ -229,10 +241,49 @@ def romanize_search_query(word):
     # a different result, append the result to the romanzied_words with
     # unidecode results together
     unidecode_romanize_word = unidecode(word).strip()
-    chinese_romanize_list = romanize_chinese_name(word)
+    chinese_romanize_list = romanize(romanize_chinese_name, word)
     chinese_romanize_word = chinese_romanize_list[0] if chinese_romanize_list else ''
     if chinese_romanize_word and chinese_romanize_word != unidecode_romanize_word:
         romanized_words.append(chinese_romanize_word)
     romanized_words.append(unidecode_romanize_word)
 
     return romanized_words
+
+
+# Romanize methods whose result depends on the for_index argument.
+FOR_INDEX_METHODS = [romanize_japanese_word]
+
+
+def romanize(romanize_method, word, for_index=True):
+    """
+    Romanizes a word with romanize_method, remembering the results so that
+    the same word is romanized only once, whether it appears in records being
+    indexed or in search queries.
+    Args:
+        romanize_method: one of the romanize methods in this module.
+        word: the word to romanize.
+        for_index: passed to the romanize methods which accept it.
+    Returns:
+        a new list with the results of romanize_method(word).
+    """
+    if romanize_method not in FOR_INDEX_METHODS:
+        # Share one entry for both uses.
+        for_index = True
+    key = (romanize_method.__name__, word, for_index)
+    romanized_words = ROMANIZATION_CACHE.get(key)
+    if romanized_words is None:
+        if romanize_method in FOR_INDEX_METHODS:
+            romanized_words = romanize_method(word, for_index=for_index)
+        else:
+            romanized_words = romanize_method(word)
+        romanized_words = tuple(romanized_words)
+        ROMANIZATION_CACHE.put(key, romanized_words)
+    # Callers may modify the list they get.
+    return list(romanized_words)
+
+
+def get_romanization_stats():
+    """
+    Returns the size, hit, miss and eviction counts of the romanization cache.
+    """
+    return ROMANIZATION_CACHE.stats()
@@ -0,0 +1,147 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A cache of search results, shared by all instances through memcache.
+
+Cached results are the record IDs of the matching persons, so the persons
+themselves are always loaded fresh from the datastore.  Each repository has a
+write generation that is part of every cache key; any write that can change
+search results calls invalidate(), which bumps the generation so that entries
+cached before the write are never read again.
+
+The searches themselves run eventually consistent queries, which can miss a
+write for a short while after it is made.  So results are only cached when the
+search started at least SETTLE_SECONDS after the last write; a search that
+misses a write can then only be cached if the write took longer than that to
+show up, and even then it's served for at most RESULTS_TTL_SECONDS.
+"""
+
+import hashlib
+import time
+
+from google.appengine.api import memcache
+
+import lru_cache
+
+GENERATION_NAMESPACE = 'search.generation'
+RESULTS_NAMESPACE = 'search.results'
+STATS_NAMESPACE = 'search.stats'
+
+# How long cached results live in memcache, in seconds.
+RESULTS_TTL_SECONDS = 600
+
+# How long after a write searches aren't cached, in seconds, so that the
+# write has time to show up in the eventually consistent search queries.
+SETTLE_SECONDS = 10
+
+# The number of results kept in each instance's local cache.
+LOCAL_CACHE_SIZE = 200
+
+
+# A small least-recently-used cache of search results local to this instance,
+# which saves the memcache round trip for the hottest queries.
+_local_cache = lru_cache.LruCache(LOCAL_CACHE_SIZE)
+
+# Hit and miss counts of this instance since it started.
+local_stats = {'hits': 0, 'local_hits': 0, 'misses': 0}
+
+
+def get_generation(repo):
+    """Gets the current write generation of a repository."""
+    generation = memcache.get(repo, namespace=GENERATION_NAMESPACE)
+    if generation is None:
+        # The counter has never been set or was evicted.  Restart it from the
+        # current time rather than zero so that the generations used before
+        # the eviction can't come back and expose stale local entries.
+        memcache.add(repo, int(time.time() * 1000),
+                     namespace=GENERATION_NAMESPACE)
+        generation = memcache.get(repo, namespace=GENERATION_NAMESPACE) or 0
+    return generation
+
+
+def get_invalidated_key(repo):
+    """Returns the memcache key of the time of the repository's last write."""
+    return repo + ':invalidated'
+
+
+def invalidate(repo):
+    """Invalidates all cached search results for a repository.  Call this after
+    any write that can add, remove, or rename searchable persons."""
+    memcache.set(get_invalidated_key(repo), time.time(),
+                 namespace=GENERATION_NAMESPACE)
+    if memcache.incr(repo, namespace=GENERATION_NAMESPACE) is None:
+        get_generation(repo)
+
+
+def get_stats(repo):
+    """Returns the hit and miss counts for a repository across all instances,
+    as a dictionary with the keys 'hits' and 'misses'."""
+    counts = memcache.get_multi(
+        ['hits', 'misses'], key_prefix=repo + ':', namespace=STATS_NAMESPACE)
+    return {'hits': counts.get('hits', 0), 'misses': counts.get('misses', 0)}
+
+
+class ResultCache(object):
+    """Looks up and stores the results of one search in a repository."""
+
+    def __init__(self, repo, backend, query, max_results):
+        """Args:
+          repo: The repository ID.
+          backend: The name of the search backend that produces the results.
+          query: The normalized query.
+          max_results: The maximum number of results of the search.
+        """
+        self._repo = repo
+        self._start_time = time.time()
+        self._generation = get_generation(repo)
+        query_hash = hashlib.sha1(query.encode('utf-8')).hexdigest()
+        self._key = '%s:%d:%s:%d:%s' % (
+            repo, self._generation, backend, max_results, query_hash)
+
+    def get(self):
+        """Returns the cached record IDs, or None if they're not cached."""
+        record_ids = _local_cache.get(self._key)
+        if record_ids is not None:
+            local_stats['local_hits'] += 1
+        else:
+            record_ids = memcache.get(self._key, namespace=RESULTS_NAMESPACE)
+            if record_ids is not None:
+                _local_cache.put(self._key, record_ids)
+        if record_ids is None:
+            local_stats['misses'] += 1
+            self._count('misses')
+        else:
+            local_stats['hits'] += 1
+            self._count('hits')
+        return record_ids
+
+    def put(self, record_ids):
+        """Caches the record IDs of the results, unless the repository was
+        written since the generation was read or less than SETTLE_SECONDS
+        before, in which case the search may or may not have seen the write
+        and the results are dropped."""
+        invalidated_key = get_invalidated_key(self._repo)
+        values = memcache.get_multi(
+            [self._repo, invalidated_key], namespace=GENERATION_NAMESPACE)
+        if values.get(self._repo) != self._generation:
+            return
+        if self._start_time - values.get(invalidated_key, 0) < SETTLE_SECONDS:
+            return
+        _local_cache.put(self._key, record_ids)
+        memcache.set(self._key, record_ids, time=RESULTS_TTL_SECONDS,
+                     namespace=RESULTS_NAMESPACE)
+
+    def _count(self, name):
+        memcache.incr(self._repo + ':' + name, namespace=STATS_NAMESPACE,
+                      initial_value=0)
@@ -13,18 +13,22 @@
 # limitations under the License.
 
 
+from search import result_cache
 from text_query import TextQuery
 import full_text_search
 import indexing
+import model
 
 
 class Searcher(object):
     """A utility class for searching person records in repositories."""
 
-    def __init__(self, repo, enable_fulltext_search, max_results):
+    def __init__(self, repo, enable_fulltext_search, max_results,
+                 use_cache=False):
         self._repo = repo
         self._enable_fulltext_search = enable_fulltext_search
         self._max_results = max_results
+        self._use_cache = use_cache
 
     def search(self, query_name, query_location=None):
         """Get results for a query.
@@ -33,6 +37,38 @@ class Searcher(object):
           query_name: A name to query for (string).
           query_location: A location to query for (optional, string).
         """
+        if not self._use_cache:
+            return self._search(query_name, query_location)
+        cache = result_cache.ResultCache(
+            self._repo,
+            'fulltext' if self._enable_fulltext_search else 'indexing',
+            self._normalize_query(query_name, query_location),
+            self._max_results)
+        record_ids = cache.get()
+        if record_ids is not None:
+            # The persons may have expired since the results were cached.
+            return [person for person in
+                    model.Person.get_all(self._repo, record_ids)
+                    if not person.is_expired]
+        results = self._search(query_name, query_location)
+        cache.put([person.record_id for person in results])
+        return results
+
+    def _normalize_query(self, query_name, query_location):
+        """Returns the query as the search backend would see it, so that
+        equivalent queries share a cache entry."""
+        if self._enable_fulltext_search:
+            # The full-text query syntax is sensitive to the exact input.
+            return u'%s\n%s' % (query_name, query_location or u'')
+        return self._make_text_query(query_name, query_location).normalized
+
+    def _make_text_query(self, query_name, query_location):
+        return TextQuery(
+            '%s %s' % (query_name, query_location)
+            if query_location
+            else query_name)
+
+    def _search(self, query_name, query_location):
         if self._enable_fulltext_search:
             query_dict = {'name': query_name}
             if query_location:
@@ -40,9 +76,6 @@ class Searcher(object):
             return full_text_search.search(
                 self._repo, query_dict, self._max_results)
         else:
-            text_query = TextQuery(
-                '%s %s' % (query_name, query_location)
-                if query_location
-                else query_name)
+            text_query = self._make_text_query(query_name, query_location)
             return indexing.search(
                 self._repo, text_query, self._max_results)
@@ -25,13 +25,17 @@ from google.appengine.api import quota
 from google.appengine.api import taskqueue
 from google.appengine.ext import db
 
+import action_log
 import cloud_storage
 import config
 import const
+import full_text_search
+import indexing
 import model
 import photo
 import pfif
 import record_writer
+import scan_ranges
 import utils
 
 
@@ -136,20 +140,28 @@ class CleanUpInTestMode(utils.BaseHandler):
         self.__listener = listener
 
 
-def run_count(make_query, update_counter, counter):
-    """Scans the entities matching a query up to FETCH_LIMIT.
+def run_count(make_query, update_counter, counter, start_batch=None,
+              end_key=''):
+    """Scans the entities matching a query up to FETCH_LIMIT.  If start_batch
+    is given, it's called with the counter and the list of entities before
+    they are passed to update_counter.  If end_key is given, the scan stops
+    after that key.
     
     Returns False if we finished counting all entries."""
     # Get the next batch of entities.
     query = make_query()
     if counter.last_key:
         query = query.filter('__key__ >', db.Key(counter.last_key))
+    if end_key:
+        query = query.filter('__key__ <=', db.Key(end_key))
     entities = query.order('__key__').fetch(FETCH_LIMIT)
     if not entities:
         counter.last_key = ''
         return False
 
     # Pass the entities to the counting function.
+    if start_batch:
+        start_batch(counter, entities)
     for entity in entities:
         update_counter(counter, entity)
 
@@ -167,31 +179,104 @@ class CountBase(utils.BaseHandler):
     SCAN_NAME = ''  # Each subclass should choose a unique scan_name.
     ACTION = ''  # Each subclass should set the action path that it handles.
 
+    # Subclasses may set this to split the scan of each repository into up
+    # to this many key ranges, each scanned by its own chain of tasks (see
+    # scan_ranges.py).  The counts of the ranges are added up in the end, and
+    # finish_scan gets the total.  The ranges run concurrently, and a batch
+    # may be scanned again after a deadline, so any writes that update_counter
+    # or finish_batch make must be safe to repeat for an entity and must not
+    # depend on the other ranges.
+    NUM_RANGES = 1
+
     # App Engine issues HTTP requests to tasks.
     https_required = False
 
     def get(self):
         if self.repo:  # Do some counting.
-            try:
-                counter = model.Counter.get_unfinished_or_create(
-                    self.repo, self.SCAN_NAME)
-                entities_remaining = True
-                while entities_remaining:
-                    # Batch the db updates.
-                    for _ in xrange(100):
-                        entities_remaining = run_count(
-                            self.make_query, self.update_counter, counter)
-                        if not entities_remaining:
-                            break
-                    # And put the updates at once.
-                    counter.put()
-            except runtime.DeadlineExceededError:
-                # Continue counting in another task.
-                self.add_task_for_repo(self.repo, self.SCAN_NAME, self.ACTION)
+            scan_id = self.request.get('scan_id')
+            if scan_id:
+                self.count_range(scan_id, int(self.request.get('range')))
+            elif self.NUM_RANGES > 1:
+                self.start_ranges()
+            else:
+                self.count()
         else:  # Launch counting tasks for all repositories.
             for repo in model.Repo.list():
                 self.add_task_for_repo(repo, self.SCAN_NAME, self.ACTION)
 
+    def count(self):
+        try:
+            counter = model.Counter.get_unfinished_or_create(
+                self.repo, self.SCAN_NAME)
+            if not counter.last_key:
+                self.start_scan()
+            self.run_counter(counter)
+            self.finish_scan(counter)
+            counter.put()
+        except runtime.DeadlineExceededError:
+            # Continue counting in another task.
+            self.add_task_for_repo(self.repo, self.SCAN_NAME, self.ACTION)
+
+    def run_counter(self, counter, end_key=''):
+        """Scans until there are no entities left (up to end_key, if given),
+        putting the counter after every 100 batches."""
+        entities_remaining = True
+        while entities_remaining:
+            # Batch the db updates.
+            for _ in xrange(100):
+                entities_remaining = run_count(
+                    self.make_query, self.update_counter, counter,
+                    self.start_batch, end_key)
+                self.finish_batch(counter)
+                if not entities_remaining:
+                    break
+            if entities_remaining:
+                # And put the updates at once.
+                counter.put()
+
+    def start_ranges(self):
+        """Splits the scan of the repository into key ranges and starts a
+        chain of tasks for each range, unless a split scan is running."""
+        if scan_ranges.get_running_scan_id(self.repo, self.SCAN_NAME):
+            return
+        split_keys = scan_ranges.get_split_keys(
+            self.make_query(), self.repo, self.NUM_RANGES)
+        ranges = scan_ranges.create_ranges(self.repo, self.SCAN_NAME, split_keys)
+        self.start_scan()
+        try:
+            for counter_range in ranges:
+                self.add_range_task(counter_range.scan_id, counter_range.index)
+        except Exception:
+            # A range without a task would never finish, and would keep new
+            # scans from starting until it went stale, so drop the whole scan.
+            # The tasks that were added find no range and do nothing.
+            logging.exception('Failed to start the ranges of %s' %
+                              ranges[0].scan_id)
+            db.delete(ranges)
+            raise
+
+    def add_range_task(self, scan_id, index):
+        # Task names end in the time in milliseconds, so the names of tasks
+        # added in the same millisecond differ only by the range index.
+        self.add_task_for_repo(
+            self.repo, '%s-%s-range-%d' % (self.SCAN_NAME, scan_id, index),
+            self.ACTION, scan_id=scan_id, range=index)
+
+    def count_range(self, scan_id, index):
+        counter_range = model.CounterRange.get_range(scan_id, index)
+        if not counter_range or counter_range.done:
+            return
+        try:
+            self.run_counter(counter_range, counter_range.end_key)
+        except runtime.DeadlineExceededError:
+            # Continue counting this range in another task.
+            self.add_range_task(scan_id, index)
+            return
+        counter = scan_ranges.finish_range(counter_range)
+        if counter:
+            self.finish_scan(counter)
+            counter.put()
+
     def make_query(self):
         """Subclasses should implement this.  This will be called to get the
         datastore query; it should always return the same query."""
@@ -201,59 +286,103 @@ class CountBase(utils.BaseHandler):
         each entity that matches the query; it should call increment() on
         the counter object for whatever accumulators it wants to increment."""
 
+    def start_scan(self):
+        """Subclasses may implement this.  This will be called once when a
+        new scan of the repository starts, before the first batch."""
+
+    def start_batch(self, counter, entities):
+        """Subclasses may implement this.  This will be called with each batch
+        of entities before they are passed to update_counter, so data for the
+        whole batch can be fetched at once."""
+
+    def finish_batch(self, counter):
+        """Subclasses may implement this.  This will be called after each
+        batch of entities has been passed to update_counter, before the
+        counter is saved, so work collected for the batch can be done at
+        once."""
+
+    def finish_scan(self, counter):
+        """Subclasses may implement this.  This will be called once the scan
+        of the repository has gone through all the entities."""
+
 
 class CountPerson(CountBase):
     SCAN_NAME = 'person'
     ACTION = 'tasks/count/person'
+    NUM_RANGES = 8
+
+    def __init__(self, *args, **kwargs):
+        super(CountPerson, self).__init__(*args, **kwargs)
+        self.note_counts = {}
+        self.linked_person_counts = {}
+        self.token_counts = {}
 
     def make_query(self):
         return model.Person.all().filter('repo =', self.repo)
 
+    def start_batch(self, counter, persons):
+        # Person key names are the repo followed by the record ID, so the
+        # batch is in record ID order, and the Notes on the whole batch can
+        # be streamed with one query over the batch's range of record IDs.
+        # Each Note is read once per scan, since the ranges don't overlap.
+        record_ids = [person.record_id for person in persons]
+        self.note_counts = dict.fromkeys(record_ids, 0)
+        linked_ids_by_person = dict((record_id, []) for record_id in record_ids)
+        all_linked_ids = set()
+        for note in model.Note.generate_by_person_record_id_range(
+                self.repo, record_ids[0], record_ids[-1]):
+            if note.person_record_id in self.note_counts:
+                self.note_counts[note.person_record_id] += 1
+                if note.linked_person_record_id:
+                    linked_ids_by_person[note.person_record_id].append(
+                        note.linked_person_record_id)
+                    all_linked_ids.add(note.linked_person_record_id)
+
+        # Like Person.get_linked_persons(), count only the links to Persons
+        # that exist, looking them all up with one batch get.
+        existing_ids = set(person.record_id for person in model.Person.get_all(
+            self.repo, list(all_linked_ids)))
+        self.linked_person_counts = dict(
+            (record_id, len([linked_id for linked_id in linked_ids
+                             if linked_id in existing_ids]))
+            for record_id, linked_ids in linked_ids_by_person.items())
+
+    def start_scan(self):
+        # The scan also rebuilds the token counts of the indexing planner.
+        indexing.start_token_counts(self.repo)
+
     def update_counter(self, counter, person):
-        found = ''
-        if person.latest_found is not None:
-            found = person.latest_found and 'TRUE' or 'FALSE'
+        for count_name in model.get_person_count_names(
+                person, self.note_counts[person.record_id],
+                self.linked_person_counts[person.record_id]):
+            counter.increment(count_name)
+        if not person.is_expired:
+            for token in person.names_prefixes or []:
+                self.token_counts[token] = self.token_counts.get(token, 0) + 1
 
-        counter.increment('all')
-        counter.increment('original_domain=' + (person.original_domain or ''))
-        counter.increment('sex=' + (person.sex or ''))
-        counter.increment('home_country=' + (person.home_country or ''))
-        counter.increment('photo=' + (person.photo_url and 'present' or ''))
-        counter.increment('num_notes=%d' % len(person.get_notes()))
-        counter.increment('status=' + (person.latest_status or ''))
-        counter.increment('found=' + found)
-        if person.author_email:  # author e-mail address present?
-            counter.increment('author_email')
-        if person.author_phone:  # author phone number present?
-            counter.increment('author_phone')
-        counter.increment(
-            'linked_persons=%d' % len(person.get_linked_persons()))
+    def finish_batch(self, counter):
+        indexing.add_token_counts(self.repo, self.token_counts)
+        self.token_counts = {}
+
+    def finish_scan(self, counter):
+        model.LiveCounter.reconcile(self.repo, self.SCAN_NAME, counter)
+        indexing.finish_token_counts(self.repo)
 
 
 class CountNote(CountBase):
     SCAN_NAME = 'note'
     ACTION = 'tasks/count/note'
+    NUM_RANGES = 8
 
     def make_query(self):
         return model.Note.all().filter('repo =', self.repo)
 
     def update_counter(self, counter, note):
-        author_made_contact = ''
-        if note.author_made_contact is not None:
-            author_made_contact = note.author_made_contact and 'TRUE' or 'FALSE'
+        for count_name in note.get_count_names():
+            counter.increment(count_name)
 
-        counter.increment('all')
-        counter.increment('status=' + (note.status or ''))
-        counter.increment('original_domain=' + (note.original_domain or ''))
-        counter.increment('author_made_contact=' + author_made_contact)
-        if note.last_known_location:  # last known location specified?
-            counter.increment('last_known_location')
-        if note.author_email:  # author e-mail address present?
-            counter.increment('author_email')
-        if note.author_phone:  # author phone number present?
-            counter.increment('author_phone')
-        if note.linked_person_record_id:  # linked to another person?
-            counter.increment('linked_person')
+    def finish_scan(self, counter):
+        model.LiveCounter.reconcile(self.repo, self.SCAN_NAME, counter)
 
 
 class AddReviewedProperty(CountBase):
@@ -273,27 +402,12 @@ class AddReviewedProperty(CountBase):
             note.put()
 
 
-class UpdateDeadStatus(CountBase):
-    """This task looks for Person records with the status 'believed_dead',
-    checks for the last non-hidden Note, and updates the status if necessary.
-    This is designed specifically to address bogus 'believed_dead' notes that
-    are flagged as spam.  (This is a cleanup task, not a counting task.)"""
-    SCAN_NAME = 'update-dead-status'
-    ACTION = 'tasks/count/update_dead_status'
-
-    def make_query(self):
-        return model.Person.all().filter('repo =', self.repo
-                          ).filter('latest_status =', 'believed_dead')
-
-    def update_counter(self, counter, person):
-        person.update_latest_status()
-
-
 class UpdateStatus(CountBase):
     """This task scans Person records, looks for the last non-hidden Note, and
     updates latest_status.  (This is a cleanup task, not a counting task.)"""
     SCAN_NAME = 'update-status'
     ACTION = 'tasks/count/update_status'
+    NUM_RANGES = 8
 
     def make_query(self):
         return model.Person.all().filter('repo =', self.repo)
@@ -302,17 +416,281 @@ class UpdateStatus(CountBase):
         person.update_latest_status()
 
 
+class UpdateDirtyStatus(utils.BaseHandler):
+    """This task updates latest_status on the Persons marked by
+    model.DirtyPerson, in batches, fetching the Notes of each batch
+    concurrently.  The marks are processed once they're SETTLE_SECONDS old,
+    so that the Notes queries reflect the changes that caused them.
+    (UpdateStatus still scans all the Persons now and then, in case any
+    change was missed.)"""
+    repo_required = False  # runs across all repositories
+    ACTION = 'tasks/update_dirty_status'
+
+    # App Engine issues HTTP requests to tasks.
+    https_required = False
+
+    BATCH_SIZE = 100
+    SETTLE_SECONDS = 10
+
+    def get(self):
+        cutoff = utils.get_utcnow() - datetime.timedelta(
+            seconds=self.SETTLE_SECONDS)
+        try:
+            while True:
+                marks = model.DirtyPerson.all().filter(
+                    'marked_time <=', cutoff).order('marked_time').fetch(
+                    self.BATCH_SIZE)
+                if not marks:
+                    break
+                marks_by_repo = {}
+                for mark in marks:
+                    marks_by_repo.setdefault(mark.repo, []).append(mark)
+                for repo, repo_marks in marks_by_repo.items():
+                    self.update_persons(
+                        repo, [mark.person_record_id for mark in repo_marks])
+                # Remove the marks, except for any that were renewed while
+                # the Persons were being updated.
+                current_marks = db.get([mark.key() for mark in marks])
+                db.delete([mark for mark, current_mark
+                           in zip(marks, current_marks)
+                           if current_mark and
+                           current_mark.marked_time == mark.marked_time])
+        except runtime.DeadlineExceededError:
+            # Continue in another task; the marks that remain are kept.
+            self.add_task_for_repo('global', 'update-dirty-status', self.ACTION)
+
+    def update_persons(self, repo, person_record_ids):
+        persons = model.Person.get_all(repo, person_record_ids,
+                                       filter_expired=True)
+        notes_by_person = model.Note.get_by_person_record_ids(
+            repo, [person.record_id for person in persons])
+        changed_persons = [
+            person for person in persons
+            if person.set_latest_status(notes_by_person[person.record_id])]
+        db.put(changed_persons)
+
+
 class Reindex(CountBase):
     """A handler for re-indexing Persons."""
     SCAN_NAME = 'reindex'
     ACTION = 'tasks/count/reindex'
+    NUM_RANGES = 8
+
+    def __init__(self, *args, **kwargs):
+        super(Reindex, self).__init__(*args, **kwargs)
+        self.persons_to_index = []
 
     def make_query(self):
         return model.Person.all().filter('repo =', self.repo)
 
     def update_counter(self, counter, person):
-        person.update_index(['old', 'new'])
+        person.update_index(['old', 'new'], index_full_text=False)
         person.put()
+        self.persons_to_index.append(person)
+
+    def finish_batch(self, counter):
+        if self.persons_to_index and config.get('enable_fulltext_search'):
+            full_text_search.add_records_to_index(self.persons_to_index)
+        self.persons_to_index = []
+
+
+class MigrateFullTextDocuments(CountBase):
+    """Rewrites the full-text search documents of Persons in the compact
+    format.  Starting the task without a repo switches new documents to the
+    compact format; each repository switches its queries to the compact format
+    once all of its documents have been rewritten."""
+    SCAN_NAME = 'migrate-full-text-documents'
+    ACTION = 'tasks/count/migrate_full_text_documents'
+
+    def __init__(self, *args, **kwargs):
+        super(MigrateFullTextDocuments, self).__init__(*args, **kwargs)
+        self.persons_to_index = []
+
+    def get(self):
+        if not self.repo:
+            config.set(full_text_document_format=
+                       full_text_search.DOCUMENT_FORMAT_COMPACT)
+        super(MigrateFullTextDocuments, self).get()
+
+    def make_query(self):
+        return model.Person.all().filter('repo =', self.repo)
+
+    def update_counter(self, counter, person):
+        counter.increment('all')
+        if not person.is_expired:
+            self.persons_to_index.append(person)
+
+    def finish_batch(self, counter):
+        if self.persons_to_index:
+            failures = full_text_search.add_records_to_index(
+                self.persons_to_index,
+                full_text_search.DOCUMENT_FORMAT_COMPACT)
+            for _ in failures:
+                counter.increment('failed')
+        self.persons_to_index = []
+
+    def finish_scan(self, counter):
+        if counter.get('failed'):
+            # The documents that failed are still in the legacy format, and
+            # compact queries wouldn't find them.  Running the task again
+            # retries them.
+            logging.error(
+                'Failed to migrate %d full-text documents in %s; keeping '
+                'the legacy query format' % (counter.get('failed'), self.repo))
+            return
+        config.set_for_repo(self.repo, full_text_query_format=
+                            full_text_search.DOCUMENT_FORMAT_COMPACT)
+
+
+class MigrateFullTextIndex(CountBase):
+    """Copies the full-text search documents of a repository into an index of
+    its own, and then switches searches in the repository to that index.
+    While the copy runs, writes go to both indexes, so the new index is
+    complete when reads switch to it."""
+    SCAN_NAME = 'migrate-full-text-index'
+    ACTION = 'tasks/count/migrate_full_text_index'
+
+    def __init__(self, *args, **kwargs):
+        super(MigrateFullTextIndex, self).__init__(*args, **kwargs)
+        self.persons_to_index = []
+
+    def get(self):
+        if self.repo and full_text_search.get_index_name(self.repo) == (
+                full_text_search.get_per_repo_index_name(self.repo)):
+            return  # already migrated
+        super(MigrateFullTextIndex, self).get()
+
+    def start_scan(self):
+        # Start writing to both indexes before copying anything.
+        config.set_for_repo(
+            self.repo, full_text_migrating_index_name=
+            full_text_search.get_per_repo_index_name(self.repo))
+
+    def make_query(self):
+        return model.Person.all().filter('repo =', self.repo)
+
+    def update_counter(self, counter, person):
+        counter.increment('all')
+        if not person.is_expired:
+            self.persons_to_index.append(person)
+
+    def finish_batch(self, counter):
+        if self.persons_to_index:
+            failures = full_text_search.add_records_to_index(
+                self.persons_to_index,
+                index_name=full_text_search.get_per_repo_index_name(self.repo))
+            for _ in failures:
+                counter.increment('failed')
+        self.persons_to_index = []
+
+    def finish_scan(self, counter):
+        if counter.get('failed'):
+            # Keep reading the shared index, and writing to both, until a
+            # later run copies the documents that failed.
+            logging.error(
+                'Failed to copy %d full-text documents of %s; keeping the '
+                'shared index' % (counter.get('failed'), self.repo))
+            return
+        # Reads only depend on full_text_index_name, so they switch over with
+        # this single config write.  Deletes keep going to the shared index
+        # until the repository's documents have been removed from it.
+        config.set_for_repo(
+            self.repo,
+            full_text_index_name=full_text_search.get_per_repo_index_name(
+                self.repo),
+            full_text_migrating_index_name=None,
+            full_text_shared_index_cleanup_pending=True)
+        self.add_task_for_repo(
+            self.repo, 'clean-shared-full-text-index',
+            CleanSharedFullTextIndex.ACTION)
+
+
+class CleanSharedFullTextIndex(utils.BaseHandler):
+    """Deletes a repository's documents from the shared full-text search
+    index, once the repository has moved to an index of its own."""
+    ACTION = 'tasks/clean_shared_full_text_index'
+
+    # The shared index is cleaned for deactivated repositories too.
+    ignore_deactivation = True
+
+    # App Engine issues HTTP requests to tasks.
+    https_required = False
+
+    def get(self):
+        if full_text_search.get_index_name(self.repo) == (
+                full_text_search.PERSON_LOCATION_FULL_TEXT_INDEX_NAME):
+            return  # searches still read the shared index
+        try:
+            full_text_search.delete_from_shared_index(self.repo)
+        except runtime.DeadlineExceededError:
+            # Continue deleting in another task.
+            self.add_task_for_repo(
+                self.repo, 'clean-shared-full-text-index', self.ACTION)
+            return
+        config.set_for_repo(
+            self.repo, full_text_shared_index_cleanup_pending=None)
+        logging.info('Deleted the shared full-text documents of %s' %
+                     self.repo)
+
+
+class DropFullTextIndex(utils.BaseHandler):
+    """Deletes a repository's own full-text search index, e.g. after the
+    repository has been deactivated."""
+    ACTION = 'tasks/drop_full_text_index'
+
+    # This task runs for deactivated repositories.
+    ignore_deactivation = True
+
+    # App Engine issues HTTP requests to tasks.
+    https_required = False
+
+    def get(self):
+        try:
+            if full_text_search.delete_index(self.repo):
+                logging.info('Deleted the full-text index of %s' % self.repo)
+        except runtime.DeadlineExceededError:
+            # Continue deleting in another task.
+            self.add_task_for_repo(
+                self.repo, 'drop-full-text-index', self.ACTION)
+
+
+class MigrateUsageCounters(utils.BaseHandler):
+    """Folds the unsharded UsageCounter of each repository into its shards."""
+    repo_required = False  # can run without a repo
+    ACTION = 'tasks/migrate_usage_counters'
+
+    # App Engine issues HTTP requests to tasks.
+    https_required = False
+
+    def get(self):
+        for repo in ([self.repo] if self.repo else model.Repo.list()):
+            if model.UsageCounter.migrate(repo):
+                logging.info('Migrated the usage counter of %s' % repo)
+
+
+class WriteActionLogs(utils.BaseHandler):
+    """Writes the action log entries of a request (see action_log.py).  If
+    the write fails, the task is retried."""
+    repo_required = False  # can run without a repo
+    ACTION = 'tasks/write_action_logs'
+
+    # App Engine issues HTTP requests to tasks.
+    https_required = False
+
+    def post(self):
+        # App Engine strips the X-AppEngine-TaskName header from external
+        # requests, so only the task queue can get past this.
+        if not (self.request.headers.get('X-AppEngine-TaskName') or
+                utils.is_dev_app_server()):
+            logging.warn('Non-taskqueue access of: %s' % self.request.path)
+            return self.error(403)
+        try:
+            entries = action_log.deserialize(self.request.body)
+        except ValueError as e:
+            logging.error('Rejected action logs: %s' % e)
+            return self.error(400)
+        db.put(entries)
+        logging.info('Wrote %d action logs' % len(entries))
 
 
 class NotifyManyUnreviewedNotes(utils.BaseHandler):
@@ -522,9 +900,11 @@ class DumpCSV(utils.BaseHandler):
 
     def get_person_records_with_notes(self, repo, persons):
         records = []
+        notes_by_person = model.Note.get_by_person_record_ids(
+            repo, [person.record_id for person in persons])
         for person in persons:
             person_record = PFIF.person_to_dict(person)
-            notes = person.get_notes()
+            notes = notes_by_person[person.record_id]
             if notes:
                 for note in notes:
                     note_record = PFIF.note_to_dict(note)
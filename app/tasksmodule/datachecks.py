@@ -16,9 +16,17 @@
 
 These tasks don't modify data, they just double-check things that are already
 expected to be true.
+
+Checks are registered for a kind of record with register_check(), and one
+task scans the records of each kind in a repository page by page, running all
+of that kind's checks on each page.  Each check gets the whole page, so it can
+look up related records with one batch get.  What the checks find is
+collected in a model.DatacheckReport, which is logged as an error when the
+scan ends with any findings.
 """
 
 import datetime
+import logging
 import time
 
 import django.http
@@ -30,162 +38,198 @@ import tasksmodule.base
 import model
 import utils
 
+# The checks for each kind, by kind name.
+_CHECKS = {}
 
-class DatacheckException(Exception):
-    """An exception raised when a datacheck tasks finds a problem."""
-    pass
-
-
-class DatachecksBaseTask(tasksmodule.base.PerRepoTaskBaseView):
-
-    def setup(self, request, *args, **kwargs):
-        super(DatachecksBaseTask, self).setup(request, *args, **kwargs)
-        self.params.read_values(post_params={'cursor': utils.strip})
-
-    def schedule_task(self, repo, **kwargs):
-        name = '%s-%s-%s' % (repo, self.BASE_NAME, int(time.time()*1000))
-        path = self.build_absolute_path('/%s/tasks/%s' % (repo, self.TASK_PATH))
-        cursor = kwargs.get('cursor', '')
-        # TODO(nworden): figure out why setting task_retry_limit isn't working
-        retry_options = taskqueue.taskqueue.TaskRetryOptions(task_retry_limit=1)
-        taskqueue.add(name=name, method='POST', url=path,
-                      queue_name='datachecks', retry_options=retry_options,
-                      params={'cursor': cursor})
 
-    def alert(self, msg):
-        """Alerts developers of an error.
+def register_check(kind_name):
+    """Returns a decorator that registers a check on records of a kind.
 
-        For now, we just raise an exception. It will show up in Stackdriver.
-        """
-        raise DatacheckException(msg)
+    The check is called with the repository ID and a page of records, and
+    returns a list of messages describing any problems it finds.
+    """
+    def register(check):
+        _CHECKS.setdefault(kind_name, []).append(check)
+        return check
+    return register
 
 
-class PersonDataValidityCheckTask(DatachecksBaseTask):
+@register_check('Person')
+def check_person_data_validity(repo, persons):
     """Checks that person records have valid data."""
-
-    BASE_NAME = 'person_data_validity_check'
-    TASK_PATH = 'check_person_data_validity'
-
-    def _check_person(self, person):
+    findings = []
+    for person in persons:
         if not person.entry_date:
-            self.alert(
+            findings.append(
                 'A person record is missing an entry_date value (%s).'
                 % person.record_id)
         if not person.original_creation_date:
-            self.alert(
+            findings.append(
                 'A person record is missing an original_creation_date value'
                 '(%s).' % person.record_id)
         if (person.author_email and
                 not utils.validate_email(person.author_email)):
-            self.alert(
+            findings.append(
                 'A person record has an invalid author_email value (%s).'
                 % person.record_id)
-
-    def post(self, request, *args, **kwargs):
-        del request, args, kwargs  # unused
-        query = model.Person.all(filter_expired=False).filter(
-            'repo =', self.env.repo)
-        cursor = self.params.cursor
-        if cursor:
-            query.with_cursor(cursor)
-        try:
-            for person in query:
-                next_cursor = query.cursor()
-                self._check_person(person)
-                cursor = next_cursor
-        except runtime.DeadlineExceededError:
-            self.schedule_task(self.env.repo, cursor=cursor)
-        except datastore_errors.Timeout:
-            self.schedule_task(self.env.repo, cursor=cursor)
-        return django.http.HttpResponse('')
+    return findings
 
 
-class NoteDataValidityCheckTask(DatachecksBaseTask):
-    """Checks that notes have valid data."""
+@register_check('Person')
+def check_expired_person_records(repo, persons):
+    """Checks that expired person records have been cleared."""
+    findings = []
+    # Check things that were expired yesterday, just in case this job is
+    # ahead of the deletion job.
+    yesterday = utils.get_utcnow() - datetime.timedelta(days=1)
+    for person in persons:
+        if not (person.expiry_date and person.expiry_date < yesterday):
+            continue
+        for name, prop in person.properties().items():
+            if name not in ['repo', 'is_expired', 'original_creation_date',
+                            'source_date', 'entry_date', 'expiry_date',
+                            'last_modified']:
+                if getattr(person, name) != prop.default:
+                    findings.append(
+                        'An expired person record still has data (%s, %s).' %
+                        (person.record_id, name))
+    return findings
 
-    BASE_NAME = 'note_data_validity_check'
-    TASK_PATH = 'check_note_data_validity'
 
-    def _check_note(self, note):
+@register_check('Note')
+def check_note_data_validity(repo, notes):
+    """Checks that notes have valid data."""
+    findings = []
+    for note in notes:
         if not note.entry_date:
-            self.alert(
+            findings.append(
                 'A note record is missing an entry_date value (%s).' %
                 note.record_id)
         if not note.original_creation_date:
-            self.alert(
+            findings.append(
                 'A note record is missing an original_creation_date value (%s).'
                 % note.record_id)
         if not note.person_record_id:
-            self.alert(
+            findings.append(
                 'A note record is missing a person_record_id value (%s).' %
                 note.record_id)
         if (note.author_email and not utils.validate_email(note.author_email)):
-            self.alert(
+            findings.append(
                 'A note record has an invalid author_email value (%s).' %
                 note.record_id)
         if (note.email_of_found_person and
                 not utils.validate_email(note.email_of_found_person)):
-            self.alert(
+            findings.append(
                 'A note record has an invalid email_of_found_person value (%s).'
                 % note.record_id)
-        if not model.Person.get(self.env.repo, note.person_record_id):
-            self.alert(
-                'A note record\'s associated person record is missing (%s).' %
-                note.record_id)
+    return findings
+
+
+@register_check('Note')
+def check_note_parents(repo, notes):
+    """Checks that the person record of each note exists, looking up the
+    person records of the whole page with one batch get."""
+    person_record_ids = set(
+        note.person_record_id for note in notes if note.person_record_id)
+    existing_ids = set(person.record_id for person in model.Person.get_all(
+        repo, list(person_record_ids), filter_expired=True))
+    return [
+        'A note record\'s associated person record is missing (%s).' %
+        note.record_id
+        for note in notes
+        if note.person_record_id and note.person_record_id not in existing_ids]
+
+
+class DatachecksBaseTask(tasksmodule.base.PerRepoTaskBaseView):
+    """Runs the checks registered for MODEL_CLASS on all the records of that
+    kind in a repository."""
+
+    MODEL_CLASS = None  # Subclasses should set the model class to scan.
+
+    # How many records to check at once.
+    PAGE_SIZE = 100
+
+    def setup(self, request, *args, **kwargs):
+        super(DatachecksBaseTask, self).setup(request, *args, **kwargs)
+        self.params.read_values(
+            post_params={'cursor': utils.strip, 'report': utils.strip})
+
+    def schedule_task(self, repo, **kwargs):
+        name = '%s-%s-%s' % (repo, self.BASE_NAME, int(time.time()*1000))
+        path = self.build_absolute_path('/%s/tasks/%s' % (repo, self.TASK_PATH))
+        cursor = kwargs.get('cursor', '')
+        report = kwargs.get('report', '')
+        # TODO(nworden): figure out why setting task_retry_limit isn't working
+        retry_options = taskqueue.taskqueue.TaskRetryOptions(task_retry_limit=1)
+        taskqueue.add(name=name, method='POST', url=path,
+                      queue_name='datachecks', retry_options=retry_options,
+                      params={'cursor': cursor, 'report': report})
+
+    def get_report(self):
+        """Gets the report of the scan that this task continues, or starts a
+        new one."""
+        if self.params.report:
+            report = model.DatacheckReport.get_by_key_name(self.params.report)
+            if report:
+                return report
+        return model.DatacheckReport.create(
+            self.env.repo, self.MODEL_CLASS.kind(), utils.get_utcnow())
+
+    def finish_report(self, report):
+        report.finish_time = utils.get_utcnow()
+        report.put()
+        if report.num_findings:
+            # Errors show up in Stackdriver, which alerts developers.
+            logging.error(
+                'Datachecks found %d problems with %d %s records in %s '
+                '(see DatacheckReport %s). The first few:\n%s' % (
+                    report.num_findings, report.num_scanned,
+                    report.kind_name, report.repo, report.key().name(),
+                    '\n'.join(report.findings[:10])))
 
     def post(self, request, *args, **kwargs):
         del request, args, kwargs  # unused
-        query = model.Note.all(filter_expired=False).filter(
+        checks = _CHECKS.get(self.MODEL_CLASS.kind(), [])
+        report = self.get_report()
+        query = self.MODEL_CLASS.all(filter_expired=False).filter(
             'repo =', self.env.repo)
         cursor = self.params.cursor
-        if cursor:
-            query.with_cursor(cursor)
         try:
-            for note in query:
-                next_cursor = query.cursor()
-                self._check_note(note)
-                cursor = next_cursor
-        except runtime.DeadlineExceededError:
-            self.schedule_task(self.env.repo, cursor=cursor)
-        except datastore_errors.Timeout:
-            self.schedule_task(self.env.repo, cursor=cursor)
+            while True:
+                if cursor:
+                    query.with_cursor(cursor)
+                records = query.fetch(self.PAGE_SIZE)
+                if not records:
+                    break
+                # Add the findings only once the whole page has been
+                # checked, so a page that gets interrupted is checked again
+                # from the start without duplicating its findings.
+                findings = []
+                for check in checks:
+                    findings.extend(check(self.env.repo, records))
+                report.add_findings(findings)
+                report.num_scanned += len(records)
+                cursor = query.cursor()
+        except (runtime.DeadlineExceededError, datastore_errors.Timeout):
+            report.put()
+            self.schedule_task(
+                self.env.repo, cursor=cursor, report=report.key().name())
+            return django.http.HttpResponse('')
+        self.finish_report(report)
         return django.http.HttpResponse('')
 
 
-class ExpiredPersonRecordCheckTask(DatachecksBaseTask):
-    """Checks that expired person records have been cleared."""
+class PersonDatachecksTask(DatachecksBaseTask):
+    """Checks person records."""
 
-    BASE_NAME = 'expired_person_record_check'
-    TASK_PATH = 'check_expired_person_records'
+    BASE_NAME = 'person_datachecks'
+    TASK_PATH = 'check_persons'
+    MODEL_CLASS = model.Person
 
-    def _check_person(self, person):
-        # Check things that were expired yesterday, just in case this job is
-        # ahead of the deletion job.
-        yesterday = utils.get_utcnow() - datetime.timedelta(days=1)
-        if not (person.expiry_date and person.expiry_date < yesterday):
-            return
-        for name, prop in person.properties().items():
-            if name not in ['repo', 'is_expired', 'original_creation_date',
-                            'source_date', 'entry_date', 'expiry_date',
-                            'last_modified']:
-                if getattr(person, name) != prop.default:
-                    self.alert(
-                        'An expired person record still has data (%s, %s).' %
-                        (person.record_id, name))
 
-    def post(self, request, *args, **kwargs):
-        query = model.Person.all(filter_expired=False).filter(
-            'repo =', self.env.repo)
-        cursor = self.params.cursor
-        if cursor:
-            query.with_cursor(cursor)
-        try:
-            for person in query:
-                next_cursor = query.cursor()
-                self._check_person(person)
-                cursor = next_cursor
-        except runtime.DeadlineExceededError:
-            self.schedule_task(self.env.repo, cursor=cursor)
-        except datastore_errors.Timeout:
-            self.schedule_task(self.env.repo, cursor=cursor)
-        return django.http.HttpResponse('')
+class NoteDatachecksTask(DatachecksBaseTask):
+    """Checks notes."""
+
+    BASE_NAME = 'note_datachecks'
+    TASK_PATH = 'check_notes'
+    MODEL_CLASS = model.Note
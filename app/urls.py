@@ -26,6 +26,7 @@ import views.admin.dashboard
 import views.admin.delete_record
 import views.admin.global_index
 import views.admin.repo_index
+import views.admin.request_timing
 import views.admin.review
 import views.admin.statistics
 import views.enduser.global_index
@@ -56,6 +57,8 @@ _BASE_URL_PATTERNS = [
      views.admin.global_index.AdminGlobalIndexView.as_view),
     ('admin_repo-index', r'(?P<repo>[^\/]+)/admin/?',
      views.admin.repo_index.AdminRepoIndexView.as_view),
+    ('admin_request-timing', r'global/admin/request_timing/?',
+     views.admin.request_timing.AdminRequestTimingView.as_view),
     ('admin_review', r'(?P<repo>[^\/]+)/admin/review/?',
      views.admin.review.AdminReviewView.as_view),
     ('admin_statistics', r'global/admin/statistics/?',
@@ -88,15 +91,12 @@ _BASE_URL_PATTERNS = [
     ('tasks_process-expirations',
      r'(?P<repo>[^\/]+)/tasks/process_expirations/?',
      tasksmodule.deletion.ProcessExpirationsTask.as_view),
-    ('tasks_check-expired-person-records',
-     r'(?P<repo>[^\/]+)/tasks/check_expired_person_records/?',
-     tasksmodule.datachecks.ExpiredPersonRecordCheckTask.as_view),
-    ('tasks_check-person-data-validity',
-     r'(?P<repo>[^\/]+)/tasks/check_person_data_validity/?',
-     tasksmodule.datachecks.PersonDataValidityCheckTask.as_view),
-    ('tasks_check-note-data-validity',
-     r'(?P<repo>[^\/]+)/tasks/check_note_data_validity/?',
-     tasksmodule.datachecks.NoteDataValidityCheckTask.as_view),
+    ('tasks_check-persons',
+     r'(?P<repo>[^\/]+)/tasks/check_persons/?',
+     tasksmodule.datachecks.PersonDatachecksTask.as_view),
+    ('tasks_check-notes',
+     r'(?P<repo>[^\/]+)/tasks/check_notes/?',
+     tasksmodule.datachecks.NoteDatachecksTask.as_view),
     ('tasks_cleanup-stray-notes',
      r'(?P<repo>[^\/]+)/tasks/cleanup_stray_notes/?',
      tasksmodule.deletion.CleanupStrayNotesTask.as_view),
@@ -52,6 +52,7 @@ import const
 import config
 import model
 import pfif
+import request_timing
 import resources
 
 # The domain name from which to send e-mail.
@@ -585,7 +586,9 @@ def get_timestamp(dt):
 def get_utcnow_timestamp():
     """Returns the current time in epoch seconds (settable with
     set_utcnow_for_test)."""
-    return get_timestamp(get_utcnow())
+    if _utcnow_for_test is None:
+        return time.time()
+    return get_timestamp(_utcnow_for_test)
 
 
 def log_api_action(handler, action, num_person_records=0, num_note_records=0,
@@ -870,8 +873,9 @@ class BaseHandler(webapp.RequestHandler):
         get_vars().  Since this is intended for use by a dynamic page handler,
         caching is off by default; if cache_seconds is positive, then
         get_vars() will be called only when cached content is unavailable."""
-        self.write(self.render_to_string(
-            name, language_override, cache_seconds, get_vars, **vars))
+        with request_timing.timer('render'):
+            self.write(self.render_to_string(
+                name, language_override, cache_seconds, get_vars, **vars))
 
     def render_to_string(self, name, language_override=None, cache_seconds=0,
                          get_vars=lambda: {}, **vars):
@@ -1230,7 +1234,7 @@ class BaseHandler(webapp.RequestHandler):
         # Everything after this requires a repo.
 
         # Reject requests for repositories that don't exist.
-        if not model.Repo.get_by_key_name(self.repo):
+        if not model.Repo.get(self.repo):
             html = 'No such repository. '
             if self.env.repo_options:
                 html += 'Select:<p>' + self.render_to_string('repo-menu.html')
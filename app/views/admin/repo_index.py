@@ -17,6 +17,7 @@ import simplejson
 
 import config
 import const
+import full_text_search
 import model
 import modelmodule.admin_acls as admin_acls_model
 import utils
@@ -288,15 +289,31 @@ class AdminRepoIndexView(views.admin.base.AdminBaseView):
         if self._category_permissions['everything_else']:
             if (self._repo_obj.activation_status !=
                     self.params.activation_status):
+                was_deactivated = self._repo_obj.is_deactivated()
                 self._repo_obj.activation_status = self.params.activation_status
                 self._repo_obj.put()
                 config.set_for_repo(
                     self.env.repo,
                     updated_date=utils.get_utcnow_timestamp())
+                self._update_full_text_index(was_deactivated)
             config.set_for_repo(
                 self.env.repo,
                 deactivation_message_html=self.params.deactivation_message_html)
 
+    def _update_full_text_index(self, was_deactivated):
+        # A repository with its own full-text index drops it when it's
+        # deactivated, and rebuilds it when it's reactivated.
+        if (full_text_search.get_index_name(self.env.repo) ==
+                full_text_search.PERSON_LOCATION_FULL_TEXT_INDEX_NAME):
+            return
+        if self._repo_obj.is_deactivated():
+            utils.BaseHandler.add_task_for_repo(
+                self.env.repo, 'drop-full-text-index',
+                'tasks/drop_full_text_index')
+        elif was_deactivated:
+            utils.BaseHandler.add_task_for_repo(
+                self.env.repo, 'reindex', 'tasks/count/reindex')
+
     def _set_data_retention_config(self):
         if self._category_permissions['everything_else']:
             if self._repo_obj.test_mode != self.params.test_mode:
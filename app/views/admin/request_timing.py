@@ -0,0 +1,75 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The admin request timing page."""
+
+import config
+import request_timing
+import views.admin.base
+
+
+class AdminRequestTimingView(views.admin.base.AdminBaseView):
+    """The admin request timing view."""
+
+    ACTION_ID = 'admin/request_timing'
+
+    @views.admin.base.enforce_manager_admin_level
+    def get(self, request, *args, **kwargs):
+        """Serves get requests.
+
+        Args:
+            request: Unused.
+            *args: Unused.
+            **kwargs: Unused.
+
+        Returns:
+            HttpResponse: A HTTP response with the request timing page.
+        """
+        del request, args, kwargs  # unused
+        endpoint_timings = [
+            _get_endpoint_timing(endpoint)
+            for endpoint in request_timing.get_endpoints()]
+        return self.render(
+            'admin_request_timing.html',
+            enabled=config.get('enable_request_timing'),
+            metrics=request_timing.METRICS,
+            endpoint_timings=endpoint_timings)
+
+
+def _get_endpoint_timing(endpoint):
+    """Gets the request count and percentiles of each metric of an endpoint.
+
+    Args:
+        endpoint (str): The endpoint name.
+
+    Returns:
+        dict: A dictionary with the endpoint name and, for each metric that
+        was recorded, the number of requests and the 50th, 95th and 99th
+        percentiles in milliseconds (None when past the last histogram
+        bucket), e.g.: {'endpoint': 'view', 'metrics': [{'metric': 'total',
+        'count': 12, 'p50': 50, 'p95': 200, 'p99': 500}, ...]}
+    """
+    histograms = request_timing.get_histograms(endpoint)
+    metrics = []
+    for metric in request_timing.METRICS:
+        histogram = histograms[metric]
+        if sum(histogram):
+            metrics.append({
+                'metric': metric,
+                'count': sum(histogram),
+                'p50': request_timing.get_percentile(histogram, 50),
+                'p95': request_timing.get_percentile(histogram, 95),
+                'p99': request_timing.get_percentile(histogram, 99),
+            })
+    return {'endpoint': endpoint, 'metrics': metrics}
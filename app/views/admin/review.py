@@ -177,5 +177,8 @@ class AdminReviewView(views.admin.base.AdminBaseView):
                         note.hidden = True
                     notes.append(note)
         db.put(notes)
+        model.DirtyPerson.mark(
+            self.env.repo,
+            [note.person_record_id for note in notes if note.hidden])
 
         return django.shortcuts.redirect(self.build_absolute_path())
@@ -14,8 +14,11 @@
 
 """The admin statistics page."""
 
+import config
 import const
 import model
+import resources
+from search import result_cache
 import views.admin.base
 
 
@@ -39,6 +42,7 @@ class AdminStatisticsView(views.admin.base.AdminBaseView):
         del request, args, kwargs  # unused
         repos = sorted(model.Repo.list())
         all_usage = [_get_repo_usage(repo) for repo in repos]
+        search_cache_stats = [_get_search_cache_stats(repo) for repo in repos]
         note_status_list = []
         for note_status in const.NOTE_STATUS_TEXT:
             if not note_status:
@@ -48,7 +52,10 @@ class AdminStatisticsView(views.admin.base.AdminBaseView):
         return self.render(
             'admin_statistics.html',
             all_usage=all_usage,
-            note_status_list=note_status_list)
+            note_status_list=note_status_list,
+            search_cache_stats=search_cache_stats,
+            config_cache_stats=config.cache.stats(),
+            resource_cache_stats=sorted(resources.get_cache_stats().items()))
 
 
 def _get_repo_usage(repo):
@@ -62,15 +69,29 @@ def _get_repo_usage(repo):
         the number of persons, and the number of notes. E.g.:
         {'repo': haiti, 'num_persons': 10, 'num_notes': 5, ...etc.}
     """
-    counters = model.UsageCounter.get(repo)
+    counts = model.UsageCounter.get_counts(repo)
     repo_usage = {
         'repo': repo,
-        'num_persons': getattr(counters, 'person', 0),
-        'num_notes': getattr(counters, 'note', 0)
+        'num_persons': counts.get('person', 0),
+        'num_notes': counts.get('note', 0)
     }
     for note_status in const.NOTE_STATUS_TEXT:
         if not note_status:
             note_status = 'unspecified'
-        repo_usage['num_notes_' + note_status] = (getattr(
-            counters, note_status, 0))
+        repo_usage['num_notes_' + note_status] = counts.get(note_status, 0)
     return repo_usage
+
+
+def _get_search_cache_stats(repo):
+    """Gets the search result cache hit and miss counts for a repository.
+
+    Args:
+        repo (str): The repository ID.
+
+    Returns:
+        dict: A dictionary with the repository ID and the number of hits and
+        misses, e.g.: {'repo': 'haiti', 'hits': 10, 'misses': 5}
+    """
+    stats = result_cache.get_stats(repo)
+    stats['repo'] = repo
+    return stats
@@ -24,6 +24,7 @@ import six.moves.urllib.parse as urlparse
 
 import config
 import const
+import request_timing
 import site_settings
 import user_agents
 import utils
@@ -363,8 +364,9 @@ class BaseView(django.views.View):
             'csp_nonce': self.request.csp_nonce,
         }
         context.update(template_vars)
-        return django.shortcuts.render(
-            self.request, template_name, context, status=status_code)
+        with request_timing.timer('render'):
+            return django.shortcuts.render(
+                self.request, template_name, context, status=status_code)
 
     def error(self, status_code, message=''):
         """Returns an error response.
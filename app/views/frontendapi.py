@@ -15,11 +15,12 @@
 """Handlers for the frontend API."""
 
 import django.http
+from google.appengine.ext import db
 import simplejson
 
-import config
 import create
 import model
+import repo_directory
 import search.searcher
 import utils
 import view
@@ -65,20 +66,13 @@ class RepoView(FrontendApiBaseView):
         del request, args, kwargs  # Unused.
         if self.env.repo == 'global':
             data = []
-            repos = model.Repo.all().filter(
-                'activation_status =', model.Repo.ActivationStatus.ACTIVE)
-            for repo in repos:
-                repo_id = repo.key().name()
-                # TODO(nworden): Move this data onto the Repo object, like we
-                # did for activation status. It'd be more efficient, and IMO the
-                # code would be cleaner.
+            for info in repo_directory.get().list_launched():
                 repo_title = self._select_repo_title(
-                    config.get_for_repo(repo_id, 'repo_titles'),
-                    config.get_for_repo(repo_id, 'language_menu_options'))
+                    info.titles, info.language_menu_options)
                 data.append({
-                    'repoId': repo_id,
+                    'repoId': info.repo_id,
                     'title': repo_title,
-                    'recordCount': self._get_person_count(repo_id),
+                    'recordCount': info.person_count,
                 })
         else:
             repo = model.Repo.get(self.env.repo)
@@ -103,23 +97,18 @@ class RepoView(FrontendApiBaseView):
             }
         return self._json_response(data)
 
+    def _get_person_count(self, repo_id):
+        # A repository created outside of the admin pages may not be in the
+        # snapshot until it's rebuilt.
+        info = repo_directory.get().get(repo_id)
+        return info.person_count if info else 0
+
     def _select_repo_title(self, titles, language_options):
         if self.env.lang in titles:
             return titles[self.env.lang]
         else:
             return titles[language_options[0]]
 
-    def _get_person_count(self, repo_id):
-        # TODO(nworden): factor this out somewhere we can share with the
-        # Lite/AMP UIs. Part of me wants to just put it on model.Counter, but
-        # part of me says this is frontend-y code that doesn't belong on a model
-        # class.
-        count = model.Counter.get_count(repo_id, 'person.all')
-        if count < 100:
-            return 0
-        else:
-            return int(round(count, -2))
-
 
 class ResultsView(FrontendApiBaseView):
     """View for search results."""
@@ -137,7 +126,7 @@ class ResultsView(FrontendApiBaseView):
         # full-text is going away.
         searcher = search.searcher.Searcher(
             self.env.repo, self.env.config.get('enable_fulltext_search'),
-            ResultsView._MAX_RESULTS)
+            ResultsView._MAX_RESULTS, use_cache=True)
         results = searcher.search(
             self.params.query_name or self.params.query)
         return self._json_response([self._result_to_dict(r) for r in results])
@@ -386,4 +375,7 @@ class AddNoteView(FrontendApiBaseView):
             phone_of_found_person=self.params.phone_of_found_person,
             last_known_location=self.params.last_known_location,
             validate_data=False)
+        # Update the Person based on the Note, as the add note page does.
+        person.update_from_note(note)
+        db.put(person)
         return self._json_response({'note_id': note.record_id})
@@ -15,7 +15,7 @@
 """The sitemap."""
 
 import const
-import model
+import repo_directory
 import views.base
 
 
@@ -42,8 +42,9 @@ class SitemapView(views.base.BaseView):
         urimaps.append({lang: self.build_absolute_uri('/?lang=%s' % lang)
                         for lang in langs})
         # Include the repo homepages.
-        for repo in model.Repo.list_launched():
+        for info in repo_directory.get().list_launched():
             urimaps.append({
-                lang: self.build_absolute_uri('/%s?lang=%s' % (repo, lang))
+                lang: self.build_absolute_uri(
+                    '/%s?lang=%s' % (info.repo_id, lang))
                 for lang in langs})
         return self.render('sitemap.xml', urimaps=urimaps)
@@ -16,8 +16,8 @@
 import django.http
 import xml.etree.ElementTree as ET
 
-import config
 import model
+import repo_directory
 import utils
 import views.thirdparty_endpoints.base
 
@@ -39,53 +39,48 @@ class RepoFeedView(views.thirdparty_endpoints.base.ThirdPartyFeedBaseView):
     def add_feed_elements(self, root):
         ET.SubElement(root, 'id').text = self.build_absolute_uri()
         ET.SubElement(root, 'title').text = RepoFeedView._TITLE
+        directory = repo_directory.get()
         if self.env.repo == 'global':
-            repos = model.Repo.all().filter(
-                'activation_status !=', model.Repo.ActivationStatus.STAGING)
+            repo_infos = directory.list_not_staging()
         else:
-            repo = model.Repo.get(self.env.repo)
-            if repo.activation_status == model.Repo.ActivationStatus.ACTIVE:
-                repos = [repo]
+            info = directory.get(self.env.repo)
+            if info and info.is_launched():
+                repo_infos = [info]
             else:
                 raise django.http.Http404()
-        repo_confs = {}
-        for repo in repos:
-            repo_id = repo.key().name()
-            repo_conf = config.Configuration(repo_id, include_global=False)
-            repo_confs[repo_id] = repo_conf
-        updated_dates = [conf.updated_date for conf in repo_confs.values()]
+        updated_dates = [info.updated_date for info in repo_infos]
         # If there's no non-staging repositories, it's not really clear what
         # updated_date should be; we just use the current time.
         latest_updated_date = (
             max(updated_dates) if updated_dates else utils.get_utcnow())
         ET.SubElement(root, 'updated').text = utils.format_utc_timestamp(
             latest_updated_date)
-        for repo in repos:
-            if repo.activation_status == model.Repo.ActivationStatus.ACTIVE:
-                self._add_repo_entry(root, repo, repo_confs[repo.key().name()])
+        for info in repo_infos:
+            if info.is_launched():
+                self._add_repo_entry(root, info)
 
-    def _add_repo_entry(self, root, repo, repo_conf):
+    def _add_repo_entry(self, root, info):
         entry_el = ET.SubElement(root, 'entry')
         ET.SubElement(entry_el, 'id').text = self.build_absolute_uri(
-            '/', repo.key().name())
-        if repo_conf.language_menu_options:
-            default_lang = repo_conf.language_menu_options[0]
+            '/', info.repo_id)
+        if info.feed_language_menu_options:
+            default_lang = info.feed_language_menu_options[0]
             title_el = ET.SubElement(
                 entry_el, 'title', {'lang': default_lang})
-            title_el.text = repo_conf.repo_titles[default_lang]
+            title_el.text = info.feed_titles[default_lang]
         ET.SubElement(entry_el, 'updated').text = utils.format_utc_timestamp(
-            repo_conf.updated_date)
+            info.updated_date)
         content_el = ET.SubElement(entry_el, 'content', {'type': 'text/xml'})
         repo_el = ET.SubElement(content_el, GPF + 'repo')
-        for lang, title in repo_conf.repo_titles.items():
+        for lang, title in info.feed_titles.items():
             ET.SubElement(repo_el, GPF + 'title', {'lang': lang}).text = title
         ET.SubElement(repo_el, GPF + 'read_auth_key_required').text = (
-            'true' if repo_conf.read_auth_key_required else 'false')
+            'true' if info.read_auth_key_required else 'false')
         ET.SubElement(repo_el, GPF + 'search_auth_key_required').text = (
-            'true' if repo_conf.search_auth_key_required else 'false')
+            'true' if info.search_auth_key_required else 'false')
         ET.SubElement(repo_el, GPF + 'test_mode').text = (
-            'true' if repo.test_mode else 'false')
-        center = repo_conf.map_default_center or [0, 0]
+            'true' if info.test_mode else 'false')
+        center = info.map_default_center or [0, 0]
         location_el = ET.SubElement(repo_el, GPF + 'location')
         ET.SubElement(location_el, GEORSS + 'point').text = (
             '%f %f' % (center[0], center[1]))
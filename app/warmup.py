@@ -0,0 +1,94 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prepares a new instance before it serves user requests.
+
+App Engine sends /_ah/warmup to a new instance before routing traffic to it
+(see inbound_services in app.yaml), so the work that would otherwise slow down
+the first requests on the instance is done here: initializing Django, importing
+the handler modules, loading the romanization dictionaries, and filling the
+config, repository directory and template caches.
+"""
+
+import logging
+import time
+
+import config
+import repo_directory
+import resources
+import script_variant
+
+
+def init_django():
+    import django.urls
+    import wsgi
+    # Resolving the URL patterns imports all the Django view modules.
+    django.urls.get_resolver().url_patterns
+
+
+def import_modules(module_names):
+    for module_name in sorted(set(module_names)):
+        try:
+            __import__(module_name)
+        except ImportError as e:
+            logging.warning('Failed to import %s: %s' % (module_name, e))
+
+
+def load_dictionaries():
+    script_variant.JAPANESE_NAME_LOCATION_DICTIONARY.load()
+    script_variant.CHINESE_FAMILY_NAME_DICTIONARY.load()
+
+
+def load_config():
+    repo_ids = [info.repo_id for info in repo_directory.get().repo_infos]
+    config.cache.get_entries_multi(repo_ids + ['*'])
+
+
+def compile_templates():
+    langs = set(config.get('language_menu_options') or ['en'])
+    for info in repo_directory.get().repo_infos:
+        langs.update(info.language_menu_options)
+    resources.warm_up(langs, config.get('default_resource_bundle', '1'))
+
+
+def warm_up(handler_module_names):
+    """Runs each warm-up step, logging any failure and going on with the next
+    step.
+
+    Args:
+        handler_module_names: the names of the modules of the webapp handlers.
+    Returns:
+        A list of (step name, seconds taken) pairs.
+    """
+    steps = [
+        ('django', init_django),
+        ('handler_modules', lambda: import_modules(handler_module_names)),
+        ('dictionaries', load_dictionaries),
+        ('repo_directory', repo_directory.get),
+        ('config', load_config),
+        ('templates', compile_templates),
+    ]
+    timings = []
+    for name, step in steps:
+        start = time.time()
+        try:
+            step()
+        except Exception:
+            logging.exception('Warm-up step %s failed' % name)
+        timings.append((name, time.time() - start))
+    logging.info('Warmed up in %.3f s: %s' % (
+        sum(seconds for name, seconds in timings),
+        ', '.join('%s %.3f s' % timing for timing in timings)))
+    return timings
+
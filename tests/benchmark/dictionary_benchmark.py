@@ -0,0 +1,72 @@
+# encoding=utf-8
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares loading the romanization dictionaries from the text files and
+from their compiled form.
+
+Usage:
+  $ tools/compile_dictionaries
+  $ tools/benchmark dictionary
+
+Each variant runs in a fresh process, as on a new instance, and reports the
+time to load both dictionaries and look up a few names, and the growth of the
+process's peak resident memory.
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import compiled_dictionary
+import script_variant
+
+FILE_NAMES = ['japanese_name_location_dict.txt',
+              'chinese_family_name_dict.txt']
+WORDS = [u'山田', u'太郎', u'菊地', u'真', u'横浜', u'渋谷', u'陳', u'港生']
+
+
+def load(variant):
+    if variant == 'text':
+        return [script_variant.read_dictionary(name) for name in FILE_NAMES]
+    return [compiled_dictionary.open_compiled(name) for name in FILE_NAMES]
+
+
+def run(variant):
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    dictionaries = load(variant)
+    assert None not in dictionaries, 'Run tools/compile_dictionaries first.'
+    for word in WORDS:
+        for dictionary in dictionaries:
+            dictionary.get(word)
+    seconds = time.time() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print '%-10s %8.1f ms to load, %8d KB more peak resident memory' % (
+        variant, seconds * 1000, rss_after - rss_before)
+
+
+def main():
+    for variant in ['text', 'compiled']:
+        subprocess.check_call(
+            [sys.executable, os.path.abspath(__file__), variant])
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+    else:
+        main()
@@ -0,0 +1,96 @@
+# encoding=utf-8
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the legacy and compact full-text search document formats.
+
+Usage:
+  $ tools/benchmark full_text_document [num_persons]
+
+For each format, reports the average size of a document (the UTF-8 bytes of
+its field names and values, which is what the Search API bills and stores)
+and the time to create the documents and to put them in an index backed by
+the testbed search stub.
+"""
+
+import datetime
+import random
+import sys
+import timeit
+
+from google.appengine.ext import testbed
+
+import full_text_search
+import model
+
+GIVEN_NAMES = [u'Bryan', u'Alexander', u'Maria', u'John', u'Yayoi', u'Miki',
+               u'港生', u'嘉平', u'やよい', u'真']
+FAMILY_NAMES = [u'Smith', u'Garcia', u'Li', u'Takatsuki', u'Hoshii',
+                u'陳', u'余', u'たかつき', u'菊地', u'朱']
+CITIES = [u'Port-au-Prince', u'Arao', u'横浜', u'Shibuya', u'тоттори']
+FORMATS = [('legacy', full_text_search.DOCUMENT_FORMAT_LEGACY),
+           ('compact', full_text_search.DOCUMENT_FORMAT_COMPACT)]
+REPEAT = 3
+
+
+def make_persons(num_persons):
+    random.seed(0)
+    persons = []
+    for i in xrange(num_persons):
+        given_name = random.choice(GIVEN_NAMES)
+        family_name = random.choice(FAMILY_NAMES)
+        persons.append(model.Person(
+            key_name='bench:bench.example.com/person.%d' % i,
+            repo='bench',
+            entry_date=datetime.datetime(2019, 1, 1),
+            given_name=given_name,
+            family_name=family_name,
+            full_name=u'%s %s' % (given_name, family_name),
+            alternate_names=u'',
+            home_city=random.choice(CITIES)))
+    return persons
+
+
+def get_document_bytes(document):
+    return sum(len(field.name.encode('utf-8')) +
+               len(unicode(field.value).encode('utf-8'))
+               for field in document.fields)
+
+
+def main(num_persons):
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.init_search_stub()
+    persons = make_persons(num_persons)
+    for name, document_format in FORMATS:
+        documents = [full_text_search.create_document(person, document_format)
+                     for person in persons]
+        document_bytes = sum(get_document_bytes(doc) for doc in documents)
+        create_seconds = timeit.timeit(
+            lambda: [full_text_search.create_document(person, document_format)
+                     for person in persons],
+            number=REPEAT)
+        index_seconds = timeit.timeit(
+            lambda: full_text_search.add_records_to_index(
+                persons, document_format),
+            number=REPEAT)
+        print '%-8s %6d bytes per document, %7.3f ms create, %7.3f ms index' % (
+            name, document_bytes / num_persons,
+            create_seconds * 1000 / REPEAT / num_persons,
+            index_seconds * 1000 / REPEAT / num_persons)
+    tb.deactivate()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,115 @@
+# encoding=utf-8
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the table-scanning and compiled kana converters in jautils.
+
+Usage:
+  $ tools/benchmark jautils [num_names]
+
+The corpus is made of common Japanese given and family names written in
+hiragana and katakana, which is what the converters see at index time and
+for Japanese queries.  The scanning variants are the implementations the
+compiled ones replaced; both must produce the same output.
+"""
+
+import random
+import re
+import sys
+import timeit
+
+import jautils
+
+FAMILY_NAMES = [u'さとう', u'すずき', u'たかはし', u'たなか', u'わたなべ',
+                u'いとう', u'やまもと', u'なかむら', u'こばやし', u'かとう',
+                u'よしだ', u'やまだ', u'ささき', u'やまぐち', u'まつもと',
+                u'いのうえ', u'きむら', u'はやし', u'しみず', u'やまざき',
+                u'きくち', u'ほっかいどう', u'はっとり', u'じょうのうち']
+GIVEN_NAMES = [u'ひろし', u'たかし', u'あきら', u'しょうた', u'りょうた',
+               u'けんいち', u'ゆうき', u'だいすけ', u'みき', u'やよい',
+               u'ゆうこ', u'けいこ', u'あやか', u'みさき', u'ちひろ',
+               u'きょうこ', u'しゅんすけ', u'ゔぃんせんと', u'じゅんいちろう',
+               u'いっせい', u'まこと', u'いおり', u'はーと', u'さやか']
+REPEAT = 5
+
+
+def scanning_katakana_to_hiragana(string):
+    replaced = u''
+    for ch in string:
+        replaced += jautils.KATAKANA_TO_HIRAGANA.get(ch, ch)
+    return replaced
+
+
+def scanning_hiragana_to_romaji(string):
+    remaining = string
+    result = u''
+    while remaining:
+        longest = 0
+        longest_data = None
+        for (hira, rom, next) in jautils.HIRAGANA_TO_ROMAJI:
+            if remaining.startswith(hira) and len(hira) > longest:
+                longest_data = (hira, rom, next)
+                longest = len(hira)
+        if longest == 0:
+            result += remaining[0]
+            remaining = remaining[1:]
+        else:
+            result += longest_data[1]
+            remaining = longest_data[2] + remaining[len(longest_data[0]):]
+    for (pat, rep) in jautils.HIRAGANA_TO_ROMAJI_POST_PROCESS:
+        result = re.sub(pat, rep, result)
+    return result
+
+
+def hiragana_to_katakana(string):
+    hiragana_to_katakana_map = dict(
+        (hira, kata) for (kata, hira) in jautils.KATAKANA_TO_HIRAGANA.items())
+    return u''.join(hiragana_to_katakana_map.get(ch, ch) for ch in string)
+
+
+def make_names(num_names):
+    random.seed(0)
+    names = []
+    for _ in xrange(num_names):
+        name = random.choice(FAMILY_NAMES) + random.choice(GIVEN_NAMES)
+        if random.random() < 0.5:
+            name = hiragana_to_katakana(name)
+        names.append(name)
+    return names
+
+
+def main(num_names):
+    names = make_names(num_names)
+    hiragana_names = [jautils.katakana_to_hiragana(name) for name in names]
+    # Both variants must agree on the output.
+    for name in names:
+        assert (scanning_katakana_to_hiragana(name) ==
+                jautils.katakana_to_hiragana(name))
+    for name in hiragana_names:
+        assert (scanning_hiragana_to_romaji(name) ==
+                jautils.hiragana_to_romaji(name))
+    for function, inputs in [
+            (scanning_katakana_to_hiragana, names),
+            (jautils.katakana_to_hiragana, names),
+            (scanning_hiragana_to_romaji, hiragana_names),
+            (jautils.hiragana_to_romaji, hiragana_names)]:
+        seconds = timeit.timeit(
+            lambda: [function(name) for name in inputs], number=REPEAT)
+        print '%-30s %8.2f us per name (%d names)' % (
+            function.__name__, seconds * 1000000 / REPEAT / len(inputs),
+            len(inputs))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
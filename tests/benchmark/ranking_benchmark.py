@@ -0,0 +1,88 @@
+# encoding=utf-8
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares pairwise (cmp-style) and key-based ranking of search results.
+
+Usage:
+  $ tools/benchmark ranking [num_candidates]
+
+indexing.search fetches up to 400 candidates before ranking them, so that is
+the default candidate count.  The pairwise variant recomputes the rank of
+both persons on every comparison, as the CmpResults comparator used to.
+"""
+
+import datetime
+import random
+import sys
+import timeit
+
+import indexing
+import model
+from text_query import TextQuery
+
+GIVEN_NAMES = [u'Bryan', u'Alexander', u'Maria', u'John', u'Yayoi', u'Miki',
+               u'港生', u'嘉平', u'聿銘', u'真']
+FAMILY_NAMES = [u'Smith', u'Garcia', u'Li', u'Takatsuki', u'Hoshii',
+                u'陳', u'余', u'貝', u'菊地', u'朱']
+QUERIES = [u'Bryan Smith', u'Smith', u'陳港生', u'陳 港生', u'菊地 真',
+           u'Maria Li']
+REPEAT = 20
+
+
+def make_candidates(num_candidates):
+    random.seed(0)
+    candidates = []
+    for i in xrange(num_candidates):
+        given_name = random.choice(GIVEN_NAMES)
+        family_name = random.choice(FAMILY_NAMES)
+        candidates.append(model.Person(
+            key_name='bench:bench.example.com/person.%d' % i,
+            repo='bench',
+            entry_date=datetime.datetime(2019, 1, 1),
+            given_name=given_name,
+            family_name=family_name,
+            full_name=u'%s %s' % (given_name, family_name),
+            alternate_names=u''))
+    return candidates
+
+
+def pairwise_sort(candidates, query):
+    ranker = indexing.Ranker(query)
+    def compare(p1, p2):
+        return cmp(ranker(p1), ranker(p2))
+    return sorted(candidates, cmp=compare)
+
+
+def key_sort(candidates, query):
+    return sorted(candidates, key=indexing.Ranker(query))
+
+
+def main(num_candidates):
+    candidates = make_candidates(num_candidates)
+    queries = [TextQuery(query) for query in QUERIES]
+    # Both variants must agree on the order.
+    for query in queries:
+        assert pairwise_sort(candidates, query) == key_sort(candidates, query)
+    for sort in [pairwise_sort, key_sort]:
+        seconds = timeit.timeit(
+            lambda: [sort(candidates, query) for query in queries],
+            number=REPEAT)
+        print '%-15s %8.3f ms per query (%d candidates)' % (
+            sort.__name__, seconds * 1000 / REPEAT / len(queries),
+            num_candidates)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
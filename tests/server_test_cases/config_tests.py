@@ -35,7 +35,6 @@ class ConfigTests(ServerTestsBase):
         setup.setup_configs()
 
         # Flush the configuration cache.
-        config.cache.enable(False)
         self.go('/haiti?lang=en&flush=config')
 
     def get_admin_page_error_message(self):
@@ -45,42 +44,30 @@ class ConfigTests(ServerTestsBase):
         else:
             return 'Whole page HTML:\n%s' % self.s.doc.content
 
-    def test_config_cache_enabling(self):
+    def test_config_cache(self):
         # The tests below flush the resource cache so that the effects of
         # the config cache become visible for testing.
-
-        # Modify the custom title directly in the datastore.
-        # With the config cache off, new values should appear immediately.
-        config.cache.enable(False)
-        db.put(config.ConfigEntry(key_name='haiti:repo_titles',
-                                  value='{"en": "FooTitle"}'))
+        config.set_for_repo('haiti', repo_titles={'en': 'FooTitle'})
         doc = self.go('/haiti?lang=en&flush=resource')
         assert 'FooTitle' in doc.text
-        db.put(config.ConfigEntry(key_name='haiti:repo_titles',
-                                  value='{"en": "BarTitle"}'))
-        doc = self.go('/haiti?lang=en&flush=resource')
-        assert 'BarTitle' in doc.text
 
-        # Now enable the config cache and load the main page again.
-        # This should pull the configuration value from database and cache it.
-        config.cache.enable(True)
-        doc = self.go('/haiti?lang=en&flush=config,resource')
+        # Settings written with config.set are seen right away.
+        config.set_for_repo('haiti', repo_titles={'en': 'BarTitle'})
+        doc = self.go('/haiti?lang=en&flush=resource')
         assert 'BarTitle' in doc.text
 
         # Modify the custom title directly in the datastore.
-        # The old message from the config cache should still be visible because
+        # The old title from the config cache should still be visible because
         # the config cache doesn't know that the datastore changed.
         db.put(config.ConfigEntry(key_name='haiti:repo_titles',
                                   value='{"en": "QuuxTitle"}'))
         doc = self.go('/haiti?lang=en&flush=resource')
         assert 'BarTitle' in doc.text
 
-        # After 10 minutes, the cache should pick up the new value.
-        self.advance_utcnow(seconds=601)
-        doc = self.go('/haiti?lang=en&flush=resource')
+        # After flushing the config cache, the new title is loaded.
+        doc = self.go('/haiti?lang=en&flush=config,resource')
         assert 'QuuxTitle' in doc.text
 
-
     def test_config_namespaces(self):
         # Tests the cache's ability to retrieve global or repository-specific
         # configuration entries.
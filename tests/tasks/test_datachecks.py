@@ -21,6 +21,7 @@ from google.appengine.api import taskqueue
 import mock
 import mox
 
+import model
 import tasksmodule
 import utils
 
@@ -38,7 +39,7 @@ def _test_deadline_exceeded(run_task_func, task_url):
     taskqueue.add(
         method='POST',
         url=task_url,
-        params={'cursor': None},
+        params={'cursor': None, 'report': mox.IsA(basestring)},
         queue_name='datachecks',
         retry_options=mox.IsA(taskqueue.taskqueue.TaskRetryOptions),
         name=mox.IsA(unicode))
@@ -50,13 +51,7 @@ def _test_deadline_exceeded(run_task_func, task_url):
     mox_obj.UnsetStubs()
 
 
-class PersonDataValidityCheckTaskTests(task_tests_base.TaskTestsBase):
-    """Tests the person record validity datacheck task.
-
-    We don't have a unit test for the missing entry date case, because
-    entry_date is required by the model (i.e., we cannot test it because we
-    cannot create a Person entity without it to test with).
-    """
+class DatachecksTaskTestsBase(task_tests_base.TaskTestsBase):
 
     def init_testbed_stubs(self):
         self.testbed.init_user_stub()
@@ -64,151 +59,159 @@ class PersonDataValidityCheckTaskTests(task_tests_base.TaskTestsBase):
         path_to_app = os.path.join(os.path.dirname(__file__), '../../app')
         self.testbed.init_taskqueue_stub(root_path=path_to_app)
 
+    def get_findings(self, kind_name):
+        """Gets the findings of the finished report for a kind."""
+        report = model.DatacheckReport.all().filter(
+            'kind_name =', kind_name).get()
+        self.assertIsNotNone(report.finish_time)
+        self.assertEqual(report.num_findings, len(report.findings))
+        return report.findings
+
+
+class PersonDatachecksTaskTests(DatachecksTaskTestsBase):
+    """Tests the person record datachecks task.
+
+    We don't have a unit test for the missing entry date case, because
+    entry_date is required by the model (i.e., we cannot test it because we
+    cannot create a Person entity without it to test with).
+    """
+
+    _NOW = datetime.datetime(2010, 2, 1)
+    _YESTERDAY = _NOW - datetime.timedelta(days=1, hours=1)
+
     def setUp(self):
-        super(PersonDataValidityCheckTaskTests, self).setUp()
+        super(PersonDatachecksTaskTests, self).setUp()
+        utils.set_utcnow_for_test(PersonDatachecksTaskTests._NOW)
         self.data_generator.repo(repo_id='haiti')
 
+    def run_checks(self):
+        self.run_task('/haiti/tasks/check_persons', method='POST')
+        return self.get_findings('Person')
+
     def test_good_data(self):
         self.data_generator.person()
-        self.run_task('/haiti/tasks/check_person_data_validity', method='POST')
+        self.assertEqual(self.run_checks(), [])
 
     def test_missing_original_creation_date(self):
-        self.data_generator.person(original_creation_date=None)
-        self.assertRaises(
-            tasksmodule.datachecks.DatacheckException,
-            self.run_task,
-            '/haiti/tasks/check_person_data_validity', method='POST')
+        person = self.data_generator.person(original_creation_date=None)
+        self.assertEqual(self.run_checks(), [
+            'A person record is missing an original_creation_date value'
+            '(%s).' % person.record_id])
 
     def test_invalid_author_email(self):
-        self.data_generator.person(author_email='not-a-valid-email-address')
-        self.assertRaises(
-            tasksmodule.datachecks.DatacheckException,
-            self.run_task,
-            '/haiti/tasks/check_person_data_validity', method='POST')
+        person = self.data_generator.person(
+            author_email='not-a-valid-email-address')
+        self.assertEqual(self.run_checks(), [
+            'A person record has an invalid author_email value (%s).' %
+            person.record_id])
+
+    def test_good_expired_record(self):
+        self.data_generator.person(
+            expiry_date=PersonDatachecksTaskTests._YESTERDAY,
+            given_name=None,
+            family_name=None,
+            home_city='',
+            home_state='',
+            home_postal_code='',
+            home_neighborhood='',
+            author_name='',
+            author_phone='',
+            author_email='',
+            source_name='',
+            source_url='')
+        self.assertEqual(self.run_checks(), [])
+
+    def test_unexpired_record(self):
+        expiry_date = (
+            PersonDatachecksTaskTests._NOW +
+            datetime.timedelta(days=1, hours=1))
+        self.data_generator.person(expiry_date=expiry_date)
+        self.assertEqual(self.run_checks(), [])
+
+    def test_expired_record_with_data(self):
+        person = self.data_generator.person(
+            expiry_date=PersonDatachecksTaskTests._YESTERDAY)
+        findings = self.run_checks()
+        self.assertTrue(findings)
+        for finding in findings:
+            self.assertTrue(finding.startswith(
+                'An expired person record still has data (%s, ' %
+                person.record_id))
+
+    def test_all_findings_collected(self):
+        """Tests that the scan goes on past the first problem, across
+        pages."""
+        with mock.patch(
+                'tasksmodule.datachecks.DatachecksBaseTask.PAGE_SIZE', 2):
+            for _ in range(3):
+                self.data_generator.person(original_creation_date=None)
+            self.data_generator.person()
+            self.assertEqual(len(self.run_checks()), 3)
 
     def test_deadline_exceeded(self):
         self.data_generator.person(author_email='abc@example.com')
 
         def run_task_func():
-            self.run_task(
-                '/haiti/tasks/check_person_data_validity', method='POST')
-        _test_deadline_exceeded(
-             run_task_func, '/haiti/tasks/check_person_data_validity')
+            self.run_task('/haiti/tasks/check_persons', method='POST')
+        _test_deadline_exceeded(run_task_func, '/haiti/tasks/check_persons')
 
 
-class NoteDataValidityCheckTaskTests(task_tests_base.TaskTestsBase):
-    """Tests the note validity datacheck task.
+class NoteDatachecksTaskTests(DatachecksTaskTestsBase):
+    """Tests the note datachecks task.
 
     Doesn't test the missing entry date or missing Person record ID case,
     because those fields are required by the model class.
     """
 
-    def init_testbed_stubs(self):
-        self.testbed.init_user_stub()
-        self.testbed.init_datastore_v3_stub()
-        path_to_app = os.path.join(os.path.dirname(__file__), '../../app')
-        self.testbed.init_taskqueue_stub(root_path=path_to_app)
-
     def setUp(self):
-        super(NoteDataValidityCheckTaskTests, self).setUp()
+        super(NoteDatachecksTaskTests, self).setUp()
         self.data_generator.repo(repo_id='haiti')
         self.person = self.data_generator.person()
 
+    def run_checks(self):
+        self.run_task('/haiti/tasks/check_notes', method='POST')
+        return self.get_findings('Note')
+
     def test_good_data(self):
         self.data_generator.note(person_id=self.person.record_id)
-        self.run_task('/haiti/tasks/check_note_data_validity', method='POST')
+        self.assertEqual(self.run_checks(), [])
 
     def test_missing_original_creation_date(self):
-        self.data_generator.note(
+        note = self.data_generator.note(
             person_id=self.person.record_id, original_creation_date=None)
-        self.assertRaises(
-            tasksmodule.datachecks.DatacheckException,
-            self.run_task,
-            '/haiti/tasks/check_note_data_validity', method='POST')
+        self.assertEqual(self.run_checks(), [
+            'A note record is missing an original_creation_date value (%s).'
+            % note.record_id])
 
     def test_invalid_author_email(self):
-        self.data_generator.note(
+        note = self.data_generator.note(
             person_id=self.person.record_id,
             author_email='not-a-valid-email-address')
-        self.assertRaises(
-            tasksmodule.datachecks.DatacheckException,
-            self.run_task,
-            '/haiti/tasks/check_note_data_validity', method='POST')
+        self.assertEqual(self.run_checks(), [
+            'A note record has an invalid author_email value (%s).' %
+            note.record_id])
 
     def test_invalid_email_of_found_person(self):
-        self.data_generator.note(
+        note = self.data_generator.note(
             person_id=self.person.record_id,
             email_of_found_person='not-a-valid-email-address')
-        self.assertRaises(
-            tasksmodule.datachecks.DatacheckException,
-            self.run_task,
-            '/haiti/tasks/check_note_data_validity', method='POST')
+        self.assertEqual(self.run_checks(), [
+            'A note record has an invalid email_of_found_person value (%s).'
+            % note.record_id])
 
     def test_missing_person_record(self):
-        self.data_generator.note(person_id='not-an-existing-person-record')
-        self.assertRaises(
-            tasksmodule.datachecks.DatacheckException,
-            self.run_task,
-            '/haiti/tasks/check_note_data_validity', method='POST')
+        self.data_generator.note(person_id=self.person.record_id)
+        note = self.data_generator.note(
+            person_id='not-an-existing-person-record')
+        self.assertEqual(self.run_checks(), [
+            'A note record\'s associated person record is missing (%s).' %
+            note.record_id])
 
     def test_deadline_exceeded(self):
-        person = self.data_generator.person()
         self.data_generator.note(
-            person_id=person.record_id,
+            person_id=self.person.record_id,
             author_email='xyz@example.com')
 
         def run_task_func():
-            self.run_task(
-                '/haiti/tasks/check_person_data_validity', method='POST')
-        _test_deadline_exceeded(
-             run_task_func, '/haiti/tasks/check_person_data_validity')
-
-
-class ExpiredPersonRecordCheckTaskTest(task_tests_base.TaskTestsBase):
-
-    _NOW = datetime.datetime(2010, 2, 1)
-    _YESTERDAY = _NOW - datetime.timedelta(days=1, hours=1)
-
-    def init_testbed_stubs(self):
-        self.testbed.init_user_stub()
-        self.testbed.init_datastore_v3_stub()
-        path_to_app = os.path.join(os.path.dirname(__file__), '../../app')
-        self.testbed.init_taskqueue_stub(root_path=path_to_app)
-
-    def setUp(self):
-        super(ExpiredPersonRecordCheckTaskTest, self).setUp()
-        utils.set_utcnow_for_test(ExpiredPersonRecordCheckTaskTest._NOW)
-        self.data_generator.repo(repo_id='haiti')
-
-    def test_good_expired_record(self):
-        self.data_generator.person(
-            expiry_date=ExpiredPersonRecordCheckTaskTest._YESTERDAY,
-            given_name=None,
-            family_name=None,
-            home_city='',
-            home_state='',
-            home_postal_code='',
-            home_neighborhood='',
-            author_name='',
-            author_phone='',
-            author_email='',
-            source_name='',
-            source_url='')
-        self.run_task(
-            '/haiti/tasks/check_expired_person_records', method='POST')
-
-    def test_unexpired_record(self):
-        expiry_date = (
-            ExpiredPersonRecordCheckTaskTest._NOW +
-            datetime.timedelta(days=1, hours=1))
-        self.data_generator.person(expiry_date=expiry_date)
-        self.run_task(
-            '/haiti/tasks/check_expired_person_records', method='POST')
-
-    def test_expired_record_with_data(self):
-        self.data_generator.person(
-            expiry_date=ExpiredPersonRecordCheckTaskTest._YESTERDAY)
-        self.assertRaises(
-            tasksmodule.datachecks.DatacheckException,
-            self.run_task,
-            '/haiti/tasks/check_expired_person_records', method='POST')
+            self.run_task('/haiti/tasks/check_notes', method='POST')
+        _test_deadline_exceeded(run_task_func, '/haiti/tasks/check_notes')
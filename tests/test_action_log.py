@@ -0,0 +1,150 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for action_log.py."""
+
+import datetime
+import os
+import unittest
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import db
+from google.appengine.ext import testbed
+import mock
+
+import action_log
+import model
+import tasks
+import test_handler
+
+
+class ActionLogTests(unittest.TestCase):
+    # Makes a request look like it comes from the task queue.
+    TASK_ENVIRON = {'HTTP_X_APPENGINE_TASKNAME': 'notempty'}
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        # root_path must be set the the location of queue.yaml.
+        path_to_app = os.path.join(os.path.dirname(__file__), '../app')
+        self.testbed.init_taskqueue_stub(root_path=path_to_app)
+        self.taskqueue_stub = self.testbed.get_stub(
+            testbed.TASKQUEUE_SERVICE_NAME)
+        self.person = model.Person(
+            key_name='haiti:test.google.com/person.1',
+            repo='haiti',
+            given_name='John',
+            family_name='Smith',
+            entry_date=datetime.datetime(2010, 1, 1))
+
+    def tearDown(self):
+        action_log.end_request()
+        self.testbed.deactivate()
+
+    def test_writes_right_away_outside_of_requests(self):
+        model.UserActionLog.put_new('add', self.person)
+        assert model.UserActionLog.all().count() == 1
+
+    def run_write_task(self, payload, environ=None):
+        handler = test_handler.initialize_handler(
+            tasks.WriteActionLogs, tasks.WriteActionLogs.ACTION,
+            repo='global', environ=environ)
+        handler.request.body = payload
+        handler.post()
+        return handler.response
+
+    def test_writes_at_end_of_request(self):
+        action_log.begin_request()
+        model.UserActionLog.put_new('add', self.person)
+        model.UserActionLog.put_new('hide', self.person, copy_properties=False)
+        assert model.UserActionLog.all().count() == 0
+        action_log.end_request()
+        logs = model.UserActionLog.all().order('action').fetch(10)
+        assert [log.action for log in logs] == ['add', 'hide']
+        assert logs[0].Person_given_name == 'John'
+        assert not self.taskqueue_stub.get_filtered_tasks(
+            queue_names=action_log.WRITE_TASK_QUEUE_NAME)
+
+    def test_writes_in_task_near_deadline(self):
+        action_log.begin_request(deadline_seconds=1)
+        model.UserActionLog.put_new('add', self.person)
+        action_log.end_request()
+        assert model.UserActionLog.all().count() == 0
+        tasks = self.taskqueue_stub.get_filtered_tasks(
+            queue_names=action_log.WRITE_TASK_QUEUE_NAME)
+        assert len(tasks) == 1
+        assert tasks[0].url == action_log.WRITE_TASK_URL
+        self.run_write_task(tasks[0].payload, self.TASK_ENVIRON)
+        log = model.UserActionLog.all().get()
+        assert log.action == 'add'
+        assert log.Person_given_name == 'John'
+
+    def test_writes_in_task_when_put_fails(self):
+        action_log.begin_request()
+        model.UserActionLog.put_new('add', self.person)
+        with mock.patch('google.appengine.ext.db.put_async',
+                        side_effect=db.Timeout()):
+            action_log.end_request()
+        tasks = self.taskqueue_stub.get_filtered_tasks(
+            queue_names=action_log.WRITE_TASK_QUEUE_NAME)
+        assert len(tasks) == 1
+
+    def test_splits_entries_into_tasks(self):
+        action_log.begin_request(deadline_seconds=1)
+        for _ in range(action_log.ENTRIES_PER_TASK + 1):
+            model.UserActionLog.put_new('add', self.person)
+        action_log.end_request()
+        tasks = self.taskqueue_stub.get_filtered_tasks(
+            queue_names=action_log.WRITE_TASK_QUEUE_NAME)
+        assert len(tasks) == 2
+
+    def test_limits_task_payload_size(self):
+        self.person.description = 'x' * (
+            action_log.MAX_TASK_PAYLOAD_BYTES // 2)
+        action_log.begin_request(deadline_seconds=1)
+        for _ in range(3):
+            model.UserActionLog.put_new('add', self.person)
+        action_log.end_request()
+        tasks = self.taskqueue_stub.get_filtered_tasks(
+            queue_names=action_log.WRITE_TASK_QUEUE_NAME)
+        assert len(tasks) == 3
+        for task in tasks:
+            assert len(task.payload) <= action_log.MAX_TASK_PAYLOAD_BYTES
+
+    def test_logs_keys_but_not_properties_on_failure(self):
+        action_log.begin_request(deadline_seconds=1)
+        model.UserActionLog.put_new('add', self.person)
+        with mock.patch('google.appengine.api.taskqueue.Queue.add',
+                        side_effect=taskqueue.TransientError()):
+            with mock.patch('logging.error') as error_mock:
+                action_log.end_request()
+        message = error_mock.call_args[0][0]
+        assert self.person.key().name() in message
+        assert 'John' not in message
+
+    def test_write_task_rejects_other_requests(self):
+        payload = action_log.serialize([model.UserActionLog(
+            time=datetime.datetime(2010, 1, 1), repo='haiti', action='add',
+            entity_kind='Person', entity_key_name=self.person.key().name())])
+        response = self.run_write_task(payload)
+        assert response.status_int == 403
+        assert model.UserActionLog.all().count() == 0
+
+    def test_write_task_rejects_other_kinds(self):
+        response = self.run_write_task(
+            action_log.serialize([self.person]), self.TASK_ENVIRON)
+        assert response.status_int == 400
+        assert model.Person.all().count() == 0
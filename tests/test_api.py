@@ -19,9 +19,12 @@ __author__ = 'ichikawa@google.com (Hiroshi Ichikawa)'
 import datetime
 import unittest
 
+import mock
+
 import api
 import model
 import test_handler
+import utils
 
 from google.appengine.ext import testbed
 
@@ -65,3 +68,34 @@ class APITests(unittest.TestCase):
             home_state='California',
             entry_date=datetime.datetime(2010, 1, 1))
         assert handler.render_person(person) == 'John Smith / From: California'
+
+    def test_sms_add_is_counted(self):
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        handler = test_handler.initialize_handler(
+            api.HandleSMS, 'api/handle_sms', repo='global')
+        handler.auth = model.Authorization.create(
+            '*', 'sms_key', search_permission=True,
+            domain_write_permission='*')
+        handler.config = utils.Struct(
+            sms_number_to_repo={'+12345678901': 'haiti'},
+            enable_sms_record_input=True)
+        handler.request.body = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            '<request>\n'
+            '  <message_text>I am John Smith</message_text>\n'
+            '  <receiver_phone_number>+12345678901</receiver_phone_number>\n'
+            '</request>\n')
+        with mock.patch.object(handler, 'send_hit_to_google_analytics'), \
+                mock.patch.object(model.LiveCounter, 'add_changes_multi') \
+                as add_changes_multi:
+            handler.post()
+        person = model.Person.all().filter('repo =', 'haiti').get()
+        assert person.full_name == 'John Smith'
+        assert person.latest_status == 'is_note_author'
+        # The Note is counted, and then the Person with its Note.
+        changes = [call[0][1] for call in add_changes_multi.call_args_list]
+        assert [change.keys() for change in changes] == [['note'], ['person']]
+        assert 'num_notes=1' in changes[1]['person'][1]
+        assert 'status=is_note_author' in changes[1]['person'][1]
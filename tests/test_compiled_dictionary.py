@@ -0,0 +1,104 @@
+# encoding: utf-8
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for compiled_dictionary.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import compiled_dictionary
+
+DICTIONARY_TEXT = u'''# A comment.
+山田\tやまだ
+太郎\tたろう
+山田\tやまだ
+菊地\tきくち
+
+真\tまこと
+真\tしん
+'''
+
+
+class CompiledDictionaryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.dir, 'dict.txt')
+        with open(self.file_name, 'wb') as f:
+            f.write(DICTIONARY_TEXT.encode('utf-8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_entries(self):
+        entries = compiled_dictionary.read_entries(self.file_name)
+        assert entries.keys() == [u'山田', u'太郎', u'菊地', u'真']
+        assert entries[u'山田'] == [u'やまだ']
+        assert entries[u'真'] == [u'まこと', u'しん']
+
+    def test_lookup(self):
+        compiled_dictionary.compile_file(self.file_name)
+        dictionary = compiled_dictionary.open_compiled(self.file_name)
+        assert len(dictionary) == 4
+        assert dictionary[u'山田'] == set([u'やまだ'])
+        assert dictionary[u'真'] == set([u'まこと', u'しん'])
+        assert u'菊地' in dictionary
+        assert u'山' not in dictionary
+        assert u'' not in dictionary
+        assert u'￿' not in dictionary
+        assert dictionary.get(u'花子') is None
+        self.assertRaises(KeyError, lambda: dictionary[u'花子'])
+
+    def test_out_of_date_compiled_file_is_not_used(self):
+        assert compiled_dictionary.open_compiled(self.file_name) is None
+        compiled_dictionary.compile_file(self.file_name)
+        with open(self.file_name, 'ab') as f:
+            f.write(u'花子\tはなこ\n'.encode('utf-8'))
+        assert compiled_dictionary.open_compiled(self.file_name) is None
+
+    def test_same_size_edit_is_out_of_date(self):
+        compiled_dictionary.compile_file(self.file_name)
+        with open(self.file_name, 'wb') as f:
+            f.write(DICTIONARY_TEXT.replace(u'太郎', u'次郎').encode('utf-8'))
+        assert compiled_dictionary.open_compiled(self.file_name) is None
+
+    def test_checked_in_files_are_up_to_date(self):
+        app_dir = os.path.join(os.path.dirname(__file__), '..', 'app')
+        for file_name in ['japanese_name_location_dict.txt',
+                          'chinese_family_name_dict.txt']:
+            assert compiled_dictionary.open_compiled(
+                os.path.join(app_dir, file_name)), (
+                    'Run tools/compile_dictionaries and check in the result.')
+
+    def test_lazy_dictionary(self):
+        loaded = []
+        def read_text_file(file_name):
+            loaded.append(file_name)
+            return {u'花子': set([u'はなこ'])}
+        dictionary = compiled_dictionary.LazyDictionary(
+            self.file_name, read_text_file)
+        assert not loaded
+        # Without a compiled file, the text file is read once.
+        assert dictionary[u'花子'] == set([u'はなこ'])
+        assert u'花子' in dictionary
+        assert loaded == [self.file_name]
+
+        compiled_dictionary.compile_file(self.file_name)
+        dictionary = compiled_dictionary.LazyDictionary(
+            self.file_name, read_text_file)
+        assert dictionary[u'太郎'] == set([u'たろう'])
+        assert loaded == [self.file_name]
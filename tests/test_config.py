@@ -0,0 +1,88 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for config.py."""
+
+import unittest
+
+from google.appengine.api import memcache
+from google.appengine.ext import db
+from google.appengine.ext import testbed
+import mock
+
+import config
+
+
+class ConfigurationCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        config.cache.flush()
+        config.set_for_repo('*', language_menu_options=['en'])
+        config.set_for_repo('haiti', repo_titles={'en': 'Haiti'})
+
+    def tearDown(self):
+        config.cache.flush()
+        self.testbed.deactivate()
+
+    def test_configuration(self):
+        cfg = config.Configuration('haiti')
+        assert cfg.repo_titles == {'en': 'Haiti'}
+        assert cfg.language_menu_options == ['en']
+        assert config.get_for_repo('haiti', 'language_menu_options') == ['en']
+        assert config.Configuration('haiti', include_global=False).get(
+            'language_menu_options') is None
+
+    def test_no_queries_when_cached(self):
+        config.Configuration('haiti')
+        with_queries = config.cache.stats()
+        with mock.patch.object(
+                config.ConfigEntry, 'all', side_effect=AssertionError):
+            assert config.Configuration('haiti').repo_titles == {'en': 'Haiti'}
+        assert config.cache.stats()['hits'] == with_queries['hits'] + 2
+
+    def test_write_seen_by_other_instances(self):
+        other_instance = config.ConfigurationCache()
+        assert other_instance.get_config('haiti', 'repo_titles') == {
+            'en': 'Haiti'}
+        config.set_for_repo('haiti', repo_titles={'en': 'Haiti 2'})
+        assert other_instance.get_config('haiti', 'repo_titles') == {
+            'en': 'Haiti 2'}
+        assert other_instance.stats()['stale'] == 1
+
+    def test_writes_outside_of_set_are_not_seen(self):
+        assert config.get('repo_titles', repo='haiti') == {'en': 'Haiti'}
+        db.put(config.ConfigEntry(key_name='haiti:repo_titles',
+                                  value='{"en": "Haiti 2"}'))
+        assert config.get('repo_titles', repo='haiti') == {'en': 'Haiti'}
+        # Until the version stamp is lost, e.g. when memcache is flushed.
+        memcache.flush_all()
+        assert config.get('repo_titles', repo='haiti') == {'en': 'Haiti 2'}
+
+    def test_settings_reloaded_after_cache_seconds(self):
+        now = 1000000
+        with mock.patch('time.time', return_value=now):
+            assert config.get('repo_titles', repo='haiti') == {'en': 'Haiti'}
+        # A write that the query missed, or that skipped set().
+        db.put(config.ConfigEntry(key_name='haiti:repo_titles',
+                                  value='{"en": "Haiti 2"}'))
+        with mock.patch('time.time', return_value=now + 1):
+            assert config.get('repo_titles', repo='haiti') == {'en': 'Haiti'}
+        with mock.patch('time.time',
+                        return_value=now + config.CACHE_SECONDS + 1):
+            assert config.get('repo_titles', repo='haiti') == {
+                'en': 'Haiti 2'}
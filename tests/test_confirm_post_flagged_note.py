@@ -0,0 +1,80 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for confirm_post_flagged_note.py."""
+
+import datetime
+import unittest
+
+from google.appengine.ext import testbed
+import mock
+
+import confirm_post_flagged_note
+import model
+import test_handler
+from utils import get_utcnow, set_utcnow_for_test
+
+
+class ConfirmPostFlaggedNoteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_user_stub()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        set_utcnow_for_test(datetime.datetime(2010, 1, 1))
+        model.Repo(key_name='haiti').put()
+        self.person = model.Person.create_original(
+            'haiti', given_name='John', family_name='Smith',
+            full_name='John Smith', entry_date=get_utcnow())
+        self.person.put()
+        self.note = model.Note.create_original(
+            'haiti', person_record_id=self.person.record_id,
+            status=u'believed_missing', entry_date=get_utcnow(),
+            source_date=get_utcnow())
+        self.note.put()
+        self.person.update_from_note(self.note)
+        self.person.put()
+        self.flagged_note = model.NoteWithBadWords.create_original(
+            'haiti', person_record_id=self.person.record_id,
+            author_name='Alice', status=u'believed_alive',
+            entry_date=get_utcnow(), source_date=get_utcnow(),
+            text='bad words', spam_score=1.0, confirmed=False)
+        self.flagged_note.put()
+
+    def tearDown(self):
+        set_utcnow_for_test(None)
+        self.testbed.deactivate()
+
+    def test_confirmed_note_is_counted(self):
+        handler = test_handler.initialize_handler(
+            confirm_post_flagged_note.Handler, 'confirm_post_flagged_note')
+        with mock.patch('subscribe.send_notifications'), \
+                mock.patch.object(model.LiveCounter, 'add_changes_multi') \
+                as add_changes_multi:
+            handler.confirm_note_with_bad_words(self.flagged_note)
+        assert add_changes_multi.call_count == 1
+        repo, changes = add_changes_multi.call_args[0]
+        assert repo == 'haiti'
+        assert changes['note'][1]
+        # The Person goes from one Note to two, and to the new status.
+        old_names, new_names = changes['person']
+        assert 'num_notes=1' in old_names
+        assert 'status=believed_missing' in old_names
+        assert 'num_notes=2' in new_names
+        assert 'status=believed_alive' in new_names
+        assert model.Person.get(
+            'haiti', self.person.record_id).latest_status == 'believed_alive'
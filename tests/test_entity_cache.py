@@ -0,0 +1,81 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for entity_cache.py."""
+
+import datetime
+import unittest
+
+from google.appengine.ext import db
+from google.appengine.ext import testbed
+
+import entity_cache
+import model
+
+
+class EntityCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        model.Repo(key_name='haiti').put()
+        self.person = model.Person(
+            key_name='haiti:test.google.com/person.1',
+            repo='haiti',
+            given_name='John',
+            family_name='Smith',
+            entry_date=datetime.datetime(2010, 1, 1))
+        self.person.put()
+
+    def tearDown(self):
+        entity_cache.end_request()
+        self.testbed.deactivate()
+
+    def test_no_cache_outside_of_requests(self):
+        assert model.Repo.get('haiti') is not model.Repo.get('haiti')
+        assert entity_cache.get_stats() is None
+
+    def test_same_entity_within_request(self):
+        entity_cache.begin_request()
+        repo = model.Repo.get('haiti')
+        assert model.Repo.get('haiti') is repo
+        person = model.Person.get('haiti', 'test.google.com/person.1')
+        assert model.Person.get_all(
+            'haiti', ['test.google.com/person.1'])[0] is person
+        assert model.Repo.get('japan') is None
+        assert model.Repo.get('japan') is None
+        assert entity_cache.get_stats() == {'gets': 6, 'saved': 3}
+
+    def test_cleared_on_put_and_delete(self):
+        entity_cache.begin_request()
+        assert model.Repo.get('japan') is None
+        model.Repo(key_name='japan').put()
+        assert model.Repo.get('japan') is not None
+        person = model.Person.get('haiti', 'test.google.com/person.1')
+        person.given_name = 'Johnny'
+        db.put([person])
+        assert model.Person.get(
+            'haiti', 'test.google.com/person.1').given_name == 'Johnny'
+        db.delete(person)
+        assert model.Person.get('haiti', 'test.google.com/person.1') is None
+        assert entity_cache.get_stats()['saved'] == 0
+
+    def test_new_map_for_each_request(self):
+        entity_cache.begin_request()
+        repo = model.Repo.get('haiti')
+        entity_cache.end_request()
+        entity_cache.begin_request()
+        assert model.Repo.get('haiti') is not repo
@@ -23,6 +23,7 @@ from google.appengine.ext import testbed
 from google.appengine.api import search
 import sys
 import logging
+import mock
 import delete
 import full_text_search
 import model
@@ -408,6 +409,149 @@ class FullTextSearchTests(unittest.TestCase):
                set(['haiti/0910'])
 
 
+    def test_add_records_to_index(self):
+        db.put([self.p1, self.p4, self.p7])
+        failures = full_text_search.add_records_to_index(
+            [self.p1, self.p4, self.p7])
+        assert failures == []
+        results = full_text_search.search('haiti', {'name': 'Miki'}, 5)
+        assert [r.record_id for r in results] == ['haiti/1123']
+        results = full_text_search.search('haiti', {'name': 'Hibiki'}, 5)
+        assert [r.record_id for r in results] == ['haiti/1010']
+
+    def test_add_records_to_index_reports_bad_documents(self):
+        db.put([self.p1, self.p4])
+        create_document = full_text_search.create_document
+        def fake_create_document(person, *args):
+            if person.record_id == 'haiti/0505':
+                raise ValueError('bad document')
+            return create_document(person, *args)
+        with mock.patch('full_text_search.create_document',
+                        side_effect=fake_create_document):
+            failures = full_text_search.add_records_to_index(
+                [self.p1, self.p4])
+        assert failures == [(self.p1, 'bad document')]
+        # The other document in the batch was still indexed.
+        results = full_text_search.search('haiti', {'name': 'Miki'}, 5)
+        assert [r.record_id for r in results] == ['haiti/1123']
+
+    def test_create_compact_document(self):
+        doc = full_text_search.create_document(
+            self.p1, full_text_search.DOCUMENT_FORMAT_COMPACT)
+        fields = dict((field.name, field.value) for field in doc.fields)
+        assert doc.doc_id == 'haiti:haiti/0505'
+        assert fields['document_format'] == 2
+        names = fields['names'].split()
+        assert 'Iorin' in names
+        assert 'IoriMinase' in names
+        assert 'MinaseIori' in names
+        assert not [name for name in fields if 'romanized' in name]
+
+    def test_join_unique(self):
+        assert full_text_search.join_unique(
+            ['Iori', '', 'Minase', 'Iori', None, 'Iori Minase']) == (
+                'Iori Minase Iori Minase')
+
+    def test_search_compact_documents(self):
+        import config
+        config.set(full_text_document_format=
+                   full_text_search.DOCUMENT_FORMAT_COMPACT)
+        config.set_for_repo('haiti', full_text_query_format=
+                            full_text_search.DOCUMENT_FORMAT_COMPACT)
+        db.put([self.p1, self.p4, self.p6])
+        assert full_text_search.add_records_to_index(
+            [self.p1, self.p4, self.p6]) == []
+        results = full_text_search.search('haiti', {'name': 'Iorin'}, 5)
+        assert [r.record_id for r in results] == ['haiti/0505']
+        results = full_text_search.search('haiti', {'name': 'MinaseIori'}, 5)
+        assert [r.record_id for r in results] == ['haiti/0505']
+        results = full_text_search.search(
+            'haiti', {'name': 'Chihaya', 'location': 'Kumamoto'}, 5)
+        assert [r.record_id for r in results] == ['haiti/0225']
+        # Names and locations only match their own fields.
+        results = full_text_search.search('haiti', {'name': 'Kumamoto'}, 5)
+        assert not results
+        results = full_text_search.search(
+            'haiti', {'name': 'Miki', 'location': 'Iorin'}, 5)
+        assert not results
+
+    def test_search_drops_expired_records(self):
+        self.p4.is_expired = True
+        db.put([self.p4, self.p7])
+        full_text_search.add_records_to_index([self.p4, self.p7])
+        results = full_text_search.search('haiti', {'name': 'Miki'}, 5)
+        assert not results
+        results = full_text_search.search('haiti', {'name': 'Hibiki'}, 5)
+        assert [r.record_id for r in results] == ['haiti/1010']
+
+    def test_query_matcher(self):
+        matcher = full_text_search.QueryMatcher('iori minase')
+        assert matcher.matches(['Iori:Minase', 'Iorin'])
+        assert not matcher.matches(['Iori', 'Takatsuki'])
+        assert full_text_search.QueryMatcher('').matches([])
+        # Regular expression characters in the query are matched literally.
+        matcher = full_text_search.QueryMatcher('(a+)+$ i.ri')
+        assert not matcher.matches(['aaaaaaaaaaaaaaaaaaaaaaaaaaaa!', 'Iori'])
+        assert matcher.matches(['(a+)+$', 'i.ri'])
+
+    def test_per_repo_index(self):
+        import config
+        index_name = full_text_search.get_per_repo_index_name('haiti')
+        db.put([self.p1, self.p4])
+        full_text_search.add_record_to_index(self.p1)
+
+        # While migrating, new documents go to both indexes.
+        config.set_for_repo('haiti', full_text_migrating_index_name=index_name)
+        full_text_search.add_records_to_index([self.p4])
+        full_text_search.add_records_to_index([self.p1], index_name=index_name)
+        results = full_text_search.search('haiti', {'name': 'Miki'}, 5)
+        assert [r.record_id for r in results] == ['haiti/1123']
+
+        # Switch reads to the new index.
+        config.set_for_repo('haiti', full_text_index_name=index_name,
+                            full_text_migrating_index_name=None)
+        results = full_text_search.search('haiti', {'name': 'Iori'}, 5)
+        assert [r.record_id for r in results] == ['haiti/0505']
+        results = full_text_search.search('haiti', {'name': 'Miki'}, 5)
+        assert [r.record_id for r in results] == ['haiti/1123']
+
+        assert full_text_search.delete_index('haiti')
+        assert not full_text_search.search('haiti', {'name': 'Miki'}, 5)
+        # The shared index is never deleted.
+        config.set_for_repo('haiti', full_text_index_name=None)
+        assert not full_text_search.delete_index('haiti')
+        results = full_text_search.search('haiti', {'name': 'Miki'}, 5)
+        assert [r.record_id for r in results] == ['haiti/1123']
+
+    def get_doc_ids(self, index_name):
+        return [document.doc_id for document in search.Index(
+            name=index_name).get_range(ids_only=True)]
+
+    def test_delete_record_after_migration(self):
+        import config
+        index_name = full_text_search.get_per_repo_index_name('haiti')
+        db.put(self.p4)
+        full_text_search.add_record_to_index(self.p4)
+        full_text_search.add_records_to_index([self.p4], index_name=index_name)
+        # Reads have switched, but the shared index hasn't been cleaned yet.
+        config.set_for_repo('haiti', full_text_index_name=index_name,
+                            full_text_shared_index_cleanup_pending=True)
+        full_text_search.delete_record_from_index(self.p4)
+        assert not self.get_doc_ids(index_name)
+        assert not self.get_doc_ids(
+            full_text_search.PERSON_LOCATION_FULL_TEXT_INDEX_NAME)
+
+    def test_delete_from_shared_index(self):
+        other = model.Person.create_original_with_record_id(
+            'haiti2', 'haiti2/0505', given_name='Iori', family_name='Minase',
+            full_name='Iori Minase', entry_date=TEST_DATETIME)
+        db.put([self.p1, self.p4, other])
+        full_text_search.add_records_to_index([self.p1, self.p4, other])
+        full_text_search.delete_from_shared_index('haiti')
+        assert self.get_doc_ids(
+            full_text_search.PERSON_LOCATION_FULL_TEXT_INDEX_NAME) == [
+                'haiti2:haiti2/0505']
+
     def test_delete_record_from_index(self):
         db.put(self.p4)
         full_text_search.add_record_to_index(self.p4)
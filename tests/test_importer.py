@@ -18,8 +18,10 @@ import datetime
 import unittest
 
 from google.appengine.ext import db
+import mock
 from pytest import raises
 
+import config
 import model
 import importer
 
@@ -44,6 +46,7 @@ class ImporterTests(unittest.TestCase):
     def tearDown(self):
         db.delete(model.Person.all())
         db.delete(model.Note.all())
+        db.delete(model.UsageCounter.all())
 
     def test_strip(self):
         assert importer.strip('') == ''
@@ -205,6 +208,43 @@ class ImporterTests(unittest.TestCase):
         # Also confirm that 15 records were put into the datastore.
         assert model.Person.all().count() == 15
 
+    def test_import_counts_new_records(self):
+        records = [{'given_name': 'given_name_%d' % i,
+                    'family_name': 'family_name_%d' % i,
+                    'person_record_id': 'test_domain/%d' % i,
+                    'source_date': '2010-01-01T01:23:45Z'}
+                   for i in range(3)]
+        importer.import_records(
+            'haiti', 'test_domain', importer.create_person, records[:2])
+        assert model.UsageCounter.get('haiti').person == 2
+        # Only the record that didn't exist yet is counted.
+        importer.import_records(
+            'haiti', 'test_domain', importer.create_person, records)
+        assert model.UsageCounter.get('haiti').person == 3
+
+    def test_import_logs_index_failures(self):
+        records = [{'given_name': 'given_name_%d' % i,
+                    'family_name': 'family_name_%d' % i,
+                    'person_record_id': 'test_domain/%d' % i,
+                    'source_date': '2010-01-01T01:23:45Z'}
+                   for i in range(2)]
+        config.set(enable_fulltext_search=True)
+        try:
+            with mock.patch('full_text_search.add_records_to_index',
+                            side_effect=lambda persons: [
+                                (persons[0], 'Bad document')]), \
+                 mock.patch('logging.error') as log_error:
+                written, skipped, total = importer.import_records(
+                    'haiti', 'test_domain', importer.create_person, records)
+        finally:
+            config.set(enable_fulltext_search=None)
+        # The person is written, so it's counted and not skipped.
+        assert written == 2
+        assert skipped == []
+        assert log_error.call_count == 1
+        message = log_error.call_args[0][0]
+        assert 'haiti:test_domain/' in message
+
     def test_import_note_records(self):
         # Prepare person records which the notes will be added to.
         for domain in ['test_domain', 'other_domain']:
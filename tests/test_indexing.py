@@ -17,10 +17,12 @@
 
 __author__ = 'eyalf@google.com (Eyal Fink)'
 
+from google.appengine.api import memcache
 from google.appengine.ext import db
 import datetime
 import indexing
 import logging
+import mock
 import model
 import sys
 import unittest
@@ -37,9 +39,11 @@ def create_person(given_name, family_name):
 class IndexingTests(unittest.TestCase):
     def setUp(self):
         db.delete(model.Person.all())
+        memcache.flush_all()
 
     def tearDown(self):
         db.delete(model.Person.all())
+        memcache.flush_all()
 
     def add_persons(self, *persons):
         for p in persons:
@@ -81,6 +85,14 @@ class IndexingTests(unittest.TestCase):
         assert ['%s %s'%(p.given_name, p.family_name) for p in sorted] == \
             ['abc efg', 'ABC EFG', 'ABC efghij']
 
+    def test_rank_ties_sorted_by_name(self):
+        res = [create_person(given_name='Bryan', family_name='zzz'),
+               create_person(given_name='Bryan', family_name='aaa'),
+               create_person(given_name='Bryan', family_name='mmm')]
+        sorted = indexing.rank_and_order(res, TextQuery('Bryan'), 100)
+        assert ['%s %s'%(p.given_name, p.family_name) for p in sorted] == \
+            ['Bryan aaa', 'Bryan mmm', 'Bryan zzz']
+
     def test_cjk_ranking_1(self):
         # This is Jackie Chan's Chinese name.  His family name is CHAN and given
         # name is KONG + SANG; the usual Chinese order is CHAN + KONG + SANG.
@@ -159,6 +171,70 @@ class IndexingTests(unittest.TestCase):
         assert indexing.sort_query_words(
             ['CCC', 'BB', 'AA', 'A']) == ['CCC', 'AA', 'BB', 'A']
 
+    def count_tokens(self, *persons):
+        """Builds the token counts of the given persons, as the person scan
+        does."""
+        counts = {}
+        for person in persons:
+            for token in person.names_prefixes:
+                counts[token] = counts.get(token, 0) + 1
+        indexing.start_token_counts('test')
+        indexing.add_token_counts('test', counts)
+        indexing.finish_token_counts('test')
+
+    def test_token_counts(self):
+        bryan_abc = create_person(given_name='Bryan', family_name='abc')
+        bryan_efg = create_person(given_name='Bryan', family_name='efg')
+        self.add_persons(bryan_abc, bryan_efg)
+        # Indexing doesn't count, since writes can't tell new tokens from old.
+        assert indexing.get_token_counts('test', ['BRYAN']) == {}
+
+        self.count_tokens(bryan_abc, bryan_efg)
+        assert indexing.get_token_counts('test', ['BRYAN', 'ABC', 'XYZ']) == {
+            'BRYAN': 2, 'ABC': 1}
+
+        # The counts being built aren't read until they're finished.
+        indexing.start_token_counts('test')
+        indexing.add_token_counts('test', {'BRYAN': 1})
+        assert indexing.get_token_counts('test', ['BRYAN', 'ABC']) == {
+            'BRYAN': 2, 'ABC': 1}
+        indexing.finish_token_counts('test')
+        assert indexing.get_token_counts('test', ['BRYAN', 'ABC']) == {
+            'BRYAN': 1}
+
+    def test_token_count_failures_tolerated(self):
+        indexing.start_token_counts('test')
+        with mock.patch('google.appengine.api.memcache.offset_multi',
+                        side_effect=ValueError('memcache failure')):
+            indexing.add_token_counts('test', {'BRYAN': 1})
+        indexing.finish_token_counts('test')
+        assert indexing.get_token_counts('test', ['BRYAN']) == {}
+
+    def test_plan_query_words(self):
+        # Without any counts, the heuristic order is used.
+        assert indexing.plan_query_words('test', ['ZU', 'ALEXANDER']) == [
+            'ALEXANDER', 'ZU']
+
+        persons = [create_person(given_name='Alexander', family_name='Li'),
+                   create_person(given_name='Alexander', family_name='Ng'),
+                   create_person(given_name='Alexander', family_name='Zu')]
+        self.add_persons(*persons)
+        self.count_tokens(*persons)
+        # The less common word comes first once counts are known.
+        assert indexing.plan_query_words('test', ['ZU', 'ALEXANDER']) == [
+            'ZU', 'ALEXANDER']
+        # Words with unknown counts are likely rare, so they come first.
+        assert indexing.plan_query_words(
+            'test', ['ZU', 'ALEXANDER', 'QQ']) == ['QQ', 'ZU', 'ALEXANDER']
+
+    def test_search_with_learned_max_filters(self):
+        self.add_persons(
+            create_person(given_name='AAAA BBBB', family_name='CCC DDD'),
+            create_person(given_name='AAAA', family_name='EEE'))
+        indexing.set_max_filters('test', 1)
+        # The remaining query words are still applied in memory.
+        assert self.get_matches('CC AAAA') == [('AAAA BBBB', 'CCC DDD')]
+
     def test_search(self):
         persons = [create_person(given_name='Bryan', family_name='abc'),
                    create_person(given_name='Bryan', family_name='abcef'),
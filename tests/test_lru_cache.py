@@ -0,0 +1,51 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for lru_cache.py."""
+
+import unittest
+
+import lru_cache
+
+
+class LruCacheTests(unittest.TestCase):
+
+    def test_get_and_put(self):
+        cache = lru_cache.LruCache(2)
+        assert cache.get('a') is None
+        assert cache.get('a', 'default') == 'default'
+        cache.put('a', 1)
+        assert cache.get('a') == 1
+        cache.put('a', 2)
+        assert cache.get('a') == 2
+        assert len(cache) == 1
+
+    def test_evicts_least_recently_used(self):
+        cache = lru_cache.LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+
+    def test_stats(self):
+        cache = lru_cache.LruCache(1)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('b')
+        cache.put('b', 2)
+        assert cache.stats() == {'size': 1, 'max_size': 1, 'hits': 1,
+                                 'misses': 1, 'evictions': 1}
@@ -245,6 +245,106 @@ class ModelTests(unittest.TestCase):
         assert model.Note.get('haiti', self.n1_2.record_id).record_id == \
             self.n1_2.record_id
 
+    def test_get_by_person_record_ids(self):
+        notes_by_person = model.Note.get_by_person_record_ids(
+            'haiti', [self.p1.record_id, self.p2.record_id,
+                      self.p1.record_id, 'haiti.example.com/person.none'])
+        assert sorted(notes_by_person) == sorted([
+            self.p1.record_id, self.p2.record_id,
+            'haiti.example.com/person.none'])
+        # Each person's notes are the same as with get_by_person_record_id.
+        for person_record_id, notes in notes_by_person.items():
+            assert [note.record_id for note in notes] == [
+                note.record_id for note in model.Note.get_by_person_record_id(
+                    'haiti', person_record_id)]
+        assert [note.record_id for note in
+                notes_by_person[self.p1.record_id]] == [
+            self.n1_1.record_id, self.n1_2.record_id, self.n1_3.record_id]
+        assert notes_by_person['haiti.example.com/person.none'] == []
+
+    def test_usage_counter(self):
+        # An unsharded counter from before sharding is included in the sums.
+        counter = model.UsageCounter.create('japan')
+        counter.person = 2
+        counter.put()
+        for _ in range(30):
+            model.UsageCounter.increment_counter('japan', ['person', 'note'])
+        model.UsageCounter.increment_counters('japan', {'note': 5, 'sex': 0})
+        total = model.UsageCounter.get('japan')
+        assert total.person == 32
+        assert total.note == 35
+        assert not hasattr(total, 'sex')
+        assert len(model.UsageCounter.get_all_shards('japan')) > 2
+        assert model.UsageCounter.get_counts('japan') == {
+            'person': 32, 'note': 35}
+
+        assert model.UsageCounter.migrate('japan')
+        assert not model.UsageCounter.migrate('japan')
+        assert not model.UsageCounter.get_by_key_name('japan')
+        total = model.UsageCounter.get('japan')
+        assert total.person == 32
+        assert total.note == 35
+        assert model.UsageCounter.get('pakistan') is None
+        self.to_delete.extend(model.UsageCounter.get_all_shards('japan'))
+
+    def test_live_counter(self):
+        def get_shards(scan_name):
+            return model.LiveCounter.get_by_key_name(
+                [model.LiveCounter.get_shard_key_name('japan', scan_name, shard)
+                 for shard in ['base'] + range(model.LiveCounter.NUM_SHARDS)])
+
+        # A change made before the first scan is reconciled away by it.
+        model.LiveCounter.increment_counters(
+            'japan', 'person', {'all': 1, 'sex=male': 1})
+        assert model.LiveCounter.get_counts('japan', 'person') is None
+        counter = model.Counter(repo='japan', scan_name='person')
+        counter.increment('all')
+        model.LiveCounter.reconcile('japan', 'person', counter)
+        assert model.LiveCounter.get_counts('japan', 'person') == {'all': 1}
+
+        person = model.Person.create_original(
+            'japan', given_name='Taro', family_name='Yamada', sex='male',
+            entry_date=get_utcnow(), expiry_date=datetime(2010, 2, 1))
+        person.put_new()
+        note = model.Note.create_original(
+            'japan', person_record_id=person.record_id,
+            status=u'believed_alive', entry_date=get_utcnow(),
+            source_date=get_utcnow())
+        note.put_new(person=person, notes=[])
+        person.update_from_note(note)
+        db.put(person)
+        person_counts = model.LiveCounter.get_counts('japan', 'person')
+        assert person_counts['all'] == 2
+        assert person_counts['sex=male'] == 1
+        assert person_counts['num_notes=1'] == 1
+        assert person_counts['status=believed_alive'] == 1
+        assert 'num_notes=0' not in person_counts
+        assert model.LiveCounter.get_counts('japan', 'note') is None
+
+        # Without the existing Notes, only the counts by the Person's fields
+        # change; the next scan corrects the number of Notes.
+        note2 = model.Note.create_original(
+            'japan', person_record_id=person.record_id,
+            status=u'is_note_author', entry_date=get_utcnow(),
+            source_date=get_utcnow())
+        note2.put_new(person=person)
+        person.update_from_note(note2)
+        db.put(person)
+        person_counts = model.LiveCounter.get_counts('japan', 'person')
+        assert person_counts['status=is_note_author'] == 1
+        assert 'status=believed_alive' not in person_counts
+        assert person_counts['num_notes=1'] == 1
+
+        # Expired records leave the counts.
+        set_utcnow_for_test(datetime(2010, 3, 1))
+        person.put_expiry_flags()
+        # (Except for the drift in the number of Notes, until the next scan.)
+        assert model.LiveCounter.get_counts('japan', 'person') == {
+            'all': 1, 'num_notes=1': 1, 'num_notes=2': -1}
+        self.to_delete.extend([person, note, note2])
+        self.to_delete.extend(filter(None, get_shards('person')))
+        self.to_delete.extend(filter(None, get_shards('note')))
+
     def test_get_unreviewed_notes_count(self):
         assert model.Note.get_unreviewed_notes_count('haiti') == \
             self.COUNT_OF_UNREVIEWED_NOTES
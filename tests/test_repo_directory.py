@@ -0,0 +1,75 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for repo_directory.py."""
+
+import unittest
+
+from google.appengine.ext import testbed
+import mock
+
+import config
+import model
+import repo_directory
+
+
+class RepoDirectoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        config.cache.flush()
+        model.Repo(key_name='haiti',
+                   activation_status=model.Repo.ActivationStatus.ACTIVE).put()
+        model.Repo(key_name='japan',
+                   activation_status=model.Repo.ActivationStatus.STAGING,
+                   test_mode=True).put()
+        config.set_for_repo('*', repo_titles={'en': 'Person Finder'})
+        config.set_for_repo('haiti', repo_titles={'en': 'Haiti', 'fr': 'Haiti'},
+                            updated_date=1552682469)
+        model.Counter(scan_name='person', repo='haiti', count_all=1260).put()
+
+    def tearDown(self):
+        config.cache.flush()
+        self.testbed.deactivate()
+
+    def test_snapshot(self):
+        directory = repo_directory.get()
+        assert [info.repo_id for info in directory.repo_infos] == [
+            'haiti', 'japan']
+        assert [info.repo_id for info in directory.list_launched()] == [
+            'haiti']
+        haiti = directory.get('haiti')
+        assert haiti.get_title('fr') == 'Haiti'
+        assert haiti.updated_date == 1552682469
+        assert haiti.person_count == 1300
+        japan = directory.get('japan')
+        assert japan.test_mode
+        # The global title is used when the repository has none.
+        assert japan.get_title('ja') == 'Person Finder'
+        # The feeds don't advertise the global settings.
+        assert japan.feed_titles == {}
+        assert japan.feed_language_menu_options == []
+        assert haiti.feed_titles == {'en': 'Haiti', 'fr': 'Haiti'}
+        assert japan.updated_date is None
+        assert directory.get('pakistan') is None
+
+    def test_reused_until_invalidated(self):
+        directory = repo_directory.get()
+        with mock.patch('model.Repo.all', side_effect=AssertionError):
+            assert repo_directory.get() is directory
+        config.set_for_repo('haiti', repo_titles={'en': 'Haiti 2'})
+        assert repo_directory.get().get('haiti').get_title('en') == 'Haiti 2'
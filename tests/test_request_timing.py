@@ -0,0 +1,93 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for request_timing.py."""
+
+import unittest
+
+from google.appengine.ext import testbed
+import mock
+
+import config
+import model
+import request_timing
+
+
+class RequestTimingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        config.cache.flush()
+        request_timing._enabled_check_time = 0
+        request_timing._registered_endpoints.clear()
+
+    def tearDown(self):
+        request_timing.end_request('test')
+        request_timing._enabled_check_time = 0
+        config.cache.flush()
+        self.testbed.deactivate()
+
+    def enable(self):
+        config.set(enable_request_timing=True)
+        request_timing._enabled_check_time = 0
+
+    def test_disabled(self):
+        request_timing.begin_request()
+        assert request_timing.timer('render') is request_timing._NULL_TIMER
+        model.Repo.get('haiti')
+        assert request_timing.end_request('view') is None
+        assert request_timing.get_endpoints() == []
+
+    def test_enabled(self):
+        self.enable()
+        request_timing.begin_request()
+        with request_timing.timer('render'):
+            model.Repo.get('haiti')
+            model.Repo.get('japan')
+        server_timing = request_timing.end_request('view')
+        assert server_timing.startswith('total;dur=')
+        assert 'datastore;dur=' in server_timing
+        assert 'desc="2 calls"' in server_timing
+        assert 'render;dur=' in server_timing
+        assert 'search' not in server_timing
+        assert request_timing.get_endpoints() == ['view']
+        histograms = request_timing.get_histograms('view')
+        assert sum(histograms['total']) == 1
+        assert sum(histograms['datastore']) == 1
+        assert sum(histograms['search']) == 0
+
+    def test_unknown_paths_share_an_endpoint(self):
+        self.enable()
+        middleware = request_timing.RequestTimingMiddleware(
+            lambda request: {})
+        for path in ['/haiti/no_such_page_1', '/haiti/no_such_page_2']:
+            request = mock.Mock(path=path, resolver_match=None)
+            middleware(request)
+        assert request_timing.get_endpoints() == [
+            request_timing.OTHER_ENDPOINT]
+
+    def test_percentiles(self):
+        histogram = [0] * (len(request_timing.BUCKET_BOUNDS_MS) + 1)
+        assert request_timing.get_bucket(0.004) == 0
+        assert request_timing.get_bucket(0.15) == 5
+        histogram[0] = 90
+        histogram[5] = 9
+        histogram[-1] = 1
+        assert request_timing.get_percentile(histogram, 50) == 5
+        assert request_timing.get_percentile(histogram, 95) == 200
+        assert request_timing.get_percentile(histogram, 99) == 200
+        assert request_timing.get_percentile(histogram, 100) is None
@@ -58,6 +58,32 @@ class RamCacheTests(unittest.TestCase):
         cache.clear()
         assert cache.get('a') is None
 
+    def test_least_recently_used_evicted(self):
+        entry_size = resources.get_size('x')
+        cache = resources.RamCache(max_bytes=2 * entry_size)
+        cache.put('a', 'x', 10)
+        cache.put('b', 'x', 10)
+        assert cache.get('a') == 'x'
+        cache.put('c', 'x', 10)
+        assert cache.get('b') is None
+        assert cache.get('a') == 'x'
+        assert cache.get('c') == 'x'
+        stats = cache.stats()
+        assert stats['entries'] == 2
+        assert stats['bytes'] == 2 * entry_size
+        assert stats['evictions'] == 1
+        assert stats['hits'] == 3
+        assert stats['misses'] == 1
+
+    def test_expired_data_swept(self):
+        cache = resources.RamCache()
+        cache.put('a', 'b', 10)
+        cache.put('c', 'd', 100)
+        utils.set_utcnow_for_test(resources.SWEEP_INTERVAL_SECONDS)
+        cache.put('e', 'f', 10)
+        assert cache.stats()['entries'] == 2
+        assert cache.stats()['expirations'] == 1
+
 
 class ResourcesTests(unittest.TestCase):
     def setUp(self):
@@ -132,6 +158,32 @@ class ResourcesTests(unittest.TestCase):
         db.delete(key)
         self.temp_entity_keys.remove(key)
 
+    def test_warm_up(self):
+        count = resources.warm_up(['fr'])
+        # The bundle's templates, except for the one in Spanish, and the
+        # template files.
+        assert count == 3 + len([name for name in Resource.list_files()
+                                 if name.endswith('.template')])
+        assert 'page.html.template:fr' in self.compiled
+        assert 'test-base.html.template:es' not in self.compiled
+
+        # Rendering doesn't compile the templates again.
+        self.compiled = []
+        assert resources.get_rendered('page.html', 'fr') == u'fran\xe7ais'
+        assert resources.get_rendered('page.html', 'en') == u'default'
+        assert self.compiled == []
+
+    def test_file_template_compiled_once(self):
+        # Each reload of a file creates a new Resource, but its compiled
+        # template is reused.
+        resource = resources.get_localized('message.html.template', 'en')
+        resource.get_template()
+        utils.set_utcnow_for_test(resource.cache_seconds + 1)
+        reloaded = resources.get_localized('message.html.template', 'en')
+        assert reloaded is not resource
+        reloaded.get_template()
+        assert self.compiled == ['message.html.template']
+
     def test_get(self):
         # Verify that Resource.get fetches a Resource from the datastore.
         assert Resource.get('xyz', '1') is None
@@ -237,28 +289,31 @@ class ResourcesTests(unittest.TestCase):
         # Expire the pages but not the base templates.
         utils.set_utcnow_for_test(31)
 
-        # Should fetch and recompile the pages but not the base templates.
+        # Should fetch the pages again, but the resources haven't changed,
+        # so their compiled templates are reused.
         self.fetched, self.compiled, self.rendered = [], [], []
         assert get_rendered('page.html', 'es') == u'default'
         assert self.fetched == ['page.html:es', 'page.html',
                                 'page.html.template:es', 'page.html.template']
-        assert self.compiled == ['page.html.template']
+        assert self.compiled == []
         assert self.rendered == ['page.html.template']
 
-        # Should fetch and recompile the pages but not the base templates.
+        # Should fetch the pages again, but the resources haven't changed,
+        # so their compiled templates are reused.
         self.fetched, self.compiled, self.rendered = [], [], []
         assert get_rendered('page.html', 'fr') == u'fran\xe7ais'
         assert self.fetched == ['page.html:fr', 'page.html',
                                 'page.html.template:fr']
-        assert self.compiled == ['page.html.template:fr']
+        assert self.compiled == []
         assert self.rendered == ['page.html.template:fr']
 
-        # Should fetch and recompile the pages but not the base templates.
+        # Should fetch the pages again, but the resources haven't changed,
+        # so their compiled templates are reused.
         self.fetched, self.compiled, self.rendered = [], [], []
         assert get_rendered('page.html', 'en') == u'default'
         assert self.fetched == ['page.html:en', 'page.html',
                                 'page.html.template:en', 'page.html.template']
-        assert self.compiled == ['page.html.template']
+        assert self.compiled == []
         assert self.rendered == ['page.html.template']
 
         # Expire the base templates and page.html.template:fr
@@ -272,12 +327,12 @@ class ResourcesTests(unittest.TestCase):
         assert self.compiled == []
         assert self.rendered == ['page.html.template']
 
-        # Should fetch and recompile both the fr page and the base template.
+        # Should fetch the fr page again, and reuse its compiled template.
         self.fetched, self.compiled, self.rendered = [], [], []
         assert get_rendered('page.html', 'fr') == u'fran\xe7ais'
         assert self.fetched == ['page.html:fr', 'page.html',
                                 'page.html.template:fr']
-        assert self.compiled == ['page.html.template:fr']
+        assert self.compiled == []
         assert self.rendered == ['page.html.template:fr']
 
         # Should not recompile the page.
@@ -57,3 +57,25 @@ class ScriptVariantTests(unittest.TestCase):
         assert u'TENKAI' in results
         # Chinese romanization.
         assert u'Tian Hai' in results
+
+    def test_romanize(self):
+        script_variant.ROMANIZATION_CACHE.clear()
+        stats = script_variant.get_romanization_stats()
+        results = script_variant.romanize(
+            script_variant.romanize_japanese_word, u'天海春香')
+        assert sorted(results) == sorted(
+            script_variant.romanize_japanese_word(u'天海春香'))
+        # The for_index argument is part of the cache key.
+        results = script_variant.romanize(
+            script_variant.romanize_japanese_word, u'天海春香',
+            for_index=False)
+        assert u'AMAMI' not in results
+        # Modifying the result doesn't affect the cached value.
+        results.append(u'XXX')
+        results = script_variant.romanize(
+            script_variant.romanize_japanese_word, u'天海春香',
+            for_index=False)
+        assert u'XXX' not in results
+        new_stats = script_variant.get_romanization_stats()
+        assert new_stats['hits'] > stats['hits']
+        assert new_stats['misses'] > stats['misses']
@@ -14,10 +14,15 @@
 
 """Tests for the Searcher."""
 
+import datetime
+import time
 import unittest
 
+from google.appengine.api import memcache
 import mock
 
+import model
+from search import result_cache
 from search.searcher import Searcher
 
 
@@ -32,6 +37,10 @@ class SearcherTests(unittest.TestCase):
     FULLTEXT_RETURN_VALUE = ['full-text return value']
     INDEXING_RETURN_VALUE = ['indexing return value']
 
+    def setUp(self):
+        memcache.flush_all()
+        result_cache._local_cache.clear()
+
     def test_full_text_search_results(self):
         """Use full_text_search.search results when enabled."""
         with mock.patch('full_text_search.search') as full_text_search_mock:
@@ -104,3 +113,71 @@ class SearcherTests(unittest.TestCase):
             assert call_args[0] == SearcherTests.REPO_NAME
             assert call_args[1].query == 'matt schenectady'
             assert call_args[2] == SearcherTests.MAX_RESULTS
+
+    def test_cached_results(self):
+        """Serve repeated queries from the cache until the repo is written."""
+        person = model.Person.create_original_with_record_id(
+            SearcherTests.REPO_NAME, 'haiti/0505', full_name='Matt Smith',
+            entry_date=datetime.datetime(2010, 1, 1))
+        person.put()
+        try:
+            with mock.patch('indexing.search') as indexing_mock:
+                indexing_mock.return_value = [person]
+                searcher = Searcher(
+                    SearcherTests.REPO_NAME,
+                    enable_fulltext_search=False,
+                    max_results=SearcherTests.MAX_RESULTS,
+                    use_cache=True)
+                searcher.search('matt')
+                results = searcher.search('Matt')
+                assert len(indexing_mock.call_args_list) == 1
+                assert [p.record_id for p in results] == ['haiti/0505']
+
+                result_cache.invalidate(SearcherTests.REPO_NAME)
+                searcher.search('matt')
+                assert len(indexing_mock.call_args_list) == 2
+            assert result_cache.get_stats(SearcherTests.REPO_NAME) == {
+                'hits': 1, 'misses': 2}
+        finally:
+            person.delete()
+
+    def test_results_not_cached_after_write(self):
+        """Don't cache results if the repo was written during the search."""
+        def search_during_write(*args):
+            result_cache.invalidate(SearcherTests.REPO_NAME)
+            return []
+        with mock.patch('indexing.search') as indexing_mock:
+            indexing_mock.side_effect = search_during_write
+            searcher = Searcher(
+                SearcherTests.REPO_NAME,
+                enable_fulltext_search=False,
+                max_results=SearcherTests.MAX_RESULTS,
+                use_cache=True)
+            searcher.search('matt')
+            indexing_mock.side_effect = None
+            indexing_mock.return_value = []
+            searcher.search('matt')
+            assert len(indexing_mock.call_args_list) == 2
+
+    def test_results_not_cached_soon_after_write(self):
+        """Don't cache results of searches that may not see a recent write."""
+        now = time.time()
+        with mock.patch('indexing.search') as indexing_mock, \
+                mock.patch('time.time') as time_mock:
+            indexing_mock.return_value = []
+            searcher = Searcher(
+                SearcherTests.REPO_NAME,
+                enable_fulltext_search=False,
+                max_results=SearcherTests.MAX_RESULTS,
+                use_cache=True)
+            time_mock.return_value = now
+            result_cache.invalidate(SearcherTests.REPO_NAME)
+            time_mock.return_value = now + result_cache.SETTLE_SECONDS - 1
+            searcher.search('matt')
+            searcher.search('matt')
+            assert len(indexing_mock.call_args_list) == 2
+
+            time_mock.return_value = now + result_cache.SETTLE_SECONDS
+            searcher.search('matt')
+            searcher.search('matt')
+            assert len(indexing_mock.call_args_list) == 3
@@ -19,6 +19,7 @@ __author__ = 'pfritzsche@google.com (Phil Fritzsche)'
 import calendar
 import datetime
 import logging
+import mock
 import mox
 import os
 import sys
@@ -30,6 +31,7 @@ from google.appengine import runtime
 from google.appengine.api import users
 from google.appengine.ext import db
 from google.appengine.api import quota
+from google.appengine.api import search
 from google.appengine.api import taskqueue
 from google.appengine.ext import testbed
 from google.appengine.ext import webapp
@@ -37,7 +39,10 @@ from google.appengine.ext import webapp
 import config
 import const
 import delete
+import full_text_search
+import indexing
 import model
+import scan_ranges
 import tasks
 import test_handler
 from utils import get_utcnow, set_utcnow_for_test
@@ -252,6 +257,174 @@ class TasksTests(unittest.TestCase):
         self.mox.UnsetStubs()
         self.mox.VerifyAll()
 
+    def test_count_person(self):
+        """Tests the note and link counts of the person scan."""
+        # A link to a person that doesn't exist isn't counted.
+        n1_2 = model.Note.create_original(
+            'haiti',
+            person_record_id=self.p1.record_id,
+            linked_person_record_id='haiti.example.com/person.none',
+            entry_date=get_utcnow(),
+            source_date=datetime.datetime(2010, 1, 3))
+        db.put(n1_2)
+        self.to_delete.append(n1_2)
+        self.run_split_scan(tasks.CountPerson)
+        assert model.Counter.get_count('haiti', 'person.all') == 2
+        assert model.Counter.get_count('haiti', 'person.num_notes=2') == 1
+        assert model.Counter.get_count('haiti', 'person.num_notes=0') == 1
+        assert model.Counter.get_count('haiti', 'person.linked_persons=1') == 1
+        assert model.Counter.get_count('haiti', 'person.linked_persons=0') == 1
+        # The live counts now match the scan.
+        counter = model.Counter.all_finished_counters('haiti', 'person').get()
+        assert model.LiveCounter.get_counts('haiti', 'person') == (
+            model.LiveCounter.sum_counts([counter]))
+
+    def test_count_person_token_counts(self):
+        """Tests that the person scan rebuilds the token counts."""
+        for person in [self.p1, self.p2]:
+            person.update_index(['new'], index_full_text=False)
+        db.put([self.p1, self.p2])
+        assert not indexing.get_token_counts('haiti', ['JOHN'])
+        self.run_split_scan(tasks.CountPerson)
+        assert indexing.get_token_counts('haiti', ['JOHN', 'J', 'XYZ']) == {
+            'JOHN': 1, 'J': 1}
+
+    def run_split_scan(self, handler_class):
+        """Runs a scan that is split into key ranges, running the task for
+        each range in turn, and checks that the ranges are cleaned up."""
+        test_handler.initialize_handler(
+            handler_class, handler_class.ACTION).get()
+        ranges = model.CounterRange.all().fetch(100)
+        assert len(ranges) > 1
+        for counter_range in ranges:
+            test_handler.initialize_handler(
+                handler_class, handler_class.ACTION,
+                params={'scan_id': counter_range.scan_id,
+                        'range': counter_range.index}).get()
+        assert not model.CounterRange.all().get()
+
+    def test_split_scan(self):
+        """Tests that the counts of a split scan match those of a scan that
+        isn't split."""
+        with mock.patch.object(tasks.CountNote, 'NUM_RANGES', 1):
+            test_handler.initialize_handler(
+                tasks.CountNote, tasks.CountNote.ACTION).get()
+        assert not model.CounterRange.all().get()
+        self.run_split_scan(tasks.CountNote)
+        counters = model.Counter.all_finished_counters('haiti', 'note').fetch(2)
+        assert len(counters) == 2
+        assert model.LiveCounter.sum_counts(counters[:1]) == (
+            model.LiveCounter.sum_counts(counters[1:]))
+
+        # A range that has already been counted isn't counted again.
+        counter_range = scan_ranges.create_ranges('haiti', 'note', [])[0]
+        assert scan_ranges.finish_range(counter_range)
+        assert not scan_ranges.finish_range(counter_range)
+
+    def test_split_scan_enqueue_failure(self):
+        """Tests that a split scan whose tasks can't all be added is dropped,
+        so that the next scan can start."""
+        add = taskqueue.add
+        calls = []
+        def add_some(*args, **kwargs):
+            calls.append(kwargs)
+            if len(calls) > 1:
+                raise taskqueue.TransientError()
+            return add(*args, **kwargs)
+        with mock.patch('google.appengine.api.taskqueue.add', add_some):
+            self.assertRaises(
+                taskqueue.TransientError,
+                test_handler.initialize_handler(
+                    tasks.CountNote, tasks.CountNote.ACTION).get)
+        assert not model.CounterRange.all().get()
+        assert not scan_ranges.get_running_scan_id('haiti', 'note')
+
+    def test_migrate_full_text_documents_keeps_format_on_failure(self):
+        """Tests that the query format isn't switched while some documents
+        failed to migrate."""
+        handler = test_handler.initialize_handler(
+            tasks.MigrateFullTextDocuments,
+            tasks.MigrateFullTextDocuments.ACTION)
+        counter = model.Counter(
+            repo='haiti', scan_name=tasks.MigrateFullTextDocuments.SCAN_NAME)
+        counter.increment('failed')
+        handler.finish_scan(counter)
+        assert not config.get_for_repo('haiti', 'full_text_query_format')
+        handler.finish_scan(model.Counter(
+            repo='haiti', scan_name=tasks.MigrateFullTextDocuments.SCAN_NAME))
+        assert config.get_for_repo('haiti', 'full_text_query_format') == (
+            full_text_search.DOCUMENT_FORMAT_COMPACT)
+
+    def test_start_scan(self):
+        """Tests that start_scan is called only when a new scan starts, not
+        when a task continues a scan."""
+        def run_count_note():
+            test_handler.initialize_handler(
+                tasks.CountNote, tasks.CountNote.ACTION).get()
+        with mock.patch.object(tasks.CountNote, 'NUM_RANGES', 1), \
+                mock.patch.object(tasks.CountNote, 'start_scan') as start_scan:
+            model.Counter(repo='haiti', scan_name='note',
+                          last_key=str(self.n1_1.key())).put()
+            run_count_note()
+            assert not start_scan.called
+            run_count_note()
+            assert start_scan.call_count == 1
+
+    def test_migrate_full_text_index_cleans_shared_index(self):
+        """Tests that the repository's documents are deleted from the shared
+        index after searches switch to the repository's own index."""
+        self.testbed.init_search_stub()
+        shared_index_name = full_text_search.PERSON_LOCATION_FULL_TEXT_INDEX_NAME
+        full_text_search.add_records_to_index([self.p1, self.p2])
+        handler = test_handler.initialize_handler(
+            tasks.MigrateFullTextIndex, tasks.MigrateFullTextIndex.ACTION)
+        handler.finish_scan(model.Counter(
+            repo='haiti', scan_name=tasks.MigrateFullTextIndex.SCAN_NAME))
+        assert full_text_search.get_delete_index_names('haiti') == [
+            full_text_search.get_per_repo_index_name('haiti'),
+            shared_index_name]
+        queued = self.testbed.get_stub(
+            testbed.TASKQUEUE_SERVICE_NAME).get_filtered_tasks()
+        assert len(queued) == 1
+        assert queued[0].url.startswith(
+            '/haiti/' + tasks.CleanSharedFullTextIndex.ACTION)
+
+        test_handler.initialize_handler(
+            tasks.CleanSharedFullTextIndex,
+            tasks.CleanSharedFullTextIndex.ACTION).get()
+        assert not search.Index(name=shared_index_name).get_range(
+            ids_only=True).results
+        assert full_text_search.get_delete_index_names('haiti') == [
+            full_text_search.get_per_repo_index_name('haiti')]
+
+    def test_update_dirty_status(self):
+        """Tests that only the marked persons have their status updated."""
+        def run_update_dirty_status_task():
+            test_handler.initialize_handler(
+                tasks.UpdateDirtyStatus, tasks.UpdateDirtyStatus.ACTION,
+                repo='global').get()
+
+        model.DirtyPerson.mark('haiti', [self.p1.record_id])
+        # Marks aren't processed until they're a few seconds old.
+        run_update_dirty_status_task()
+        assert model.Person.get('haiti', self.p1.record_id).latest_status is None
+        set_utcnow_for_test(datetime.datetime(2010, 1, 1, 0, 1))
+        run_update_dirty_status_task()
+        assert model.Person.get('haiti', self.p1.record_id).latest_status == (
+            'believed_missing')
+        assert not model.DirtyPerson.all().get()
+
+        # Hiding the note without marking the person changes nothing.
+        self.n1_1.hidden = True
+        db.put(self.n1_1)
+        run_update_dirty_status_task()
+        assert model.Person.get('haiti', self.p1.record_id).latest_status == (
+            'believed_missing')
+        model.DirtyPerson.mark('haiti', [self.p1.record_id])
+        set_utcnow_for_test(datetime.datetime(2010, 1, 1, 0, 2))
+        run_update_dirty_status_task()
+        assert model.Person.get('haiti', self.p1.record_id).latest_status is None
+
     def ignore_call_to_send_delete_notice(self):
         """Replaces delete.send_delete_notice() with empty implementation."""
         self.mox.StubOutWithMock(delete, 'send_delete_notice')
@@ -226,6 +226,7 @@ class HandlerTests(unittest.TestCase):
 
     def tearDown(self):
         db.delete(config.ConfigEntry.all())
+        config.cache.flush()
         resources.get_rendered = self.original_get_rendered
         self.testbed.deactivate()
 
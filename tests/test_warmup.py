@@ -0,0 +1,57 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for warmup.py."""
+
+import unittest
+
+from google.appengine.ext import testbed
+import mock
+
+import config
+import model
+import warmup
+
+
+class WarmupTests(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        config.cache.flush()
+        model.Repo(key_name='haiti').put()
+        config.set_for_repo('haiti', language_menu_options=['en', 'fr'])
+
+    def tearDown(self):
+        config.cache.flush()
+        self.testbed.deactivate()
+
+    def test_warm_up(self):
+        with mock.patch('resources.warm_up') as resources_warm_up:
+            timings = warmup.warm_up(['start'])
+        assert [name for name, seconds in timings] == [
+            'django', 'handler_modules', 'dictionaries', 'repo_directory',
+            'config', 'templates']
+        langs, bundle_name = resources_warm_up.call_args[0]
+        assert langs == set(['en', 'fr'])
+        assert bundle_name == '1'
+
+    def test_failed_step_does_not_stop_warm_up(self):
+        with mock.patch('warmup.load_dictionaries', side_effect=IOError), \
+                mock.patch('warmup.compile_templates') as compile_templates:
+            timings = warmup.warm_up([])
+        assert len(timings) == 6
+        assert compile_templates.called
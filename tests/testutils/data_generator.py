@@ -25,6 +25,7 @@ import config
 import const
 import model
 import modelmodule.admin_acls as admin_acls_model
+import repo_directory
 
 
 class TestDataGenerator(object):
@@ -88,6 +89,7 @@ class TestDataGenerator(object):
         repo = model.Repo(key_name=repo_id, activation_status=activation_status)
         if store:
             repo.put()
+            repo_directory.invalidate()
         return repo
 
     def setup_repo_config(
@@ -36,12 +36,15 @@ PY3_TEST_FILES = [
 if six.PY2:
     from google.appengine.api import apiproxy_stub_map
     from google.appengine.api import datastore_file_stub
+    from google.appengine.api.memcache import memcache_stub
 
     # Create a new apiproxy and temp datastore to use for this test suite
     apiproxy_stub_map.apiproxy = apiproxy_stub_map.APIProxyStubMap()
     temp_db = datastore_file_stub.DatastoreFileStub(
         'x', None, None, trusted=True)
     apiproxy_stub_map.apiproxy.RegisterStub('datastore', temp_db)
+    apiproxy_stub_map.apiproxy.RegisterStub(
+        'memcache', memcache_stub.MemcacheServiceStub())
 
 # An application id is required to access the datastore, so let's create one
 os.environ['APPLICATION_ID'] = 'personfinder-unittest'
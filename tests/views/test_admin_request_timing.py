@@ -0,0 +1,45 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import request_timing
+
+import view_tests_base
+
+
+class AdminRequestTimingViewTests(view_tests_base.ViewTestsBase):
+
+    def setUp(self):
+        super(AdminRequestTimingViewTests, self).setUp()
+        self.data_generator.repo()
+        self.login_as_manager()
+
+    def get_page_doc(self):
+        return self.to_doc(self.client.get('/global/admin/request_timing/',
+                                           secure=True))
+
+    def test_percentiles(self):
+        timing = request_timing.RequestTiming()
+        timing.seconds = {'total': 0.15, 'datastore': 0.03}
+        for _ in range(10):
+            request_timing.record('view', timing)
+        doc = self.get_page_doc()
+        assert doc.cssselect_one('#view-total').text == 'view'
+        assert doc.cssselect_one('#view-total-count').text == '10'
+        assert doc.cssselect_one('#view-total-p50').text == '200'
+        assert doc.cssselect_one('#view-datastore-p99').text == '50'
+        assert not doc.cssselect('#view-render')
+
+    def test_status(self):
+        doc = self.get_page_doc()
+        assert 'is off' in doc.cssselect_one('#request-timing-status').text
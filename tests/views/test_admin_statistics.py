@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from google.appengine.api import memcache
+
+import config
 import model
+from search import result_cache
 
 import view_tests_base
 
@@ -70,3 +74,25 @@ class AdminStatisticsViewTests(view_tests_base.ViewTestsBase):
         set_counter_and_check('believed_dead', 2)
         set_counter_and_check('believed_missing', 4)
         set_counter_and_check('information_sought', 6)
+
+    def test_search_cache_stats(self):
+        memcache.set_multi({'hits': 7, 'misses': 2}, key_prefix='haiti:',
+                           namespace=result_cache.STATS_NAMESPACE)
+        doc = self.get_page_doc()
+        assert doc.cssselect_one('#haiti-search-cache-hits').text == '7'
+        assert doc.cssselect_one('#haiti-search-cache-misses').text == '2'
+
+    def test_config_cache_stats(self):
+        config.cache.flush()
+        config.Configuration('haiti')
+        config.Configuration('haiti')
+        doc = self.get_page_doc()
+        # The page's own request uses the cache too, so the counts are at
+        # least those of the lookups above.
+        assert int(doc.cssselect_one('#config-cache-hits').text) >= 2
+        assert int(doc.cssselect_one('#config-cache-misses').text) >= 2
+
+    def test_resource_cache_stats(self):
+        doc = self.get_page_doc()
+        for name in ['localized', 'rendered', 'template']:
+            assert doc.cssselect_one('#%s-resource-cache' % name).text == name
@@ -172,6 +172,12 @@ class AutoSecurityTests(view_tests_base.ViewTestsBase):
                 'custommsg__start_page_custom_htmls__en': 'custom message',
             },
             xsrf_action_id='admin/repo-index'),
+        'admin_request-timing':
+        path_test_info(
+            accepts_get=True,
+            accepts_post=False,
+            min_admin_level=aa_model.AdminPermission.AccessLevel.MANAGER,
+            requires_xsrf=False),
         'admin_review':
         path_test_info(
             accepts_get=True,
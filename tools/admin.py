@@ -19,6 +19,8 @@ from utils import *
 import logging
 import pickle
 
+import repo_directory
+
 
 class Mapper(object):
     # Subclasses should replace this with a model class (eg, model.Person).
@@ -129,6 +131,9 @@ def delete_repo(repo):
     entities += list(config.ConfigEntry.all().filter('__key__ >', min_key
                                             ).filter('__key__ <', max_key))
     db.delete(entities)
+    # Make every instance drop the deleted settings and repository.
+    config.cache.invalidate(repo)
+    repo_directory.invalidate()
 
 def get_all_resources():
     """Gets all the Resource entities and returns a dictionary of the contents.
@@ -0,0 +1,41 @@
+# Copyright 2019 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compiles the text dictionary files in app/ for compiled_dictionary.py.
+
+Usage (from the app directory):
+  $ tools/compile_dictionaries [file_name ...]
+
+With no arguments, compiles the dictionaries that script_variant uses.
+"""
+
+import os
+import sys
+
+import compiled_dictionary
+
+DICTIONARY_FILE_NAMES = ['japanese_name_location_dict.txt',
+                         'chinese_family_name_dict.txt']
+
+
+def main(file_names):
+    for file_name in file_names or DICTIONARY_FILE_NAMES:
+        compiled_dictionary.compile_file(file_name)
+        print '%s: %d bytes' % (
+            file_name + compiled_dictionary.COMPILED_SUFFIX,
+            os.path.getsize(file_name + compiled_dictionary.COMPILED_SUFFIX))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -38,6 +38,8 @@ import zipfile
 
 # personfinder modules
 from model import *
+import config
+import full_text_search
 import importer
 
 
@@ -105,7 +107,7 @@ def create_note(note_dict):
 
 def maybe_update_index(entity):
     if hasattr(entity, 'update_index'):
-          entity.update_index(['old', 'new'])
+          entity.update_index(['old', 'new'], index_full_text=False)
 
 
 def add_entities(entity_dicts, create_function, batch_size, kind, store_all):
@@ -127,6 +129,9 @@ def add_entities(entity_dicts, create_function, batch_size, kind, store_all):
         for e in entities:
             maybe_update_index(e)
         db.put(entities)
+        if config.get('enable_fulltext_search'):
+            full_text_search.add_records_to_index(
+                [e for e in entities if isinstance(e, Person)])
         if i % 10 == 0 or i == batch_count - 1:
             logging.info('%s update: just added batch %d/%d', kind, i + 1,
                          batch_count)